@@ -39,12 +39,20 @@ OPTIONAL INPUT:
   -cl_train   Since only RF works for multi-class problems, use cl_train to give a list of what classes you want to include (Default = 'all')   
               If binary, first label = positive class.
   -sep      Set seperator for input data (Default = '\t')
+  -n_jobs   Number of processors for Relief and for parsing df (Default = 1)
   -df2      File with class information. Use only if df contains the features but not the classes 
               * Need to specifiy what column in df2 is y using -y_name 
   -y_name   Name of the column to predict (Default = Class)
   -drop_na  T/F to drop rows with NAs
+  -sparse   T/F keep the features sparse (scipy CSR) for mostly-zero data (k-mers, one-hot).
+              RF, chi2, L1 and EN use it directly, other algorithms convert to dense (with a
+              warning about the memory cost). Default = F
+  -dtype    float64, float32 (features kept as float32), or uint8 (float32, with 0/1 features
+              stored as uint8) to cut memory. Default = float64
   -feat     File containing the features you want to use from the df (one feature per line)
               Default: all (i.e. everything in the dataframe given).
+  -feat_index  T/F with -feat, build (on first use) and use a column-offset index of df
+              (df.colidx.npz), so only the listed columns are read from each line. Default = F
   -type     r = regression, c = classification (required for LASSO and RF)
   -p        Parameter value for LASSO, EN, or Fisher's Exact Test.
             Fishers: pvalue cut off (Default = 0.05)
@@ -72,6 +80,7 @@ import pandas as pd
 import numpy as np
 import subprocess as sp
 import sys, os, time
+import ML_functions as ML
 
 start_time = time.time()
 
@@ -99,7 +108,7 @@ def DecisionTree(df, n, TYPE, save_name, SCORES):
   from sklearn.ensemble import RandomForestRegressor
   from math import sqrt
 
-  X_all = df.drop('Class', axis=1).values  
+  X_all = ML.fun.Feature_Matrix(df)
   Y_all = df.loc[:, 'Class'].values
 
   fean_num_feat_sel = len(list(df.columns.values)[1:])
@@ -152,7 +161,7 @@ def Chi2(df, n, save_name):
   from sklearn.feature_selection import mutual_info_classif 
 
   print('This function might not be working right now.... Bug Christina if you need it!')
-  X_all = df.drop('Class', axis=1).values  
+  X_all = ML.fun.Feature_Matrix(df)
   Y_all = df.loc[:, 'Class'].values
   #Y_all = Y_all.astype('int')
   print(Y_all)
@@ -218,7 +227,7 @@ def L1(df, PARAMETER, TYPE, save_name):
   from sklearn.svm import LinearSVC
   from sklearn.linear_model import Lasso
 
-  X_all = df.drop('Class', axis=1).values  
+  X_all = ML.fun.Feature_Matrix(df)
   Y_all = df.loc[:, 'Class'].values
   Y_all = Y_all.astype('int')
 
@@ -247,7 +256,7 @@ def EN(df, PARAMETER, n, save_name, SCORES):
 
   from sklearn.linear_model import ElasticNet
 
-  X_all = df.drop('Class', axis=1).values  
+  X_all = ML.fun.Feature_Matrix(df)
   Y_all = df.loc[:, 'Class'].values
   feature_names = list(df)
   feature_names.remove('Class')
@@ -459,6 +468,7 @@ if __name__ == "__main__":
   
   #Default parameters
   FEAT = 'all'    #Features to include from dataframe. Default = all (i.e. don't remove any from the given dataframe)
+  FEAT_INDEX = 'f'
   neg = 0    #Default value for negative class = 0
   pos = 1    #Default value for positive class = 1
   save_list = 'false'
@@ -474,6 +484,8 @@ if __name__ == "__main__":
   test = ''
   cl_train = ''
   drop_na = 'f'
+  DTYPE = 'float64'
+  SPARSE = 'f'
   NA = 'na'
   SCORES = 'f'
   N = 10
@@ -498,6 +510,8 @@ if __name__ == "__main__":
       n_jobs = int(sys.argv[i+1])
     if sys.argv[i].lower() == '-feat':
       FEAT = sys.argv[i+1]
+    if sys.argv[i].lower() == '-feat_index':
+      FEAT_INDEX = sys.argv[i+1]
     if sys.argv[i].lower() == '-cl_train':
       cl_train = sys.argv[i+1]
     if sys.argv[i].lower() == '-p':
@@ -518,6 +532,10 @@ if __name__ == "__main__":
       test = sys.argv[i+1]
     if sys.argv[i].lower() == '-drop_na':
       drop_na = sys.argv[i+1]
+    if sys.argv[i].lower() == '-dtype':
+      DTYPE = sys.argv[i+1]
+    if sys.argv[i].lower() == '-sparse':
+      SPARSE = sys.argv[i+1]
     if sys.argv[i].lower() == '-scores':
       SCORES = sys.argv[i+1]
 
@@ -525,13 +543,19 @@ if __name__ == "__main__":
   if len(sys.argv) <= 1:
     print(__doc__)
     exit()
-  #Load feature matrix and save feature names 
-  df = pd.read_csv(DF, sep=SEP, index_col = 0)
+  #Load feature matrix (only the listed features, if given) 
+  features, columns = None, None
+  if FEAT != 'all':
+    with open(FEAT) as f:
+      features = f.read().splitlines()
+    columns = features if DF2 != 'None' else [y_name] + features
+  df = ML.fun.Read_DF(DF, SEP, columns=columns,
+    col_index=FEAT_INDEX.lower() in ['t', 'true'], n_jobs=n_jobs)
 
   # If features  and class info are in separate files, merge them: 
   if DF2 != 'None':
     start_dim = df.shape
-    df_class = pd.read_csv(DF2, sep=SEP, index_col = 0)
+    df_class = ML.fun.Read_DF(DF2, SEP)
     df = pd.concat([df_class[y_name], df], axis=1, join='inner')
     print('Merging the feature & class dataframes changed the dimensions from %s to %s (instance, features).' 
       % (str(start_dim), str(df.shape)))
@@ -540,16 +564,22 @@ if __name__ == "__main__":
   if y_name != 'Class':
     df = df.rename(columns = {y_name:'Class'})
 
+  # Reduced-precision (-dtype) and sparse (-sparse) features
+  df = ML.fun.Cast_Features(df, DTYPE)
+  if SPARSE.lower() in ['t', 'true']:
+    df = ML.fun.To_Sparse(df, DTYPE)
+
 
-  # Check for Nas
-  if df.isnull().values.any() == True:
+  # Check for Nas (blockwise, so sparse features are not densified)
+  na_rows, na_cols = ML.fun.NA_Mask(df)
+  if na_rows.any():
     if drop_na.lower() == 't' or drop_na.lower() == 'true':
       start_dim = df.shape
-      df = df.dropna(axis=0)
+      df = df[~na_rows]
       print('Dropping rows with NA values changed the dimensions from %s to %s.' 
         % (str(start_dim), str(df.shape)))
     else:
-      print(df.columns[df.isnull().any()].tolist())
+      print(na_cols)
       print('There are Na values in your dataframe.\n Impute them or add -drop_na True to remove rows with nas')
       quit()
   
@@ -589,18 +619,20 @@ if __name__ == "__main__":
   except:
     N = [N]
 
-  #If 'features to keep' list given, remove columns not in that list
-  if FEAT != 'all':
-    with open(FEAT) as f:
-      features = f.read().splitlines()
-      features = ['Class'] + features
-    df = df.loc[:,features]
+  #If 'features to keep' list given, put columns in the order of that list
+  if features is not None:
+    df = df.loc[:, ['Class'] + features]
   
   print('\nSnapshot of data:')
   print(df.iloc[:6, :5])
 
   # Run feature selection
   df_use = df.copy()
+
+  # Only RF, chi2, L1 and EN (and random) take sparse input
+  if alg.lower() not in ['randomforest', 'rf', 'chi2', 'c2', 'l1', 'lasso',
+    'en', 'elasticnet', 'random', 'rand', 'ran']:
+    df_use = ML.fun.Dense_Features(df_use, alg)
   
   # Run FS within a cross-validation scheme
   if CVs != 'pass':
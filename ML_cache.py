@@ -0,0 +1,70 @@
+import sys, os, argparse
+import ML_functions as ML
+
+
+###### Parse input parameters #######
+
+parser = argparse.ArgumentParser(
+	description='Convert a tab-delimited dataframe to the binary cache read '+\
+		'by ML_preprocess.py, test_set.py, Feature_Selection.py, '+\
+		'ML_classification.py and ML_regression.py (saved as [df].mlcache), '+\
+		'or check that the cache is current.',
+	epilog='https://github.com/ShiuLab/ML_Pipeline/')
+
+parser.add_argument(
+	'-df',
+	help='Dataframe(s) to convert/check. Must be specified',
+	nargs='+',
+	required=True)
+parser.add_argument(
+	'-sep',
+	help='Deliminator, default="\t"',
+	default='\t')
+parser.add_argument(
+	'-encoding',
+	help='Text encoding of -df, only matters for non-ASCII names/values '+\
+		'(e.g. latin1, as used by ML_preprocess.py), default=utf-8',
+	default=None)
+parser.add_argument(
+	'-n_jobs',
+	help='Number of processes to parse -df with, default=1',
+	type=int,
+	default=1)
+parser.add_argument(
+	'-check',
+	help='t/f. Only report if the cache is current (exit status 1 if not), '+\
+		'default=f',
+	default='f')
+parser.add_argument(
+	'-hash',
+	help='t/f. Also compare the sha1 of -df, not just its size and '+\
+		'modification time, default=f',
+	default='f')
+parser.add_argument(
+	'-force',
+	help='t/f. Rebuild even if the cache is current, default=f',
+	default='f')
+
+if len(sys.argv) == 1:
+	parser.print_help()
+	sys.exit(0)
+args = parser.parse_args()
+
+###### Check/build the cache of each dataframe #######
+
+all_current = True
+for df in args.df:
+	status, meta = ML.fun.Cache_Status(df, args.sep, args.encoding,
+		args.hash.lower() in ['t', 'true'])
+	print('%s: cache %s' % (df, status))
+
+	if args.check.lower() in ['t', 'true']:
+		all_current = all_current and status == 'current'
+	elif status != 'current' or args.force.lower() in ['t', 'true']:
+		meta = ML.fun.Cache_Build(df, args.sep, args.encoding, args.n_jobs)
+		print('%s: saved %i x %i to %s' % (df, meta['shape'][0],
+			meta['shape'][1], ML.fun.Cache_Path(df)))
+
+if not all_current:
+	sys.exit(1)
+print('\nDone!')
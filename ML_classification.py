@@ -41,6 +41,9 @@ def main():
 	inp_group.add_argument('-test', help='File with testing lines', default='')
 	inp_group.add_argument('-feat', help='File with list of features (from x) '
 		'to include', default='all')
+	inp_group.add_argument('-feat_index', help='t/f With -feat, build (on '
+		'first use) and use a column-offset index of -df ([df].colidx.npz), '
+		'so only the listed columns are read from each line', default='f')
 
 	# Model behavior 
 	pipln_group = parser.add_argument_group(title='CONTROL PIPELINE BEHAVIOR')
@@ -51,18 +54,50 @@ def main():
 	pipln_group.add_argument('-apply', help='all or list of non-training class '
 		'labels that the models should be applied to', default='')
 	pipln_group.add_argument('-n_jobs', '-p', help='Number of processors for '
-		'parallel computing (max for HPCC = 14)', type=int, default=1)
+		'parallel computing, also used to parse -df (max for HPCC = 14)',
+		type=int, default=1)
+	pipln_group.add_argument('-mmap_dir', help='Directory for the read-only '
+		'memory-mapped feature matrix shared by parallel workers (e.g. '
+		'node-local /tmp, or /dev/shm for shared memory). Grid search workers '
+		'(-n_jobs > 1) always share one (default: system temp dir); if set, '
+		'-rep_jobs workers also slice their replicates from it instead of '
+		'each receiving a copy of the dataframe', default=None)
 	pipln_group.add_argument('-n', '-b', help='Number of replicates (unique '
 		'balanced datasets).', type=int, default=100)
+	pipln_group.add_argument('-seed', help='Random seed for drawing the '
+		'balanced datasets. With the same seed, reruns use the same balanced '
+		'datasets (and reuse the -gs_cache scores); use another seed for '
+		'different draws, default=0', type=int, default=0)
+	pipln_group.add_argument('-rep_jobs', help='Number of balanced replicates '
+		'to train in parallel (process pool). If > 1, each model uses 1 core',
+		type=int, default=1)
 	pipln_group.add_argument('-threshold_test', help='Metric used to define '
-		'prediction score threshold for classification (F1 or accuracy)).',
-		default='F1')
+		'prediction score threshold for classification (F1, accuracy, auprc '
+		'or MCC)).', default='F1')
+	pipln_group.add_argument('-threshold_grid', help='Step between candidate '
+		'prediction score thresholds, or "exact" to test every score '
+		'breakpoint', default='0.01')
 	pipln_group.add_argument('-x_norm', help='t/f to normalize features ('
-		'default to T for SVM based algs unless "force_false")', default='f')
+		'default to T for SVM based algs unless "force_false"). The scaling '
+		'is fit on the training instances (not -test or -apply)', default='f')
+	pipln_group.add_argument('-transform', help='Transform saved by '
+		'ML_preprocess.py for -df ([df]_transform.json). Its steps are '
+		'included in the [save]_transform.json of this run, so new instances '
+		'can be transformed for the model with ML_transform.py', default='')
+	pipln_group.add_argument('-dtype', help='float64, float32 (features kept '
+		'as float32), or uint8 (float32, with 0/1 features stored as uint8) '
+		'to cut memory, default=float64', default='float64')
+	pipln_group.add_argument('-sparse', help='t/f Keep the features sparse '
+		'(scipy CSR for the models) for mostly-zero data such as k-mer or '
+		'one-hot matrices. Normalization then scales by the max absolute '
+		'value instead of min/max, default=f', default='f')
 	pipln_group.add_argument('-drop_na', help='t/f to drop rows with NAs',
 		default='f')
 	pipln_group.add_argument('-cv_num', '-cv', help='Cross validation fold #',
 		type=int, default=10)
+	pipln_group.add_argument('-cv_apply', help='t/f Apply the average of the '
+		'cross-validation fold models to the not selected, unknown and test '
+		'instances instead of refitting on all balanced data', default='f')
 	pipln_group.add_argument('-min_size', help='Number instances to downsample '
 		'to (default = # instances from smallest class', default='')
 
@@ -71,14 +106,25 @@ def main():
 	gs_group.add_argument('-gs', help='t/f if grid search over parameter space '
 		'is desired.', type=str, default='t')
 	gs_group.add_argument('-gs_reps', '-gs_n', help='Number of Grid Search Reps'
-		'(will append if args.save_GridSearch.csv exists)', type=int,
+		' (reps already in the -gs_cache are not refit)', type=int,
 		default=10)
 	gs_group.add_argument('-gs_score', help='Metric used to select best '
 		'parameters', type=str, default='roc_auc')
-	gs_group.add_argument('-gs_type', help='Full grid search or randomized '
-		'search (full/random)', type=str, default='full')
+	gs_group.add_argument('-gs_type', help='Full grid search, randomized '
+		'search, or successive halving of the full grid over the gs_reps '
+		'(full/random/halving)', type=str, default='full')
 	gs_group.add_argument('-gs_full', help='t/f Output full results from the '
 		'grid search', type=str, default='f')
+	gs_group.add_argument('-gs_cache', help='t/f or path to a SQLite file '
+		'caching grid search fold scores, so a rerun with the same -seed only '
+		'fits missing reps/parameters (t = SAVE_GridSearch.db)', type=str,
+		default='t')
+	gs_group.add_argument('-gs_warm', help='t/f For RF/GB, grow one '
+		'warm-started ensemble per fold and score it at each n_estimators '
+		'value instead of fitting every n_estimators from scratch. For '
+		'LogReg (saga solver, also used for the final models; '
+		'intercept_scaling is not searched), fit along the sorted C values, '
+		'reusing the previous coefficients', type=str, default='f')
 
 	# Output arguments
 	out_group = parser.add_argument_group(title='OUTPUT OPTIONS')
@@ -86,12 +132,24 @@ def main():
 		'will overwrite!', default='')
 	out_group.add_argument('-tag', help='Identifier string to add to RESULTS '
 		'output line', default='')
+	out_group.add_argument('-results', help='SQLite results ledger that '
+		'every run adds its RESULTS line, parameters and metrics to (see '
+		'ML_results.py to query/export it)', default='RESULTS.db')
+	out_group.add_argument('-results_txt', help='t/f Also append the run to '
+		'RESULTS.txt, as before the ledger (the ledger keeps every run; '
+		'ML_results.py -export rebuilds the table from it), default=t',
+		default='t')
 	out_group.add_argument('-cm', help='t/f Output the confusion matrix & '
 		'confusion matrix figure', default='f')
 	out_group.add_argument('-plots', help='t/f Output ROC and PR curve plots '
 		'for each model (see ML_plots.py to post-plot', default='f')
 	out_group.add_argument('-short', help='Set to T to output only summary '
 		'prediction scores', default='f')
+	out_group.add_argument('-scores_txt', help='t/f Also write the scores '
+		'as text (_scores.txt). The scores are always saved in binary form '
+		'(_scores.npz, one replicate at a time), which ML_scores.py exports to '
+		'the same text on demand. Use f to skip the text file for large runs',
+		default='t')
 
 	# Default Hyperparameters
 	params_group = parser.add_argument_group(title='DEFINE HYPERPARAMETERS')
@@ -139,12 +197,20 @@ def main():
 	### Load and Process Input Data ###
 	###################################
 
-	df = pd.read_csv(args.df, sep=args.sep, index_col=0)
+	# With -feat, only the listed features (and y) are loaded
+	features, columns = None, None
+	if args.feat != 'all':
+		print('Using subset of features from: %s' % args.feat)
+		with open(args.feat) as f:
+			features = f.read().strip().splitlines()
+		columns = features if args.df2 != '' else [args.y_name] + features
+	df = ML.fun.Read_DF(args.df, args.sep, columns=columns,
+		col_index=args.feat_index.lower() in ['t', 'true'], n_jobs=args.n_jobs)
 
 	# If features  and class info are in separate files, merge them: 
 	if args.df2 != '':
 		start_dim = df.shape
-		df_class = pd.read_csv(args.df2, sep=args.sep, index_col=0)
+		df_class = ML.fun.Read_DF(args.df2, args.sep)
 		df = pd.concat([df_class[args.y_name], df], axis=1, join='inner')
 		print('Merging the X and Y dfs. Dim change: %s to %s (instance, feat).'
 			% (str(start_dim), str(df.shape)))
@@ -153,19 +219,21 @@ def main():
 	if args.y_name != 'Class':
 		df = df.rename(columns={args.y_name: 'Class'})
 
-	# Filter out features not in feat file given - default: keep all
-	if args.feat != 'all':
-		print('Using subset of features from: %s' % args.feat)
-		with open(args.feat) as f:
-			features = f.read().strip().splitlines()
-			features = ['Class'] + features
-		df = df.loc[:, features]
+	# Reduced-precision (-dtype) and sparse (-sparse) features
+	df = ML.fun.Cast_Features(df, args.dtype, 'Class')
+	if args.sparse.lower() in ['t', 'true']:
+		df = ML.fun.To_Sparse(df, args.dtype, 'Class')
+
+	# Put the class and features in the order of the feat file
+	if features is not None:
+		df = df.loc[:, ['Class'] + features]
 
-	# Check for Nas
-	if df.isnull().values.any():
+	# Check for Nas (blockwise, so sparse features are not densified)
+	na_rows = ML.fun.NA_Mask(df)[0]
+	if na_rows.any():
 		if args.drop_na.lower() in ['t', 'true']:
 			start_dim = df.shape
-			df = df.dropna(axis=0)
+			df = df[~na_rows]
 			print('Dropping rows with NAs... dim change: %s to %s.'
 				% (str(start_dim), str(df.shape)))
 		else:
@@ -174,16 +242,27 @@ def main():
 			quit()
 
 	# Normalize data frame for SVM algorithms
+	scale = None
 	if (args.alg.lower() in ["svm", "svmpoly", "svmrbf"] or
 		args.x_norm.lower() in ['t', 'true']):
 		if args.x_norm.lower != 'force_false':
-			from sklearn import preprocessing
 			y = df['Class']
 			X = df.drop(['Class'], axis=1)
-			min_max_scaler = preprocessing.MinMaxScaler()
-			X_scaled = min_max_scaler.fit_transform(X)
-			df = pd.DataFrame(X_scaled, columns=X.columns, index=X.index)
+
+			# Fit on the training instances only (not test or unknowns)
+			train = np.ones(len(df), dtype=bool)
+			if args.cl_train != 'all':
+				train &= y.isin(args.cl_train).values
+			if args.test != '':
+				with open(args.test) as test_file:
+					test_instances = test_file.read().splitlines()
+				train &= ~df.index.astype(str).isin(test_instances)
+
+			# Min/max scaling (max abs value if sparse, so it is not densified)
+			scale = ML.fun.Scale_Fit(X[train])
+			df = ML.fun.Scale_Apply(X, scale)
 			df.insert(loc=0, column='Class', value=y)
+			df = ML.fun.Cast_Features(df, args.dtype, 'Class')
 
 
 	# Set up dataframe of unknown instances that the final models will be 
@@ -263,6 +342,26 @@ def main():
 		else:
 			args.save = args.df + "_" + args.alg + "_" + args.tag
 
+	# Transform for new instances (ML_transform.py): the -transform steps,
+	# the features used and their scaling
+	if args.transform != '':
+		transform = ML.fun.Transform_Load(args.transform)
+		transform['dtype'] = args.dtype
+	else:
+		transform = ML.fun.Transform_New(args.y_name, args.dtype, {c: d.kind
+			for c, d in zip(df.columns, df.dtypes) if c != 'Class'})
+	transform['keep'] = [c for c in df.columns if c != 'Class']
+	transform['binary'] = [c for c, d in zip(df.columns, df.dtypes)
+		if d == np.uint8]
+	transform['scale'] = scale
+	ML.fun.Transform_Save(args.save + '_transform.json', transform)
+
+	# Grid search cache file ('' = no cache)
+	if args.gs_cache.lower() in ['t', 'true']:
+		args.gs_cache = args.save + '_GridSearch.db'
+	elif args.gs_cache.lower() in ['f', 'false']:
+		args.gs_cache = ''
+
 	print("Snapshot of data being used:")
 	print(df.iloc[:5, :5])
 	print("\n\nCLASSES:", classes)
@@ -282,7 +381,8 @@ def main():
 		params2use, balanced_ids, param_names = ML.fun.GridSearch(df, args.save,
 			args.alg, classes, min_size, args.gs_score, args.n, args.cv_num,
 			args.n_jobs, args.gs_reps, args.gs_type, args.pos, NEG,
-			args.gs_full)
+			args.gs_full, args.seed, args.gs_cache,
+			args.gs_warm.lower() in ['t', 'true'], args.mmap_dir)
 
 		# Print results from grid search
 		if args.alg.lower() == 'rf':
@@ -325,16 +425,15 @@ def main():
 
 		try:
 			balanced_ids = ML.fun.EstablishBalanced(df, classes, int(min_size),
-				args.n)
+				args.n, args.seed)
 		except:
 			classes = list(map(int, classes))
 			balanced_ids = ML.fun.EstablishBalanced(df, classes, int(min_size),
-				args.n)
-
+				args.n, args.seed)
 
-	bal_id = pd.DataFrame(balanced_ids)
-	bal_id.to_csv(args.save + '_BalancedIDs', index=False, header=False,
-		sep="\t")
+	# balanced_ids holds row positions in df, balanced_names the instance IDs
+	balanced_names = df.index.values[balanced_ids]
+	ML.fun.Save_BalancedIDs(args.save, df.index, balanced_ids)
 
 	###############################
 	### Train & Apply ML Models ###
@@ -353,24 +452,21 @@ def main():
 			index=df_unknowns.index, columns=['Class'])
 		df_proba = pd.concat([df_proba,df_proba2], axis=0)
 
-	for j in range(len(balanced_ids)):
-
-		print("  Round %s of %s" % (j + 1, len(balanced_ids)))
-
-		#Make balanced datasets
-		df1 = df[df.index.isin(balanced_ids[j])]
-		df_notSel = df[~df.index.isin(balanced_ids[j])]
+	# When replicates run in parallel, each model gets one core
+	if args.rep_jobs > 1:
+		model_jobs = 1
+	else:
+		model_jobs = args.n_jobs
 
-		# Remove non-training classes from not-selected dataframe
-		if args.cl_train != 'all':
-			df_notSel = df_notSel[(df_notSel['Class'].isin(args.cl_train))]
+	clfs = []
+	for j in range(len(balanced_ids)):
 
 		# Prime classifier object based on chosen algorithm
 		if args.alg.lower() == "rf":
 			parameters_used = [args.n_estimators, args.max_depth,
 				args.max_features]
 			clf = ML.fun.DefineClf_RandomForest(args.n_estimators,
-				args.max_depth, args.max_features, j, args.n_jobs)
+				args.max_depth, args.max_features, j, model_jobs)
 		elif args.alg.lower() == "svm":
 			parameters_used = [args.C]
 			clf = ML.fun.DefineClf_LinearSVM(args.C, j)
@@ -380,32 +476,47 @@ def main():
 				args.gamma, j)
 		elif args.alg.lower() == "logreg":
 			parameters_used = [args.C, args.intercept_scaling, args.penalty]
+			# Same solver as the grid search (saga for -gs_warm paths)
+			solver = None
+			if (args.gs.lower() in ['t', 'true'] and
+				args.gs_warm.lower() in ['t', 'true']):
+				solver = 'saga'
 			clf = ML.fun.DefineClf_LogReg(args.penalty, args.C,
-				args.intercept_scaling)
+				args.intercept_scaling, solver)
 		elif args.alg.lower() == "gb":
 			parameters_used = [args.lr, args.max_features, args.max_depth]
 			clf = ML.fun.DefineClf_GB(args.n_estimators, args.lr,
-				args.max_features, args.max_depth, args.n_jobs, j)
-
-		# Run ML algorithm on balanced datasets.
-		if args.test != '':
-			result, current_scores, result_test = \
-				ML.fun.BuildModel_Apply_Performance(df1, clf, args.cv_num,
-					df_notSel, apply_unk, df_unknowns, test_df, classes,
-					args.pos, NEG, j, args.alg, args.threshold_test)
-			results_test.append(result_test)
-		else:
-			result, current_scores = ML.fun.BuildModel_Apply_Performance(df1,
-				clf, args.cv_num, df_notSel, apply_unk, df_unknowns, test_df,
-				classes, args.pos, NEG, j, args.alg, args.threshold_test)
-
+				args.max_features, args.max_depth, model_jobs, j)
+		clfs.append(clf)
+
+	# Scores from all replicates are kept in one preallocated float32 array
+	if df_proba.index.duplicated().any():
+		print('\n\nSomething went wrong merging the probability scores...'
+			'Check if you have duplicate instance names in your df!')
+		quit()
+	if len(classes) == 2:
+		score_store = ML.fun.Score_Store(len(df_proba.index), len(balanced_ids))
+	else:
+		score_store = ML.fun.Score_Store(len(df_proba.index), len(balanced_ids),
+			len(classes))
+
+	# Run ML algorithm on balanced datasets (replicates are yielded as they
+	# finish).
+	rep_results = ML.fun.Run_Balanced_Replicates(df, balanced_ids, clfs,
+		args.rep_jobs, args.cl_train, args.cv_num, apply_unk, df_unknowns,
+		test_df, classes, args.pos, NEG, args.alg, args.threshold_test,
+		args.cv_apply.lower() in ['t', 'true'], args.threshold_grid,
+		args.mmap_dir)
+
+	# Fill each replicate into the store and _scores.npz as it arrives
+	scores_npz = ML.fun.Scores_Open(args.save)
+	for j, (result, current_scores, result_test) in enumerate(rep_results):
 		results.append(result)
-		try:
-			df_proba = pd.concat([df_proba, current_scores], axis=1)
-		except:
-			print('\n\nSomething went wrong merging the probability scores...'
-				'Check if you have duplicate instance names in your df!')
-			quit()
+		if result_test is not None:
+			results_test.append(result_test)
+		ML.fun.Score_Store_Fill(score_store, df_proba.index, current_scores, j)
+		ML.fun.Scores_Write(scores_npz, 'rep_%i' % j, score_store[:, j])
+	rep_columns = ML.fun.Score_Store_Columns(score_store, classes)
 
 	print("ML Pipeline time: %f seconds" % (time.time() - start_time))
 
@@ -414,6 +525,11 @@ def main():
 	### Unpack & Save ML Results ###
 	################################
 
+	score_mean, score_median, score_sd = ML.fun.Score_Store_Summary(
+		score_store)
+	df_proba = pd.concat([df_proba, ML.fun.Score_Store_Frame(score_store,
+		df_proba.index, classes)], axis=1)
+
 	## Make empty dataframes
 	conf_matrices = pd.DataFrame(columns=np.insert(arr=classes.astype(np.str),
 		obj=0, values='Class'), dtype=float)
@@ -495,21 +611,19 @@ def main():
 		summary_cols = []
 		mc_score_columns = []
 		keep_for_summary = ['Class', 'Prediction']
-		for class_nm in reversed(classes):
-			class_proba_cols = [c for c in df_proba.columns if \
-				c.startswith(class_nm + '_score_')]
+		for k in reversed(range(len(classes))):
+			class_nm = classes[k]
 			df_proba.insert(loc=1, column=class_nm + '_score_stdev',
-				value=df_proba[class_proba_cols].std(axis=1))
+				value=score_sd[:, k])
 			summary_cols.insert(0, class_nm + '_score_stdev')
 
-		for class_nm in reversed(classes):
+		for k in reversed(range(len(classes))):
+			class_nm = classes[k]
 			summary_cols.insert(0,class_nm +'_score_Median')
 			mc_score_columns.append(class_nm +'_score_Median')
 			keep_for_summary.append(class_nm + '_score_Median')
-			class_proba_cols = [c for c in df_proba.columns if \
-				c.startswith(class_nm+'_score_')]
 			df_proba.insert(loc=1, column=class_nm + '_score_Median',
-				value=df_proba[class_proba_cols].median(axis=1))
+				value=score_median[:, k])
 
 		# Find the max mc_score and set to Prediction column 
 		# (remove the _score_Median string)
@@ -536,15 +650,15 @@ def main():
 				summary_df_proba[class_nm] / summary_df_proba['n_total'])
 
 
-		scores_file = args.save + "_scores.txt"
-		out_scores = open(scores_file, "w")
-		if args.short.lower() in ['t', 'true']:
-			out_scores.write("#ID\t" + pd.DataFrame.to_csv(df_proba[["Class"] +
-				summary_cols], sep="\t").strip() + "\n")
-		else:
-			out_scores.write("#ID\t" + pd.DataFrame.to_csv(df_proba, sep="\t")
-				.strip() + "\n")
-		out_scores.close()
+		short_cols = ["Class"] + summary_cols
+		ML.fun.Scores_Close(scores_npz, df_proba, rep_columns, "#ID",
+			short_cols)
+		if args.scores_txt.lower() in ['t', 'true']:
+			if args.short.lower() in ['t', 'true']:
+				ML.fun.Scores_TSV(df_proba[short_cols],
+					args.save + "_scores.txt", "#ID")
+			else:
+				ML.fun.Scores_TSV(df_proba, args.save + "_scores.txt", "#ID")
 
 		f1 = pd.DataFrame(f1_array)
 		f1.columns = f1.iloc[0]
@@ -629,14 +743,9 @@ def main():
 
 		# Determine final prediction call
 		# using the final_threshold on the mean predicted probability.
-		proba_columns = [c for c in df_proba.columns if c.startswith('score_')]
-
-		df_proba.insert(loc=1, column='Median',
-			value=df_proba[proba_columns].median(axis=1))
-		df_proba.insert(loc=1, column='Mean',
-			value=df_proba[proba_columns].mean(axis=1))
-		df_proba.insert(loc=2, column='stdev',
-			value=df_proba[proba_columns].std(axis=1))
+		df_proba.insert(loc=1, column='Median', value=score_median)
+		df_proba.insert(loc=1, column='Mean', value=score_mean)
+		df_proba.insert(loc=2, column='stdev', value=score_sd)
 		Pred_name = 'Predicted_' + str(final_threshold)
 		df_proba.insert(loc=3, column=Pred_name,
 			value=df_proba['Class'])
@@ -659,31 +768,31 @@ def main():
 		summary_df_proba[str(args.pos) + '_perc'] = (summary_df_proba[args.pos] /
 			summary_df_proba['n_total'])
 
-		scores_file = args.save + "_scores.txt"
-		out_scores = open(scores_file, "w")
-		if args.short.lower() in ['t', 'true']:
-			out_scores.write("ID\t" + pd.DataFrame.to_csv(df_proba[["Class",
-				"Mean", "Median", "stdev",Pred_name]], sep="\t").strip() + "\n")
-		else:
-			out_scores.write("ID\t" + pd.DataFrame.to_csv(df_proba, 
-				sep="\t").strip() + "\n")
-		out_scores.close()
+		short_cols = ["Class", "Mean", "Median", "stdev", Pred_name]
+		ML.fun.Scores_Close(scores_npz, df_proba, rep_columns, "ID",
+			short_cols)
+		if args.scores_txt.lower() in ['t', 'true']:
+			if args.short.lower() in ['t', 'true']:
+				ML.fun.Scores_TSV(df_proba[short_cols],
+					args.save + "_scores.txt", "ID")
+			else:
+				ML.fun.Scores_TSV(df_proba, args.save + "_scores.txt", "ID")
 
 		# Get model preformance scores using final_threshold
 		if args.test != '':
 			TP,TN,FP,FN,TPR,FPR,FNR,Pr,Ac,F1,Pr_test,Ac_test,F1_test = \
 				ML.fun.Model_Performance_Thresh(df_proba, final_threshold,
-					balanced_ids, args.pos, NEG, test_instances)
+					balanced_names, args.pos, NEG, test_instances)
 		else:
 			TP,TN,FP,FN,TPR,FPR,FNR,Pr,Ac,F1 = \
 				ML.fun.Model_Performance_Thresh(df_proba, final_threshold,
-					balanced_ids, args.pos, NEG, test_instances)
+					balanced_names, args.pos, NEG, test_instances)
 			Pr_test, Ac_test, F1_test = 0, 0, 0
 
 		# Plot ROC & PR curves
 		if args.plots.lower() in['true', 't']:
 			print("\nGenerating ROC & PR curves")
-			pr = ML.fun.Plots(df_proba, balanced_ids, ROC, PRc, args.pos,
+			pr = ML.fun.Plots(df_proba, balanced_names, ROC, PRc, args.pos,
 				NEG, args.n, args.save)
 
 		# Export importance scores
@@ -691,31 +800,27 @@ def main():
 			imp['mean_imp'] = imp.mean(axis=1)
 			imp = imp.sort_values('mean_imp', 0, ascending=False)
 			imp_out = args.save + "_imp"
-			imp['mean_imp'].to_csv(imp_out, sep="\t", index=True)
+			ML.fun.Write_CSV(imp['mean_imp'], imp_out, sep="\t", index=True)
 			# imp['mean_imp'].to_csv(imp_out, sep = ",", index=True)
 		except:
 			pass
 
 		run_time = time.time() - start_total_time
 
-		# Save to summary RESULTS file for all models run in the same directory
-
-		if not os.path.isfile('RESULTS.txt'):
-			out2 = open('RESULTS.txt', 'a')
-			out2.write('DateTime\tRunTime\tID\tTag\tAlg\tClasses\tFeatureNum\t'
-				'BalancedSize\tCVfold\tBalancedRuns\tAUCROC_val\tAUCROC_val_sd'
-				'\tAUCROC_val_se\tAUCPRc_val\tAUCPRc_val_sd\tAUCPRc_val_se\t'
-				'Ac_val\tAc_val_sd\tAc_val_se\tF1_val\tF1_val_sd\tF1_val_se\t'
-				'Pr_val\tPr_val_sd\tPr_val_se\tTPR_val\tTPR_val_sd\tTPR_val_se'
-				'\tFPR_val\tFPR_val_sd\tFPR_val_se\tFNR_val\tFNR_val_sd\t'
-				'FNR_val_se\tTP_val\tTP_val_sd\tTP_val_se\tTN_val\tTN_val_sd'
-				'\tTN_val_se\tFP_val\tFP_val_sd\tFP_val_se\tFN_val\tFN_val_sd'
-				'\tFN_val_se\tPr_test\tAc_test\tF1_test\tAUCROC_test\t'
-				'AUCROC_test_sd\tAUCROC_test_se\tAUCPRc_test\tAUCPRc_test_sd'
-				'\tAUCPRc_test_se')
-			out2.close()
-		out2 = open('RESULTS.txt', 'a')
-		out2.write('\n%s\t%s\t%s\t%s\t%s\t%s\t%i\t%i\t%i\t%i\t%s\t%s\t%s\t%s'
+		# Save to the summary RESULTS ledger for all models run in the same
+		# directory (and RESULTS.txt appended to, with -results_txt t)
+		results_header = ('DateTime\tRunTime\tID\tTag\tAlg\tClasses\t'
+			'FeatureNum\tBalancedSize\tCVfold\tBalancedRuns\tAUCROC_val\t'
+			'AUCROC_val_sd\tAUCROC_val_se\tAUCPRc_val\tAUCPRc_val_sd\t'
+			'AUCPRc_val_se\tAc_val\tAc_val_sd\tAc_val_se\tF1_val\tF1_val_sd\t'
+			'F1_val_se\tPr_val\tPr_val_sd\tPr_val_se\tTPR_val\tTPR_val_sd\t'
+			'TPR_val_se\tFPR_val\tFPR_val_sd\tFPR_val_se\tFNR_val\tFNR_val_sd'
+			'\tFNR_val_se\tTP_val\tTP_val_sd\tTP_val_se\tTN_val\tTN_val_sd\t'
+			'TN_val_se\tFP_val\tFP_val_sd\tFP_val_se\tFN_val\tFN_val_sd\t'
+			'FN_val_se\tPr_test\tAc_test\tF1_test\tAUCROC_test\t'
+			'AUCROC_test_sd\tAUCROC_test_se\tAUCPRc_test\tAUCPRc_test_sd\t'
+			'AUCPRc_test_se')
+		results_line = ('%s\t%s\t%s\t%s\t%s\t%s\t%i\t%i\t%i\t%i\t%s\t%s\t%s\t%s'
 			'\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%s\t%05f\t%05f\t%05f\t%s\t%s' % (
 			str(timestamp), run_time, args.save, args.tag, args.alg,
 			[args.pos, NEG], n_features, min_size, args.cv_num, args.n,
@@ -727,6 +832,11 @@ def main():
 			'\t'.join(str(x) for x in FP), '\t'.join(str(x) for x in FN),
 			Pr_test, Ac_test, F1_test, '\t'.join(str(x) for x in ROC_test),
 			'\t'.join(str(x) for x in PRc_test)))
+		ML.fun.Ledger_Add(args.results, 'c', results_header, results_line,
+			args.feat, parameters_used, vars(args))
+		if args.results_txt.lower() in ['t', 'true']:
+			ML.fun.Results_Append('RESULTS.txt', 'c', results_header,
+				results_line)
 
 		# Save detailed results file 
 		with open(args.save + "_results.txt", 'w') as out:
@@ -2,7 +2,7 @@
 PURPOSE: Functions for Shiu Lab ML-Pipeline
 
 """
-import sys
+import sys, os
 import pandas as pd
 import numpy as np
 import time
@@ -13,22 +13,1138 @@ class fun(object):
 	def __init__(self, filename):
 		self.tokenList = open(filename, 'r')
 
-	def EstablishBalanced(df, classes, min_size, gs_n):
-		""" Defines which instances will be used for each balanced dataset """
-		class_ids_dict = {}
+	def Cache_Path(path):
+		""" Directory holding the binary cache of a text dataframe """
+		return path + '.mlcache'
+
+	def File_Hash(path):
+		""" sha1 hex digest of a file, read in 1 MB blocks """
+		import hashlib
+		h = hashlib.sha1()
+		with open(path, 'rb') as f:
+			for block in iter(lambda: f.read(1 << 20), b''):
+				h.update(block)
+		return h.hexdigest()
+
+	def Cache_Build(path, sep='\t', encoding=None, n_jobs=1):
+		""" Parse a text dataframe (first column = index, with n_jobs
+		processes) once and save it as a binary cache: one Fortran-ordered
+		.npy block per column dtype (a column is contiguous on disk), the
+		index, and a meta.json with the column order and the size, mtime
+		and sha1 of the text file """
+		import json, shutil
+		stat = os.stat(path)
+		if n_jobs != 1:
+			df = fun.Read_Parallel(path, sep, encoding, n_jobs)
+		else:
+			df = pd.read_csv(path, sep=sep, index_col=0, encoding=encoding)
+
+		cache = fun.Cache_Path(path)
+		tmp = cache + '.tmp'
+		shutil.rmtree(tmp, ignore_errors=True)
+		os.makedirs(tmp)
+
+		def to_npy(name, values):
+			# Text is stored as fixed-width unicode (no pickles) with a mask
+			# of missing values
+			values = np.asarray(values)
+			if values.dtype == object:
+				na = pd.isnull(values)
+				values = np.where(na, '', values).astype(str)
+				if na.any():
+					np.save(os.path.join(tmp, name + '_na.npy'), na)
+			np.save(os.path.join(tmp, name + '.npy'), values)
+			return values.dtype.kind != 'U' or all(v.isascii() for v in
+				np.unique(values))
+
+		ascii = to_npy('index', df.index.values)
+		ascii = ascii and all(str(c).isascii() for c in df.columns)
+		block_pos = {}
+		for i, dtype in enumerate(df.dtypes):
+			block_pos.setdefault(str(dtype), []).append(i)
+		blocks = []
+		for positions in block_pos.values():
+			name = 'block_%i' % len(blocks)
+			values = np.asfortranarray(df.iloc[:, positions].values)
+			ascii = to_npy(name, values) and ascii
+			blocks.append({'file': name, 'positions': positions})
+
+		meta = {'version': 1, 'sep': sep, 'encoding': encoding,
+			'ascii': bool(ascii), 'size': stat.st_size,
+			'mtime': stat.st_mtime, 'sha1': fun.File_Hash(path),
+			'index_name': df.index.name, 'columns': list(df.columns),
+			'shape': list(df.shape), 'blocks': blocks}
+		with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+			json.dump(meta, f)
+
+		shutil.rmtree(cache, ignore_errors=True)
+		os.rename(tmp, cache)
+		return meta
+
+	def Cache_Status(path, sep='\t', encoding=None, check_hash=False):
+		""" Return (status, meta) for the binary cache of path: 'current',
+		'missing', or 'stale' (text file changed or other sep/encoding).
+		By default the text file is compared by size and mtime, with
+		check_hash also by sha1 """
+		import json
+		meta_file = os.path.join(fun.Cache_Path(path), 'meta.json')
+		if not os.path.isfile(meta_file):
+			return 'missing', None
+		with open(meta_file) as f:
+			meta = json.load(f)
+
+		stat = os.stat(path)
+		if meta['sep'] != sep or (meta['encoding'] != encoding and
+			not meta['ascii']):
+			return 'stale', meta
+		if meta['size'] != stat.st_size or meta['mtime'] != stat.st_mtime:
+			return 'stale', meta
+		if check_hash and meta['sha1'] != fun.File_Hash(path):
+			return 'stale', meta
+		return 'current', meta
+
+	def Cache_Load(path, meta, columns=None):
+		""" Load a dataframe from its binary cache. With columns, only those
+		columns are read from the (memory-mapped) blocks """
+		cache = fun.Cache_Path(path)
+
+		def from_npy(name, keep=None):
+			values = np.load(os.path.join(cache, name + '.npy'),
+				mmap_mode=None if keep is None else 'r')
+			if keep is not None:
+				values = np.array(values[:, keep])
+			if values.dtype.kind == 'U':
+				values = values.astype(object)
+				if os.path.isfile(os.path.join(cache, name + '_na.npy')):
+					na = np.load(os.path.join(cache, name + '_na.npy'))
+					values[na if keep is None else na[:, keep]] = np.nan
+			return values
+
+		index = pd.Index(from_npy('index'), name=meta['index_name'])
+		if columns is None:
+			df = pd.concat([pd.DataFrame(from_npy(b['file']), index=index)
+				for b in meta['blocks']], axis=1)
+			positions = np.concatenate([b['positions'] for b in
+				meta['blocks']])
+			df = df.iloc[:, np.argsort(positions)]
+			df.columns = meta['columns']
+			return df
+
+		wanted = set(fun.Column_Positions(meta['columns'], columns))
+		frames, positions = [], []
+		for b in meta['blocks']:
+			keep = [i for i, pos in enumerate(b['positions']) if pos in wanted]
+			if len(keep) > 0:
+				frames.append(pd.DataFrame(from_npy(b['file'], keep),
+					index=index))
+				positions.extend(b['positions'][i] for i in keep)
+		df = pd.concat(frames, axis=1)
+		order = np.argsort(positions)
+		df = df.iloc[:, order]
+		df.columns = [meta['columns'][positions[i]] for i in order]
+		return df
+
+	def Column_Positions(header, columns):
+		""" Positions in header of the given column names (KeyError if any
+		are missing) """
+		lookup = {name: i for i, name in enumerate(header)}
+		missing = [c for c in columns if c not in lookup]
+		if len(missing) > 0:
+			raise KeyError('%i requested columns are not in the dataframe, '
+				'e.g. %s' % (len(missing), missing[:5]))
+		return sorted(set(lookup[c] for c in columns))
+
+	def Column_Index_Path(path):
+		return path + '.colidx.npz'
+
+	def Column_Index_Build(path, sep='\t', step=1024):
+		""" Build the column-offset index of a delimited text file: for
+		every line, the byte offset of every step-th field and of the line
+		end. Later column projections (Read_Columns) then only read the
+		parts of each line that hold the requested fields. Fields may not
+		contain quoted separators """
+		sep_byte = ord(sep)
+		starts, ends = [], []
+		n_fields = None
+		offset = 0
+		with open(path, 'rb') as f:
+			for line in f:
+				content = line.rstrip(b'\r\n')
+				if len(content) > 0:
+					seps = np.flatnonzero(np.frombuffer(content, np.uint8) ==
+						sep_byte)
+					if n_fields is None:
+						n_fields = len(seps) + 1
+					elif len(seps) + 1 != n_fields:
+						raise ValueError('%s: line at byte %i has %i fields, '
+							'expected %i' % (path, offset, len(seps) + 1,
+							n_fields))
+					field_starts = np.concatenate([[0], seps[step - 1::step] +
+						1])
+					starts.append(offset + field_starts)
+					ends.append(offset + len(content))
+				offset += len(line)
+
+		stat = os.stat(path)
+		index = {'starts': np.array(starts, dtype=np.int64),
+			'ends': np.array(ends, dtype=np.int64),
+			'step': np.int64(step), 'sep': np.array(sep),
+			'size': np.int64(stat.st_size), 'mtime': np.float64(stat.st_mtime)}
+		np.savez(fun.Column_Index_Path(path), **index)
+		return index
+
+	def Column_Index_Load(path, sep='\t'):
+		""" Load the column-offset index of path, (re)building it if it is
+		missing or the text file has changed """
+		index_path = fun.Column_Index_Path(path)
+		if os.path.isfile(index_path):
+			stat = os.stat(path)
+			index = dict(np.load(index_path))
+			if str(index['sep']) == sep and index['size'] == stat.st_size \
+				and index['mtime'] == stat.st_mtime:
+				return index
+		print('Building the column-offset index of %s' % path)
+		return fun.Column_Index_Build(path, sep)
+
+	def Read_Columns(path, sep, columns, encoding=None, col_index=False):
+		""" Read only the given columns (and the index) of a text dataframe.
+		Without col_index, pandas parses just these columns (usecols). With
+		col_index, the column-offset index (see Column_Index_Build) is used
+		to read only the stretches of each line holding these columns """
+		header = pd.read_csv(path, sep=sep, index_col=0, nrows=0,
+			encoding=encoding).columns
+		fields = [0] + [i + 1 for i in fun.Column_Positions(header, columns)]
+		if not col_index:
+			return pd.read_csv(path, sep=sep, index_col=0, usecols=fields,
+				encoding=encoding)
+
+		index = fun.Column_Index_Load(path, sep)
+		starts, ends, step = index['starts'], index['ends'], int(index['step'])
+		fields = np.array(fields)
+		chunks = [(c, fields[fields // step == c] - c * step)
+			for c in np.unique(fields // step)]
+		sep_bytes = sep.encode()
+
+		import io, mmap
+		out = io.BytesIO()
+		with open(path, 'rb') as f:
+			text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+			for line_starts, end in zip(starts, ends):
+				line = []
+				for c, keep in chunks:
+					stop = line_starts[c + 1] - 1 if c + 1 < len(line_starts) \
+						else end
+					values = text[line_starts[c]:stop].split(sep_bytes)
+					line.extend(values[k] for k in keep)
+				out.write(sep_bytes.join(line) + b'\n')
+			text.close()
+		out.seek(0)
+		return pd.read_csv(out, sep=sep, index_col=0, encoding=encoding)
+
+	def Parse_Range(path, start, end, sep='\t', encoding=None, na_values=None,
+		dtype=None, usecols=None):
+		""" Parse the lines in bytes start:end of a text dataframe (no
+		header, first column = index). Columns are numbered 1.. as in the
+		file (dtype/usecols use these numbers) """
+		import io
+		with open(path, 'rb') as f:
+			f.seek(start)
+			data = f.read(end - start)
+		return pd.read_csv(io.BytesIO(data), sep=sep, header=None, index_col=0,
+			encoding=encoding, na_values=na_values, dtype=dtype,
+			usecols=usecols)
+
+	def Read_Parallel(path, sep='\t', encoding=None, n_jobs=1, na_values=None,
+		block=1 << 26):
+		""" Read a text dataframe (first column = index) with n_jobs worker
+		processes: the file is split into byte ranges of whole lines (about
+		block bytes, at least one per worker), each range is parsed with
+		Parse_Range, and the dtypes are reconciled as pandas would infer
+		them for the whole column (see Kind_Merge; ranges that need it are
+		parsed again as text). When all columns end up with one dtype they
+		are assembled into a single ndarray. na_values (e.g. the NA tokens
+		of ML_preprocess.py) are turned into NaN while parsing. Fields must
+		not hold quoted line breaks """
+		try:
+			from joblib import Parallel, delayed, cpu_count
+		except ImportError:
+			from sklearn.externals.joblib import Parallel, delayed, cpu_count
+		import csv
+		size = os.path.getsize(path)
+		workers = n_jobs if n_jobs > 0 else max(1, cpu_count() + 1 + n_jobs)
+		with open(path, 'rb') as f:
+			# The header is split here, as pandas takes long to build an
+			# empty frame of a very wide file
+			names = next(csv.reader([f.readline().decode(encoding or
+				'utf-8-sig').rstrip('\r\n')], delimiter=sep))
+			starts = [f.tell()]
+			if starts[0] >= size or len(names) < 2 or len(set(names)) < len(
+				names):
+				return pd.read_csv(path, sep=sep, index_col=0,
+					encoding=encoding, na_values=na_values)
+			n_ranges = max(workers, -(-(size - starts[0]) // block))
+			step = max(1, (size - starts[0]) // n_ranges)
+			for offset in range(starts[0] + step, size, step):
+				if offset > starts[-1]:
+					f.seek(offset - 1)
+					f.readline()
+					if f.tell() < size and f.tell() > starts[-1]:
+						starts.append(f.tell())
+		ranges = list(zip(starts, starts[1:] + [size]))
+
+		with Parallel(n_jobs=n_jobs) as parallel:
+			parts = parallel(delayed(fun.Parse_Range)(path, start, end, sep,
+				encoding, na_values) for start, end in ranges)
+
+			# Columns that are text as a whole but numbers in some ranges are
+			# parsed again as text there (an int/float mix just becomes float)
+			n_cols = len(names) - 1
+			kinds = [set() for c in range(n_cols + 1)]
+			part_kinds = [[d.kind for d in part.dtypes] for part in parts]
+			for part, part_kind in zip(parts, part_kinds):
+				kinds[0].add('O' if part.index.dtype.kind == 'O' else 'n')
+				for c, k in enumerate(part_kind):
+					kinds[c + 1].add('i' if k == 'u' else k)
+			merged = [fun.Kind_Merge(set(k)) for k in kinds[1:]]
+			text = [c + 1 for c in range(n_cols) if merged[c] == 'O' and
+				len(kinds[c + 1]) > 1]
+			redo = [i for i, part_kind in enumerate(part_kinds) if any(
+				part_kind[c - 1] != 'O' for c in text)]
+			if len(redo) > 0:
+				again = parallel(delayed(fun.Parse_Range)(path, ranges[i][0],
+					ranges[i][1], sep, encoding, na_values, {c: str for c in
+					text}, [0] + text) for i in redo)
+				for i, part in zip(redo, again):
+					parts[i][text] = part[text]
+
+			# Likewise the index, so IDs such as 007 are kept as written
+			if len(kinds[0]) > 1:
+				redo = [i for i, part in enumerate(parts)
+					if part.index.dtype.kind != 'O']
+				again = parallel(delayed(fun.Parse_Range)(path, ranges[i][0],
+					ranges[i][1], sep, encoding, na_values, {0: str}, [0])
+					for i in redo)
+				for i, part in zip(redo, again):
+					parts[i].index = part.index
+		for i, part_kind in enumerate(part_kinds):
+			cast = {c + 1: 'float64' for c in range(n_cols)
+				if merged[c] == 'f' and part_kind[c] != 'f'}
+			if len(cast) > 0:
+				parts[i] = parts[i].astype(cast)
+
+		index = parts[0].index.append([part.index for part in parts[1:]])
+		index.name = names[0] or None
+		dtypes = set(str(d) for part in parts for d in part.dtypes)
+		if len(dtypes) == 1 and parts[0].dtypes.iloc[0].kind in 'biuf':
+			X = np.empty((len(index), n_cols), dtype=parts[0].dtypes.iloc[0])
+			row = 0
+			while len(parts) > 0:
+				part = parts.pop(0)
+				X[row:row + len(part)] = part.values
+				row += len(part)
+			return pd.DataFrame(X, index=index, columns=pd.Index(names[1:]))
+		df = pd.concat(parts, axis=0)
+		df.index = index
+		df.columns = pd.Index(names[1:])
+		return df
+
+	def Read_DF(path, sep='\t', encoding=None, columns=None, col_index=False,
+		n_jobs=1, na_values=None):
+		""" Read a dataframe (first column = index) from its binary cache
+		(see ML_cache.py) if it is current, otherwise from the text file,
+		with n_jobs processes (see Read_Parallel). With columns, only those
+		columns are loaded (see Read_Columns). With na_values (extra NA
+		tokens turned into NaN while parsing) the text file is always read,
+		as the cache holds the data parsed without them """
+		if os.path.isfile(path) and na_values is None:
+			status, meta = fun.Cache_Status(path, sep, encoding)
+			if status == 'current':
+				print('Loading %s from its binary cache' % path)
+				return fun.Cache_Load(path, meta, columns)
+			elif status == 'stale':
+				print('Binary cache of %s is out of date, reading the text '
+					'file (rebuild with ML_cache.py)' % path)
+		if columns is not None:
+			return fun.Read_Columns(path, sep, columns, encoding, col_index)
+		if n_jobs != 1:
+			return fun.Read_Parallel(path, sep, encoding, n_jobs, na_values)
+		return pd.read_csv(path, sep=sep, index_col=0, encoding=encoding,
+			na_values=na_values)
+
+	def Cast_Features(df, dtype='float64', y_name='Class', chunk=1000,
+		binary=None):
+		""" Reduced-precision features (-dtype). 'float32' stores the
+		numeric feature columns (all but y_name) as float32, 'uint8' also
+		stores the columns that only hold 0/1 as uint8 (or the columns named
+		in binary, e.g. when df is one chunk of a larger dataframe). 'float64'
+		returns df unchanged. Estimators that need float64 (e.g. liblinear
+		SVM/LogReg) upcast their own copy when fit """
+		if dtype == 'float64':
+			return df
+		if dtype not in ['float32', 'uint8']:
+			raise ValueError('dtype must be float64, float32 or uint8, not %s'
+				% dtype)
+		numeric = np.flatnonzero([c != y_name and d.kind in 'biuf' and
+			not isinstance(d, pd.SparseDtype)
+			for c, d in zip(df.columns, df.dtypes)])
+
+		# Converted chunk by chunk, so no float64 copy of all the features
+		binary_cols = binary
+		binary = np.zeros(len(numeric), dtype=bool)
+		if dtype == 'uint8' and binary_cols is not None:
+			binary = np.asarray(df.columns[numeric].isin(list(binary_cols)),
+				dtype=bool)
+		X = np.empty((len(df), len(numeric)), dtype=np.float32)
+		for i in range(0, len(numeric), chunk):
+			block = df.iloc[:, numeric[i:i + chunk]].values
+			if dtype == 'uint8' and binary_cols is None:
+				binary[i:i + chunk] = ((block == 0) | (block == 1)).all(axis=0)
+			X[:, i:i + chunk] = block
+
+		parts = [df.iloc[:, np.setdiff1d(np.arange(df.shape[1]), numeric)]]
+		for keep, as_type in [(~binary, np.float32), (binary, np.uint8)]:
+			if keep.any():
+				parts.append(pd.DataFrame(X[:, keep].astype(as_type,
+					copy=False), index=df.index, columns=df.columns[
+					numeric[keep]]))
+		del X
+		positions = np.concatenate([np.setdiff1d(np.arange(df.shape[1]),
+			numeric), numeric[~binary], numeric[binary]])
+		df = pd.concat(parts, axis=1)
+		return df.iloc[:, np.argsort(positions, kind='stable')]
+
+	def To_Sparse(df, dtype='float64', y_name='Class', chunk=1000):
+		""" Store the numeric feature columns of df (all but y_name) as
+		sparse columns with fill value 0 (-sparse), converting chunk columns
+		at a time. Sparse columns survive slicing (take, masks, loc) and
+		sklearn receives them as a CSR matrix. Values are float32 unless
+		dtype is float64 """
+		numeric = np.flatnonzero([c != y_name and d.kind in 'biuf'
+			for c, d in zip(df.columns, df.dtypes)])
+		other = np.setdiff1d(np.arange(df.shape[1]), numeric)
+		as_type = np.float64 if dtype == 'float64' else np.float32
+
+		parts, nnz = [df.iloc[:, other]], 0
+		for i in range(0, len(numeric), chunk):
+			block = df.iloc[:, numeric[i:i + chunk]].astype(as_type)
+			nnz += np.count_nonzero(block.values)
+			parts.append(block.astype(pd.SparseDtype(as_type, 0)))
+		print('Sparse features: %i x %i, %.1f%% non-zero' % (len(df),
+			len(numeric), 100.0 * nnz / max(1, len(df) * len(numeric))))
+		df = pd.concat(parts, axis=1)
+		positions = np.concatenate([other, numeric])
+		return df.iloc[:, np.argsort(positions, kind='stable')]
+
+	def NA_Mask(df, chunk=1000):
+		""" Rows and columns of df holding NAs, checked chunk dense columns
+		at a time and, for sparse columns (fill value 0), only in their
+		stored values, so no dense mask of the whole matrix is built.
+		Returns a boolean array over the rows and the list of columns """
+		rows = np.zeros(len(df), dtype=bool)
+		cols, dense = [], []
+		for i, d in enumerate(df.dtypes):
+			if not isinstance(d, pd.SparseDtype):
+				dense.append(i)
+				continue
+			values = df.iloc[:, i].array
+			if pd.isnull(values.fill_value):
+				na = np.flatnonzero(pd.isnull(np.asarray(values)))
+			else:
+				na = values.sp_index.indices[pd.isnull(values.sp_values)]
+			if len(na) > 0:
+				rows[na] = True
+				cols.append(df.columns[i])
+		for i in range(0, len(dense), chunk):
+			block = df.iloc[:, dense[i:i + chunk]].isna().values
+			rows |= block.any(axis=1)
+			cols.extend(df.columns[dense[i:i + chunk]][block.any(axis=0)])
+		positions = {c: i for i, c in enumerate(df.columns)}
+		return rows, sorted(cols, key=positions.get)
+
+	def Sparse_Frame(X, index, columns, chunk=1000):
+		""" Dataframe of sparse columns (fill value 0) from a scipy sparse
+		matrix, densifying chunk columns at a time """
+		X = X.tocsc()
+		dtype = pd.SparseDtype(X.dtype, 0)
+		return pd.concat([pd.DataFrame(X[:, i:i + chunk].toarray(),
+			index=index, columns=columns[i:i + chunk]).astype(dtype)
+			for i in range(0, X.shape[1], chunk)], axis=1)
+
+	def Is_Sparse(df, y_name='Class'):
+		""" True if all the feature columns of df (all but y_name) are
+		sparse (see To_Sparse) """
+		dtypes = [d for c, d in zip(df.columns, df.dtypes) if c != y_name]
+		return len(dtypes) > 0 and all(isinstance(d, pd.SparseDtype)
+			for d in dtypes)
+
+	def Feature_Matrix(df, y_name='Class'):
+		""" The features of df (all columns but y_name) as a numpy array, or
+		as a scipy CSR matrix if they are sparse """
+		X = df.drop([y_name], axis=1)
+		if fun.Is_Sparse(X, None):
+			return X.sparse.to_coo().tocsr()
+		return X.values
+
+	def Dense_Features(df, reason):
+		""" Dense copy of the sparse columns of df, for algorithms (reason)
+		that need dense input. Warns about the memory this takes """
+		sparse_cols = [i for i, d in enumerate(df.dtypes)
+			if isinstance(d, pd.SparseDtype)]
+		if len(sparse_cols) == 0:
+			return df
+		n_bytes = sum(len(df) * df.dtypes.iloc[i].subtype.itemsize
+			for i in sparse_cols)
+		print('WARNING: %s needs dense input. Converting the sparse features '
+			'to dense takes %.1f MB' % (reason, n_bytes / 1e6))
+		other = np.setdiff1d(np.arange(df.shape[1]), sparse_cols)
+		df = pd.concat([df.iloc[:, other],
+			df.iloc[:, sparse_cols].sparse.to_dense()], axis=1)
+		positions = np.concatenate([other, sparse_cols])
+		return df.iloc[:, np.argsort(positions, kind='stable')]
+
+	def Sketch_Add(sketch, values, weights=None, size=5000):
+		""" Merge values (with weights, default 1) into a median sketch,
+		a (values, weights) pair of sorted arrays (None to start one). The
+		sketch is exact until it holds more than 2 * size distinct values;
+		it is then compressed to size evenly spaced (by weight) values,
+		which keeps quantiles to within a small rank error. Sketches of
+		different chunks merge by adding one to the other """
+		if weights is None:
+			values, weights = np.unique(values, return_counts=True)
+		if sketch is not None:
+			values = np.concatenate([sketch[0], values])
+			weights = np.concatenate([sketch[1], weights])
+		values, inverse = np.unique(values, return_inverse=True)
+		weights = np.bincount(inverse.ravel(), weights=weights)
+		if len(values) > 2 * size:
+			cum = np.cumsum(weights)
+			pick = np.searchsorted(cum, (np.arange(size) + 0.5) * cum[-1] /
+				size)
+			values, inverse = np.unique(values[pick], return_inverse=True)
+			weights = np.bincount(inverse.ravel(), minlength=len(values)) * (
+				cum[-1] / size)
+		return values, weights
+
+	def Sketch_Median(sketch):
+		""" Median of the values in a sketch (see Sketch_Add), NaN if empty.
+		Exact (as pandas' median) while the sketch was not compressed """
+		if sketch is None or len(sketch[0]) == 0:
+			return np.nan
+		cum = np.cumsum(sketch[1])
+		n = cum[-1]
+		lo = sketch[0][np.searchsorted(cum, np.floor((n - 1) / 2), 'right')]
+		hi = sketch[0][np.searchsorted(cum, np.floor(n / 2), 'right')]
+		return (lo + hi) / 2
+
+	def Kind_Merge(kinds):
+		""" dtype kind of a column read as a whole from the kinds of its
+		chunks, as pandas infers it: strings (or booleans mixed with other
+		values) make it object (O), otherwise bool (b), int (i) or float (f) """
+		if 'O' in kinds or ('b' in kinds and len(kinds) > 1):
+			return 'O'
+		if kinds == {'b'} or kinds == {'i'}:
+			return kinds.pop()
+		return 'f'
+
+	def Preprocess_Scan(path, sep='\t', encoding=None, y_name='Class',
+		na_tokens=(), chunk=10000, dtype='float64', median=True,
+		values=()):
+		""" First pass of the streaming ML_preprocess.py (-chunk): read the
+		dataframe chunk rows at a time and collect, for each column, the
+		dtype kind pandas would give the whole column (kind), the NA count
+		(na), the sum and count of the numeric values (for means), whether
+		they are all 0/1 (binary), a median sketch (median=True), the value
+		counts of the string columns (counts) and the distinct values of
+		the numeric columns in values (to one-hot encode). Memory is bounded
+		by the chunk size plus these per-column summaries. na_tokens are
+		read as NaN """
+		from collections import Counter
+		as_type = 'float32' if dtype == 'uint8' else dtype
+		stats, kinds = None, None
+		for df in pd.read_csv(path, sep=sep, index_col=0, encoding=encoding,
+			chunksize=chunk, na_values=list(na_tokens)):
+			if stats is None:
+				columns = list(df.columns)
+				kinds = {c: set() for c in columns}
+				stats = {'index_name': df.index.name, 'columns': columns,
+					'n': 0, 'na': Counter(), 'sum': Counter(),
+					'count': Counter(), 'binary': {}, 'sketch': {},
+					'counts': {}, 'values': {}}
+			for c, d in zip(df.columns, df.dtypes):
+				kinds[c].add('i' if d.kind == 'u' else d.kind)
+			df = fun.Cast_Features(df, as_type, y_name)
+			stats['n'] += len(df)
+			stats['na'].update(df.isna().sum().to_dict())
+
+			strings = [c for c, d in zip(df.columns, df.dtypes)
+				if c != y_name and d.kind == 'O']
+			for c in strings:
+				stats['counts'].setdefault(c, Counter()).update(
+					df[c].value_counts().to_dict())
+			numeric = [c for c, d in zip(df.columns, df.dtypes)
+				if c != y_name and d.kind in 'biuf']
+			X = df[numeric].to_numpy(dtype=np.float64)
+			missing = np.isnan(X)
+			stats['sum'].update(dict(zip(numeric, np.nansum(X, axis=0))))
+			stats['count'].update(dict(zip(numeric, (~missing).sum(axis=0))))
+			binary = ((X == 0) | (X == 1) | missing).all(axis=0)
+			for c, b in zip(numeric, binary):
+				stats['binary'][c] = stats['binary'].get(c, True) and bool(b)
+			for k, c in enumerate(numeric):
+				v = X[~missing[:, k], k]
+				if median:
+					stats['sketch'][c] = fun.Sketch_Add(
+						stats['sketch'].get(c), v)
+				if c in values:
+					v = df[c].dropna().unique()
+					if c in stats['values']:
+						v = np.union1d(stats['values'][c], v)
+					stats['values'][c] = np.unique(v)
+
+		stats['kind'] = {c: fun.Kind_Merge(k) for c, k in kinds.items()}
+
+		# Columns that are strings as a whole but parsed as numbers in some
+		# chunks: count their values again, read as text
+		mixed = [c for c in columns if c != y_name and
+			stats['kind'][c] == 'O' and len(kinds[c]) > 1]
+		if len(mixed) > 0:
+			for c in mixed:
+				stats['counts'][c] = Counter()
+			for df in pd.read_csv(path, sep=sep, index_col=0,
+				encoding=encoding, chunksize=chunk, dtype=str,
+				usecols=[0] + [columns.index(c) + 1 for c in mixed],
+				na_values=list(na_tokens)):
+				for c in mixed:
+					stats['counts'][c].update(df[c].value_counts().to_dict())
+		return stats
+
+	def Impute_Fit(df, na_method='median', chunk=1000):
+		""" Fill values for the columns of df: the mode of each string
+		column, and the median or mean (na_method) of each numeric column,
+		computed with nan-aware reductions over blocks of chunk columns of
+		one dtype (so float32 columns are summarized as float32) """
+		import warnings
+		fill = {}
+		for c, d in zip(df.columns, df.dtypes):
+			if d.kind == 'O':
+				mode = df[c].mode()
+				if len(mode) > 0:
+					fill[c] = mode[0]
+		if na_method not in ['mean', 'median']:
+			return fill
+		reduce = np.nanmedian if na_method == 'median' else np.nanmean
+		groups = {}
+		for c, d in zip(df.columns, df.dtypes):
+			if d.kind in 'iuf' and not isinstance(d, pd.SparseDtype):
+				groups.setdefault(str(d), []).append(c)
+		with warnings.catch_warnings():
+			# All-NA columns get a NaN fill value
+			warnings.simplefilter('ignore', RuntimeWarning)
+			for cols in groups.values():
+				for i in range(0, len(cols), chunk):
+					block = np.asfortranarray(df[cols[i:i + chunk]].to_numpy())
+					fill.update(zip(cols[i:i + chunk], reduce(block, axis=0)))
+		return fill
+
+	def Impute_Apply(df, fill, chunk=1000):
+		""" Fill the NAs of df with the values in fill (see Impute_Fit):
+		float columns block-wise with np.where, string columns with fillna
+		(integer columns have no NAs). Columns without a fill value are left
+		as they are """
+		floats = [i for i, (c, d) in enumerate(zip(df.columns, df.dtypes))
+			if d.kind == 'f' and c in fill]
+		other = [c for c, d in zip(df.columns, df.dtypes)
+			if d.kind == 'O' and c in fill]
+		if len(other) > 0:
+			df = df.fillna({c: fill[c] for c in other})
+		if len(floats) == 0:
+			return df
+		parts, positions = [], []
+		for dtype in set(str(df.dtypes.iloc[i]) for i in floats):
+			cols = [i for i in floats if str(df.dtypes.iloc[i]) == dtype]
+			for i in range(0, len(cols), chunk):
+				block = df.iloc[:, cols[i:i + chunk]]
+				X = block.to_numpy()
+				values = np.array([fill[c] for c in block.columns],
+					dtype=X.dtype)
+				parts.append(pd.DataFrame(np.where(np.isnan(X), values, X),
+					index=df.index, columns=block.columns))
+				positions.extend(cols[i:i + chunk])
+		rest = np.setdiff1d(np.arange(df.shape[1]), positions)
+		df = pd.concat([df.iloc[:, rest]] + parts, axis=1)
+		return df.iloc[:, np.argsort(np.concatenate([rest, positions]),
+			kind='stable')]
+
+	def Imputer_Save(path, imputer):
+		""" Save a fitted imputer (na_method, the dropped columns and the
+		fill value of each column) as JSON, so held-out or -apply data can
+		be imputed the same way later (Imputer_Load) """
+		import json
+		fill = {str(c): fun.Json_Value(v) for c, v in imputer['fill'].items()}
+		with open(path, 'w') as f:
+			json.dump({'version': 1, 'na_method': imputer['na_method'],
+				'drop': [str(c) for c in imputer['drop']], 'fill': fill}, f)
+
+	def Imputer_Load(path):
+		""" Load an imputer saved by Imputer_Save """
+		import json
+		with open(path) as f:
+			imputer = json.load(f)
+		imputer['fill'] = {c: np.nan if v is None else v
+			for c, v in imputer['fill'].items()}
+		return imputer
+
+	def Onehot_Fit(df, cols):
+		""" Vocabulary of each column in cols to one-hot encode: its sorted
+		distinct values (NAs excluded), the columns pd.get_dummies makes """
+		vocab = {}
+		for col in cols:
+			values = df[col].dropna().unique()
+			if df[col].dtype.kind == 'O':
+				vocab[col] = sorted(values)
+			else:
+				vocab[col] = np.unique(values)
+		return vocab
+
+	def Onehot_Apply(df, vocab, sparse=False):
+		""" Replace each column of vocab with one 0/1 (uint8) column per value
+		in its vocabulary ([column]_[value], as pd.get_dummies names them),
+		appended after the other columns. All the columns are built in one
+		array (a scipy sparse matrix when sparse=True), so every batch
+		encoded with the same vocab gets the same columns. NAs and values
+		not in the vocabulary get all 0s. Returns the encoded dataframe and
+		the number of values not in the vocabulary """
+		import scipy.sparse
+		names, rows, cols, offset, unseen = [], [], [], 0, 0
+		for col, categories in vocab.items():
+			codes = pd.Categorical(df[col], categories=categories).codes
+			unseen += int(((codes < 0) & df[col].notna().values).sum())
+			hit = np.flatnonzero(codes >= 0)
+			rows.append(hit)
+			cols.append(codes[hit].astype(np.int64) + offset)
+			names.extend('%s_%s' % (col, c) for c in categories)
+			offset += len(categories)
+		rows = np.concatenate(rows) if len(rows) > 0 else np.zeros(0, int)
+		cols = np.concatenate(cols) if len(cols) > 0 else np.zeros(0, int)
+		if sparse:
+			X = scipy.sparse.csc_matrix((np.ones(len(rows), dtype=np.uint8),
+				(rows, cols)), shape=(len(df), offset))
+			dummies = pd.DataFrame.sparse.from_spmatrix(X, index=df.index,
+				columns=names)
+		else:
+			X = np.zeros((len(df), offset), dtype=np.uint8)
+			X[rows, cols] = 1
+			dummies = pd.DataFrame(X, index=df.index, columns=names)
+		df = df.drop(list(vocab), axis=1)
+		return pd.concat([df, dummies], axis=1), unseen
+
+	def Onehot_Save(path, vocab):
+		""" Save one-hot vocabularies (Onehot_Fit) as JSON, so new batches
+		are encoded with the same columns (Onehot_Load) """
+		import json
+		with open(path, 'w') as f:
+			json.dump({'version': 1, 'vocab': {str(c): [fun.Json_Value(v)
+				for v in values] for c, values in vocab.items()}}, f)
+
+	def Onehot_Load(path):
+		""" Load the vocabularies saved by Onehot_Save """
+		import json
+		with open(path) as f:
+			vocab = json.load(f)['vocab']
+		return {c: values if all(isinstance(v, str) for v in values)
+			else np.asarray(values) for c, values in vocab.items()}
+
+	def Preprocess_Apply(df, plan):
+		""" Second pass of the streaming ML_preprocess.py: apply the plan
+		made from Preprocess_Scan (y_name, dtype, drop, fill, onehot {column:
+		categories}, sparse, binary, keep, drop_cols) to one chunk (parsed
+		with na_values=plan['na_tokens']), the same way the in-memory path
+		transforms the whole dataframe. Returns the class column and the
+		features (the class column is None if df has none) """
+		y_name, dtype = plan['y_name'], plan['dtype']
+		df = fun.Cast_Features(df, 'float32' if dtype == 'uint8' else dtype,
+			y_name)
+		df_classes = df[y_name] if y_name in df.columns else None
+		df = df.drop([c for c in [y_name] + plan['drop'] if c in df.columns],
+			axis=1)
+		df = fun.Impute_Apply(df, plan['fill'])
+		binary = list(plan['binary'])
+		if len(plan['onehot']) > 0:
+			n = df.shape[1] - len(plan['onehot'])
+			df, unseen = fun.Onehot_Apply(df, plan['onehot'], plan['sparse'])
+			binary.extend(df.columns[n:])
+		df = fun.Cast_Features(df, dtype, y_name, binary=binary)
+		if plan['keep'] is not None:
+			df = df.loc[:, plan['keep']]
+		if len(plan['drop_cols']) > 0:
+			df = df.drop(plan['drop_cols'], axis=1)
+		return df_classes, df
+
+	def Scale_Fit(X):
+		""" Fit the feature scaling of the drivers (-x_norm/-norm) on X:
+		min/max scaling (sklearn MinMaxScaler), or scaling by the max
+		absolute value (MaxAbsScaler) if X is sparse, so it is not
+		densified. Returns the fitted values (see Scale_Apply) """
+		from sklearn import preprocessing
+		if fun.Is_Sparse(X, None):
+			scaler = preprocessing.MaxAbsScaler().fit(X.sparse.to_coo().tocsr())
+			return {'kind': 'maxabs', 'scale': scaler.scale_}
+		scaler = preprocessing.MinMaxScaler().fit(X)
+		return {'kind': 'minmax', 'scale': scaler.scale_, 'min': scaler.min_}
+
+	def Scale_Apply(X, scale):
+		""" Scale the columns of X with the values fitted by Scale_Fit (the
+		same operations as the sklearn scaler's transform) """
+		from sklearn.utils.sparsefuncs import inplace_column_scale
+		if fun.Is_Sparse(X, None):
+			X_scaled = X.sparse.to_coo().tocsr().astype(
+				np.asarray(scale['scale']).dtype)
+			inplace_column_scale(X_scaled, 1.0 / np.asarray(scale['scale']))
+			return fun.Sparse_Frame(X_scaled, X.index, X.columns)
+		X_scaled = X.to_numpy()
+		if X_scaled.dtype not in (np.float32, np.float64):
+			X_scaled = X_scaled.astype(np.float64)
+		factor = np.asarray(scale['scale'], dtype=X_scaled.dtype)
+		if scale['kind'] == 'maxabs':
+			X_scaled = X_scaled / factor
+		else:
+			X_scaled = X_scaled * factor
+			X_scaled += np.asarray(scale['min'], dtype=X_scaled.dtype)
+		return pd.DataFrame(X_scaled, columns=X.columns, index=X.index)
+
+	def Transform_Apply(df, transform):
+		""" Apply a fitted transform (Transform_Save) to a batch of new
+		instances parsed with na_values=transform['na_tokens']: the drops,
+		fills and one-hot encoding of ML_preprocess.py (Preprocess_Apply),
+		the feature columns of the model, in its order (keep), then the
+		scaling fitted by the driver (scale), if any. Each batch is
+		transformed independently, so data can be transformed in chunks.
+		Returns the class column (None if df has none) and the features """
+		df_classes, df = fun.Preprocess_Apply(df, transform)
+		if transform.get('scale') is not None:
+			df = fun.Scale_Apply(df, transform['scale'])
+			df = fun.Cast_Features(df, transform['dtype'], transform['y_name'],
+				binary=transform['binary'])
+		return df_classes, df
+
+	def Transform_New(y_name='Class', dtype='float64', kinds=None):
+		""" A transform (see Transform_Apply) that only selects the feature
+		columns, for data that was not preprocessed with a saved transform.
+		kinds: the dtype kind of each input column ('O' columns are read as
+		text and 'f' columns as floats by ML_transform.py, so every chunk
+		gets the same dtypes) """
+		kinds = kinds or {}
+		return {'na_tokens': [], 'y_name': y_name, 'dtype': dtype, 'drop': [],
+			'fill': {}, 'onehot': {}, 'binary': [], 'sparse': False,
+			'keep': list(kinds), 'drop_cols': [], 'scale': None, 'kinds': kinds}
+
+	def Transform_Save(path, transform):
+		""" Save a fitted transform (the plan of Preprocess_Apply, plus the
+		scale of Scale_Fit) as JSON """
+		import json
+		out = dict(transform)
+		out['fill'] = {str(c): fun.Json_Value(v)
+			for c, v in transform['fill'].items()}
+		out['onehot'] = {str(c): [fun.Json_Value(v) for v in values]
+			for c, values in transform['onehot'].items()}
+		for key in ['drop', 'binary', 'keep', 'drop_cols']:
+			if out.get(key) is not None:
+				out[key] = [str(c) for c in out[key]]
+		if transform.get('scale') is not None:
+			out['scale'] = {k: v if k == 'kind' else np.asarray(v).tolist()
+				for k, v in transform['scale'].items()}
+		out['version'] = 1
+		with open(path, 'w') as f:
+			json.dump(out, f)
+
+	def Transform_Load(path):
+		""" Load a transform saved by Transform_Save """
+		import json
+		with open(path) as f:
+			transform = json.load(f)
+		transform['fill'] = {c: np.nan if v is None else v
+			for c, v in transform['fill'].items()}
+		transform['onehot'] = {c: values if all(isinstance(v, str)
+			for v in values) else np.asarray(values)
+			for c, values in transform['onehot'].items()}
+		return transform
+
+	def Json_Value(v):
+		""" v as a JSON value: numpy scalars as python numbers, NaN as None """
+		if isinstance(v, np.generic):
+			v = v.item()
+		return None if isinstance(v, float) and np.isnan(v) else v
+
+	def Redundant_Fit(df, y_name='Class', near_constant=1.0, dups=True,
+		chunk=1000):
+		""" Find the numeric feature columns of df (all but y_name) that are
+		constant (one distinct non-NA value, or all NA), near-constant (one
+		value in more than near_constant of the non-NA rows) or, if dups,
+		exact duplicates of an earlier column. The columns are summarized
+		chunk at a time with vectorized reductions over the sorted values,
+		and duplicates are found by hashing the content of each column, so
+		columns are never compared pairwise (only to the one with the same
+		hash). Returns {column removed: (reason, column kept)}, reason being
+		constant, near_constant or duplicate """
+		import hashlib
+		numeric = [c for c, d in zip(df.columns, df.dtypes)
+			if c != y_name and d.kind in 'biuf']
+		removed, seen = {}, {}
+		for i in range(0, len(numeric), chunk):
+			cols = numeric[i:i + chunk]
+			# A copy: the values of a one-block frame can be read-only
+			X = np.array(df[cols].to_numpy(dtype=np.float64), order='F')
+			S = np.sort(X, axis=0)
+			count = (~np.isnan(S)).sum(axis=0)
+
+			# Longest run of one value in each sorted column (NAs sort last
+			# and are never equal)
+			rows = np.arange(len(S))[:, None]
+			new = np.ones(S.shape, dtype=bool)
+			new[1:] = S[1:] != S[:-1]
+			start = np.maximum.accumulate(np.where(new, rows, 0), axis=0)
+			top = (rows - start + 1).max(axis=0) if len(S) > 0 else count
+			constant = (count == 0) | (top == count)
+			near = ~constant & (top > near_constant * count)
+			for c in np.asarray(cols)[constant]:
+				removed[c] = ('constant', '')
+			for c in np.asarray(cols)[near]:
+				removed[c] = ('near_constant', '')
+			if not dups:
+				continue
+
+			# -0.0 and 0.0 (and all NaNs) hash the same
+			X += 0.0
+			X[np.isnan(X)] = np.nan
+			for j in np.flatnonzero(~constant & ~near):
+				key = hashlib.blake2b(X[:, j].tobytes(), digest_size=16).digest()
+				if key in seen and np.array_equal(X[:, j],
+					df[seen[key]].to_numpy(dtype=np.float64), equal_nan=True):
+					removed[cols[j]] = ('duplicate', seen[key])
+				else:
+					seen.setdefault(key, cols[j])
+		return removed
+
+	def Redundant_Save(path, removed):
+		""" Write the columns removed by Redundant_Fit (feature, reason, and
+		for duplicates the feature kept in its place) as a tab-separated
+		file """
+		with open(path, 'w') as f:
+			f.write('feature\treason\tkept_as\n')
+			for c, (reason, kept) in removed.items():
+				f.write('%s\t%s\t%s\n' % (c, reason, kept))
+
+	def Redundant_Load(path):
+		""" Read a file written by Redundant_Save """
+		removed = pd.read_csv(path, sep='\t', dtype=str,
+			keep_default_na=False, index_col=0)
+		return {c: (r, k) for c, r, k in zip(removed.index, removed['reason'],
+			removed['kept_as'])}
+
+	def Expand_Importance(imp, removed):
+		""" Add the duplicate features removed by Redundant_Fit back to
+		importance scores (a dataframe or series indexed by feature), each
+		with the scores of the feature kept in its place. Constant and
+		near-constant features are not added """
+		dups = [(c, kept) for c, (reason, kept) in removed.items()
+			if reason == 'duplicate' and kept in imp.index]
+		if len(dups) == 0:
+			return imp
+		extra = imp.loc[[kept for c, kept in dups]]
+		extra.index = [c for c, kept in dups]
+		return pd.concat([imp, extra])
+
+	def Univariate_Score(df, y, kind='c', y_name='Class', chunk=1000,
+		features=None):
+		""" Association of each numeric feature column of df (all but
+		y_name, or the columns in features) with y, over the rows where y
+		is not NA: the ANOVA F of the classes (kind 'c') or the absolute
+		Pearson correlation (kind 'r'). NAs count as the column mean.
+		Computed chunk columns at a time """
+		import warnings
+		from sklearn.feature_selection import f_classif
+		cols = features
+		if cols is None:
+			cols = [c for c, d in zip(df.columns, df.dtypes)
+				if c != y_name and d.kind in 'biuf']
+		rows = np.flatnonzero(pd.notnull(y))
+		y = np.asarray(y)[rows]
+		if kind == 'r':
+			y = y.astype(np.float64) - y.astype(np.float64).mean()
+			y /= np.linalg.norm(y) or 1.0
+		score = np.zeros(len(cols))
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore', RuntimeWarning)
+			warnings.simplefilter('ignore', UserWarning)
+			for i in range(0, len(cols), chunk):
+				X = df[cols[i:i + chunk]].to_numpy(dtype=np.float64,
+					copy=True)[rows]
+				X -= np.nanmean(X, axis=0)
+				X[np.isnan(X)] = 0
+				if kind == 'r':
+					norm = np.linalg.norm(X, axis=0)
+					norm[norm == 0] = 1
+					score[i:i + chunk] = np.abs(y @ X) / norm
+				else:
+					score[i:i + chunk] = np.nan_to_num(f_classif(X, y)[0])
+		return pd.Series(score, index=cols)
+
+	def Corr_Prune(df, threshold=0.9, order=None, y_name='Class', block=2000,
+		mmap_dir=None, features=None):
+		""" Greedy pruning of correlated numeric feature columns of df (all
+		but y_name, or the columns in features): features are taken in
+		order (positions among the features, e.g. best Univariate_Score
+		first; default: column order), and a feature is removed if |r| >
+		threshold with one kept before it.
+		The columns are standardized once (NAs count as the column mean)
+		into a float32 memory-mapped matrix in mmap_dir (default: the system
+		temp dir), and correlations are computed block columns at a time as
+		matrix products (multithreaded by BLAS), so memory is bounded by the
+		block size, not by the number of features. Returns {column removed:
+		('correlated', column kept)} """
+		import tempfile, warnings
+		cols = features
+		if cols is None:
+			cols = [c for c, d in zip(df.columns, df.dtypes)
+				if c != y_name and d.kind in 'biuf']
+		order = np.arange(len(cols)) if order is None else np.asarray(order)
+		n, p = len(df), len(cols)
+		paths = []
+		for name in ['Z', 'K']:
+			fd, path = tempfile.mkstemp(prefix='ML_%s_' % name, suffix='.npy',
+				dir=mmap_dir)
+			os.close(fd)
+			paths.append(path)
+		removed, kept = {}, []
+		try:
+			# Z: standardized columns (unit norm), in the order to consider
+			Z = np.lib.format.open_memmap(paths[0], mode='w+', dtype=np.float32,
+				shape=(n, p), fortran_order=True)
+			with warnings.catch_warnings():
+				warnings.simplefilter('ignore', RuntimeWarning)
+				for i in range(0, p, block):
+					X = df[[cols[k] for k in order[i:i + block]]].to_numpy(
+						dtype=np.float64, copy=True)
+					X -= np.nanmean(X, axis=0)
+					X[np.isnan(X)] = 0
+					norm = np.linalg.norm(X, axis=0)
+					norm[norm == 0] = 1
+					Z[:, i:i + block] = X / norm
+
+			# K: the kept columns, so they can be read in contiguous blocks
+			K = np.lib.format.open_memmap(paths[1], mode='w+', dtype=np.float32,
+				shape=(n, p), fortran_order=True)
+			for i in range(0, p, block):
+				Zb = np.array(Z[:, i:i + block])
+				m = Zb.shape[1]
+				alive = np.ones(m, dtype=bool)
+				match = np.full(m, -1)
+				for j in range(0, len(kept), block):
+					R = np.abs(K[:, j:min(j + block, len(kept))].T @ Zb)
+					hit = alive & (R > threshold).any(axis=0)
+					match[hit] = j + R[:, hit].argmax(axis=0)
+					alive &= ~hit
+				C = np.abs(Zb.T @ Zb)
+				for k in np.flatnonzero(alive):
+					if not alive[k]:
+						continue
+					hit = alive & (C[k] > threshold)
+					hit[:k + 1] = False
+					match[hit] = len(kept)
+					alive &= ~hit
+					K[:, len(kept)] = Zb[:, k]
+					kept.append(cols[order[i + k]])
+				for k in np.flatnonzero(match >= 0):
+					removed[cols[order[i + k]]] = ('correlated', kept[match[k]])
+			del Z, K
+		finally:
+			for path in paths:
+				fun.Shared_Matrix_Free(path)
+		return removed
+
+	def Shared_Matrix(X, mmap_dir=None):
+		""" Copy X to a read-only memory-mapped .npy file in mmap_dir
+		(default: the system temp dir; e.g. node-local /tmp, or /dev/shm for
+		shared memory). Worker processes that receive the memmap attach to
+		the file by name and slice rows from it, instead of each getting a
+		pickled copy. Remove the file with Shared_Matrix_Free; it is also
+		removed when the script exits """
+		import atexit, tempfile
+		fd, path = tempfile.mkstemp(prefix='ML_X_', suffix='.npy',
+			dir=mmap_dir)
+		os.close(fd)
+		np.save(path, np.ascontiguousarray(X))
+		atexit.register(fun.Shared_Matrix_Free, path)
+		return np.load(path, mmap_mode='r')
+
+	def Shared_Matrix_Free(path):
+		""" Remove the file behind a Shared_Matrix (path or memmap) """
+		if isinstance(path, np.memmap):
+			path = path.filename
+		try:
+			os.remove(path)
+		except OSError:
+			pass
+
+	def EstablishBalanced(df, classes, min_size, gs_n, seed=None):
+		""" Defines which instances will be used for each balanced dataset.
+		Returns a (gs_n x len(classes)*min_size) int32 matrix of row positions
+		in df, sorted within each replicate so rows keep their df order.
+		Replicate j is drawn from its own child of SeedSequence(seed), so the
+		first replicates stay the same when gs_n grows """
+		y = df['Class'].values
+		cl_pos = []
 		for cl in classes:
-			cl_ids = list(df[df["Class"] == cl].index)
-			class_ids_dict[cl] = cl_ids
-
-		# Build a list of lists containing the IDs for balanced datasets
-		bal_list = []
-		for j in range(gs_n):
-			tmp_l = []
-			for cl in class_ids_dict:
-				bal_samp = rn.sample(class_ids_dict[cl], min_size)
-				tmp_l = tmp_l + bal_samp
-			bal_list.append(tmp_l)
-		return bal_list
+			cl_pos.append(np.flatnonzero(y == cl))
+			if len(cl_pos[-1]) < min_size:
+				raise ValueError('Class %s has fewer than %i instances' % (cl,
+					min_size))
+
+		bal = np.empty((gs_n, len(classes) * min_size), dtype=np.int32)
+		for j, rep_seed in enumerate(np.random.SeedSequence(seed).spawn(gs_n)):
+			rng = np.random.default_rng(rep_seed)
+			for k in range(len(classes)):
+				# Draw min_size instances by ranking random keys
+				keys = rng.random(len(cl_pos[k]), dtype=np.float32)
+				pick = keys.argpartition(min_size - 1)[:min_size]
+				bal[j, k * min_size:(k + 1) * min_size] = cl_pos[k][pick]
+		bal.sort(axis=1)
+		return bal
+
+	def CSV_Blocks(obj, cells=1000000, **kwargs):
+		""" Yield the to_csv text of a DataFrame/Series in blocks of rows
+		(about cells values per block), so only one block is held in memory.
+		The header (kwargs header, default True) is only in the first block,
+		and the blocks joined are the same text as obj.to_csv(**kwargs) """
+		header = kwargs.pop('header', True)
+		width = obj.shape[1] if obj.ndim > 1 else 1
+		rows = max(1, cells // max(1, width))
+		for start in range(0, max(len(obj), 1), rows):
+			yield obj.iloc[start:start + rows].to_csv(
+				header=header if start == 0 else False, **kwargs)
+
+	def Write_CSV(obj, out, cells=1000000, **kwargs):
+		""" Stream obj.to_csv(out, **kwargs) to out (a path or an open file)
+		block by block (see CSV_Blocks) """
+		f = open(out, 'w') if isinstance(out, str) else out
+		try:
+			for block in fun.CSV_Blocks(obj, cells, **kwargs):
+				f.write(block)
+		finally:
+			if f is not out:
+				f.close()
+
+	def Save_BalancedIDs(SAVE, index, balanced_ids, block=100):
+		""" Save the balanced datasets as the legacy tab-delimited ID table
+		(one replicate per line, written block replicates at a time) and as
+		a compact .npz holding each ID once plus the int32 position matrix """
+		ids = np.asarray(index.astype(str), dtype=str)
+		with open(SAVE + '_BalancedIDs', 'w') as out:
+			for start in range(0, len(balanced_ids), block):
+				pd.DataFrame(ids[balanced_ids[start:start + block]]).to_csv(
+					out, index=False, header=False, sep="\t")
+		np.savez_compressed(SAVE + '_BalancedIDs.npz', ids=ids,
+			pos=balanced_ids)
 
 	def param_space(ALG, GS_TYPE, n):
 		"Define the parameter space for the grid search."
@@ -99,89 +1215,333 @@ class fun(object):
 
 		return parameters
 
+	def GS_Cache_Open(path):
+		""" Open (or create) the SQLite grid search cache. Holds one test
+		score per (data, features, alg, scoring, cv, params, rep, fold) """
+		import sqlite3
+		cache = sqlite3.connect(path)
+		cache.execute('CREATE TABLE IF NOT EXISTS gs_scores (data TEXT, '
+			'features TEXT, alg TEXT, scoring TEXT, cv INTEGER, params TEXT, '
+			'rep TEXT, fold INTEGER, test_score REAL, PRIMARY KEY (data, '
+			'features, alg, scoring, cv, params, rep, fold))')
+		cache.commit()
+		return cache
+
+	def GS_Fingerprint(*arrays):
+		""" sha1 hex digest of the contents of the given arrays """
+		import hashlib
+		h = hashlib.sha1()
+		from scipy import sparse
+		for a in arrays:
+			if sparse.issparse(a):
+				a = a.tocsr()
+				a.sort_indices()
+				h.update(str(('csr', a.shape)).encode())
+				for part in [a.data, a.indices, a.indptr]:
+					h.update(np.ascontiguousarray(part).tobytes())
+				continue
+			a = np.asarray(a)
+			if a.dtype == object:
+				a = a.astype(str)
+			h.update(str((a.dtype.str, a.shape)).encode())
+			h.update(np.ascontiguousarray(a).tobytes())
+		return h.hexdigest()
+
+	def GS_Fold_Score(model, params, X, y, train, test, scorer,
+		pin_threads=False, path=None):
+		""" One grid search task: fit model with params on the train rows of
+		X and score it on the test rows. path = (name, values) refits one
+		model through the sorted values of parameter name, scoring it at
+		each, with warm_start when the model has it (n_estimators for RF/GB
+		grows the ensemble, C for LogReg starts from the previous
+		coefficients). A grown RF/GB ensemble is the one a separate fit with
+		the same random_state gives; the search models are unseeded, so, as
+		with separate fits, each score is one random draw. Returns a list of
+		scores, one per path value. With pin_threads, BLAS/OpenMP use one
+		thread so pool workers do not oversubscribe the node """
+		from sklearn.base import clone
+		limits = None
+		if pin_threads:
+			try:
+				from threadpoolctl import threadpool_limits
+				limits = threadpool_limits(limits=1)
+			except ImportError:
+				pass
+
+		X_train, y_train = X[train], y.take(train)
+		X_test, y_test = X[test], y.take(test)
+		est = clone(model).set_params(**params)
+		if path is None:
+			name, values = None, [None]
+		else:
+			name, values = path
+			if 'warm_start' in est.get_params():
+				est.set_params(warm_start=True)
+
+		# A fit that fails scores NaN, as with GridSearchCV(error_score=nan)
+		scores = []
+		for value in values:
+			try:
+				if name is not None:
+					est.set_params(**{name: value})
+				est.fit(X_train, y_train)
+				scores.append(float(scorer(est, X_test, y_test)))
+			except Exception as e:
+				print('Grid search fit failed (%s), score set to NaN: %s' %
+					(params, e))
+				scores.append(np.nan)
+
+		if limits is not None:
+			limits.restore_original_limits()
+		return scores
+
+	def GS_Scores(model, rep_candidates, X, y, get_rows, gs_score, cv_num,
+		n_jobs, cache=None, get_key=None, path_param=None, mmap_dir=None):
+		""" Score candidate parameter sets with cv_num-fold CV (same folds and
+		scorer as GridSearchCV) on several grid search reps. rep_candidates is
+		a list of (rep, candidates), get_rows(rep) gives the rows of X/y in
+		that rep. All (rep x candidate x fold) fits go to one queue run by a
+		single pool of n_jobs workers, so there is no barrier between reps.
+		With a cache, fold scores already stored under get_key(rep) (data,
+		features, alg, scoring, cv, rep) are reused and new ones are added.
+		With path_param, candidates that differ only in that parameter share
+		one warm-started fit per fold (see GS_Fold_Score). With n_jobs > 1, X
+		is shared with the workers as a memory map in mmap_dir.
+		Returns rep, params and mean_test_score for every (rep, candidate),
+		in order """
+		import json
+		from sklearn.base import clone, is_classifier
+		from sklearn.metrics import check_scoring
+		from sklearn.model_selection import check_cv
+		try:
+			from joblib import Parallel, delayed
+		except ImportError:
+			from sklearn.externals.joblib import Parallel, delayed
+
+		scorer = check_scoring(model, scoring=gs_score)
+		pin_threads = n_jobs != 1
+		if pin_threads and 'n_jobs' in model.get_params():
+			model = clone(model).set_params(n_jobs=1)
+
+		# Queue the (rep, candidate, fold) cells that are not cached. A task
+		# is (params, path values, [(cell, fold)], train, test); cells on the
+		# same path (same rep, fold and other params) share one task
+		fold_scores, tasks, paths = [], [], {}
+		for j, candidates in rep_candidates:
+			cached = {}
+			if cache is not None:
+				for params, fold, test_score in cache.execute('SELECT params, '
+					'fold, test_score FROM gs_scores WHERE data=? AND '
+					'features=? AND alg=? AND scoring=? AND cv=? AND rep=?',
+					get_key(j)):
+					# SQLite stores NaN (failed fits) as NULL
+					cached.setdefault(params, {})[fold] = (np.nan if
+						test_score is None else test_score)
+
+			rows = get_rows(j)
+			folds = list(check_cv(cv_num, y[rows],
+				classifier=is_classifier(model)).split(rows, y[rows]))
+			for c in candidates:
+				key = json.dumps(c, sort_keys=True, default=str)
+				scores = cached.get(key, {})
+				fold_scores.append((j, c, key, scores))
+				for fold in range(cv_num):
+					if fold in scores:
+						continue
+					cell = (len(fold_scores) - 1, fold)
+					train, test = folds[fold]
+					if path_param is None or path_param not in c:
+						tasks.append((c, None, [cell], rows[train], rows[test]))
+						continue
+					base = dict(c)
+					value = base.pop(path_param)
+					path_key = (j, fold, json.dumps(base, sort_keys=True,
+						default=str))
+					if path_key not in paths:
+						paths[path_key] = len(tasks)
+						tasks.append((base, [], [], rows[train], rows[test]))
+					tasks[paths[path_key]][1].append(value)
+					tasks[paths[path_key]][2].append(cell)
+
+		# Path values are run in increasing order
+		for t, task in enumerate(tasks):
+			if task[1] is not None:
+				order = np.argsort(task[1], kind='stable')
+				tasks[t] = (task[0], (path_param, [task[1][i] for i in order]),
+					[task[2][i] for i in order], task[3], task[4])
+
+		n_todo = sum(len(task[2]) for task in tasks)
+		print("Grid search: %i of %i fold scores cached, %i to run in %i fits"
+			% (len(fold_scores) * cv_num - n_todo, len(fold_scores) * cv_num,
+			n_todo, len(tasks)))
+
+		from scipy import sparse
+		shared = pin_threads and len(tasks) > 0 and not isinstance(X,
+			np.memmap) and not sparse.issparse(X)
+		if shared:
+			# Workers share one memory-mapped copy of X
+			X = fun.Shared_Matrix(X, mmap_dir)
+
+		# Run the queue in chunks so finished scores reach the cache
+		chunk = max(100, 100 * n_jobs)
+		with Parallel(n_jobs=n_jobs, pre_dispatch='2*n_jobs') as parallel:
+			for start in range(0, len(tasks), chunk):
+				batch = tasks[start:start + chunk]
+				results = parallel(delayed(fun.GS_Fold_Score)(model, params,
+					X, y, train, test, scorer, pin_threads, path)
+					for params, path, cells, train, test in batch)
+
+				new = []
+				for task, task_scores in zip(batch, results):
+					for (i, fold), test_score in zip(task[2], task_scores):
+						j, c, key, scores = fold_scores[i]
+						scores[fold] = test_score
+						if cache is not None:
+							new.append(get_key(j)[:5] + (key, get_key(j)[5],
+								fold, test_score))
+				if cache is not None:
+					cache.executemany('INSERT OR REPLACE INTO gs_scores VALUES '
+						'(?, ?, ?, ?, ?, ?, ?, ?, ?)', new)
+					cache.commit()
+
+		if shared:
+			fun.Shared_Matrix_Free(X)
+
+		# Rows are numbered within each rep, like GridSearchCV.cv_results_
+		gs_results = pd.DataFrame({'rep': [f[0] for f in fold_scores],
+			'params': [f[1] for f in fold_scores],
+			'mean_test_score': [np.mean([f[3][fold] for fold in range(cv_num)])
+				for f in fold_scores]})
+		gs_results.index = gs_results.groupby('rep').cumcount().values
+		return gs_results
+
 	def GridSearch(df, SAVE, ALG, classes, min_size, gs_score, n, cv_num,
-		n_jobs, GS_REPS, GS_TYPE, POS, NEG, gs_full):
-		""" Perform a parameter sweep using GridSearchCV from SK-learn.
-		Need to edit the hard code to modify what parameters are searched
+		n_jobs, GS_REPS, GS_TYPE, POS, NEG, gs_full, seed=None, gs_cache='',
+		gs_warm=False, mmap_dir=None):
+		""" Perform a parameter sweep with the GridSearchCV folds and scoring
+		from SK-learn (see GS_Scores). Need to edit the hard code to modify
+		what parameters are searched. If gs_cache is a path, fold scores are
+		cached there and a rerun only fits what is missing. With gs_warm, RF
+		and GB grow one ensemble per fold through the n_estimators values and
+		LogReg runs one regularization path per fold over the sorted C values
 		"""
-		from sklearn.model_selection import GridSearchCV
-		from sklearn.model_selection import RandomizedSearchCV
+		from sklearn.model_selection import ParameterGrid
+		from sklearn.model_selection import ParameterSampler
 		from sklearn.preprocessing import StandardScaler
+		from scipy import sparse
 
 		start_time = time.time()
 		n_iter = 10
 		parameters = fun.param_space(ALG, GS_TYPE, n_iter)
 
-		gs_results = pd.DataFrame(columns=['mean_test_score', 'params'])
-		
-		bal_ids_list = []
-		for j in range(n):
-			# Build balanced dataframe and define x & y
-			df1 = pd.DataFrame(columns=list(df))
-			for cl in classes:
-				temp = df[df['Class'] == cl].sample(min_size, random_state=j)
-				df1 = pd.concat([df1, temp])
-			
-			bal_ids_list.append(list(df1.index))
-
-			if j < GS_REPS:
-				print("Round %s of %s"%(j+1,GS_REPS))
-				y = df1['Class']
-				x = df1.drop(['Class'], axis=1)
-				
-				# Build model, run grid search 10-fold CV, and fit
-				if ALG.lower() == 'rf':
-					from sklearn.ensemble import RandomForestClassifier
-					model = RandomForestClassifier()
-				elif ALG.lower() == "svm":
-					from sklearn.svm import LinearSVC
-					model = LinearSVC()
-				elif ALG.lower() == 'svmrbf' or ALG.lower() == 'svmpoly':
-					from sklearn.svm import SVC
-					# x = StandardScaler().fit_transform(x)
-					model = SVC(probability=True)
-				elif ALG.lower() == "logreg":
-					from sklearn.linear_model import LogisticRegression
-					model = LogisticRegression()
-				elif ALG.lower() == "gb":
-					from sklearn.ensemble import GradientBoostingClassifier
-					model = GradientBoostingClassifier()
-				
-				if gs_score.lower() == 'auprc':
-					gs_score = 'average_precision'
+		# Balanced datasets for all n replicates (the first GS_REPS are used
+		# for the search), sliced by position from one feature matrix
+		bal_ids_list = fun.EstablishBalanced(df, classes, min_size, n, seed)
+		X_all = fun.Feature_Matrix(df)
+		if not sparse.issparse(X_all):
+			X_all = np.ascontiguousarray(X_all)
+		y_all = df['Class'].values
+
+		# Build model
+		if ALG.lower() == 'rf':
+			from sklearn.ensemble import RandomForestClassifier
+			model = RandomForestClassifier()
+		elif ALG.lower() == "svm":
+			from sklearn.svm import LinearSVC
+			model = LinearSVC()
+		elif ALG.lower() == 'svmrbf' or ALG.lower() == 'svmpoly':
+			from sklearn.svm import SVC
+			# x = StandardScaler().fit_transform(x)
+			model = SVC(probability=True)
+		elif ALG.lower() == "logreg":
+			from sklearn.linear_model import LogisticRegression
+			model = LogisticRegression()
+		elif ALG.lower() == "gb":
+			from sklearn.ensemble import GradientBoostingClassifier
+			model = GradientBoostingClassifier()
+
+		if gs_score.lower() == 'auprc':
+			gs_score = 'average_precision'
+
+		if gs_warm and ALG.lower() in ['rf', 'gb']:
+			path_param = 'n_estimators'
+		elif gs_warm and ALG.lower() == 'logreg':
+			# liblinear cannot warm start: LogReg paths use saga (l1 and l2),
+			# which has no intercept_scaling, so only one value is searched
+			# (the final models are fit with saga too, see DefineClf_LogReg).
+			# LinearSVC has no warm start, so SVM keeps one task per C value
+			path_param = 'C'
+			model.set_params(solver='saga')
+			parameters['intercept_scaling'] = [1]
+		else:
+			path_param = None
 
+		if len(classes) == 2:
+			y_gs = pd.Series(y_all).replace(to_replace=[POS, NEG],
+				value=[1, 0]).values
+		else:
+			y_gs = y_all
+
+		# Cached scores are keyed by the data, the features, the search
+		# settings (including the solver, saga for -gs_warm LogReg) and
+		# (seed, rep): the balanced datasets of a seeded run are the same on
+		# a rerun. Unseeded draws never repeat, so they are not cached
+		if gs_cache != '' and seed is None:
+			print('Grid search cache not used: the balanced datasets are not '
+				'seeded')
+		if gs_cache != '' and seed is not None:
+			cache = fun.GS_Cache_Open(gs_cache)
+			data_hash = fun.GS_Fingerprint(df.index.values, y_all, X_all)
+			feat_hash = fun.GS_Fingerprint(df.drop(['Class'],
+				axis=1).columns.values)
+		else:
+			cache = None
+		solver = model.get_params().get('solver', '')
+		def get_key(j):
+			return (data_hash, feat_hash, ALG.lower(), gs_score, cv_num,
+				'seed=%i,min_size=%i,classes=%s,solver=%s,rep=%i' % (seed,
+				min_size, ','.join(map(str, classes)), solver, j))
+
+		if GS_TYPE.lower() == 'halving':
+			gs_results = fun.Halving_Search(model, list(ParameterGrid(
+				parameters)), X_all, y_gs, lambda j: bal_ids_list[j],
+				min(n, GS_REPS), gs_score, cv_num, n_jobs, cache, get_key,
+				path_param, mmap_dir)
+		else:
+			# Random search draws new candidates for each rep
+			rep_candidates = []
+			for j in range(min(n, GS_REPS)):
 				if GS_TYPE.lower() == 'rand' or GS_TYPE.lower() == 'random':
-					grid_search = RandomizedSearchCV(model,
-						param_distributions=parameters, scoring=gs_score,
-						n_iter=n_iter, cv=cv_num, n_jobs=n_jobs,
-						pre_dispatch=2 * n_jobs, return_train_score=True)
+					rep_candidates.append((j, list(ParameterSampler(parameters,
+						n_iter))))
 				else:
-					grid_search = GridSearchCV(model, param_grid=parameters,
-						scoring=gs_score, cv=cv_num, n_jobs=n_jobs,
-						pre_dispatch=2 * n_jobs, return_train_score=True)
-				
-				if len(classes) == 2:
-					y = y.replace(to_replace=[POS, NEG], value=[1, 0])
-				
-				grid_search.fit(x, y)
-				
-				# Add results to dataframe
-				j_results = pd.DataFrame(grid_search.cv_results_)
-				gs_results = pd.concat([gs_results, j_results[['params',
-					'mean_test_score']]])
-			
+					rep_candidates.append((j, list(ParameterGrid(parameters))))
+			gs_results = fun.GS_Scores(model, rep_candidates, X_all, y_gs,
+				lambda j: bal_ids_list[j], gs_score, cv_num, n_jobs, cache,
+				get_key, path_param, mmap_dir)
+		gs_results = gs_results[['mean_test_score', 'params']]
+
+		if cache is not None:
+			cache.close()
+
 		# Break params into seperate columns
 		gs_results2 = pd.concat([gs_results.drop(['params'], axis=1),
 			gs_results['params'].apply(pd.Series)], axis=1)
 		param_names = list(gs_results2)[1:]
 
 		if gs_full.lower() == 't' or gs_full.lower() == 'true':
-			gs_results2.to_csv(SAVE + "_GridSearchFULL.txt")
+			fun.Write_CSV(gs_results2, SAVE + "_GridSearchFULL.txt")
 		
 		# Find the mean score for each set of parameters & select the top set
 		gs_results_mean = gs_results2.groupby(param_names).mean()
-		gs_results_mean = gs_results_mean.sort_values('mean_test_score', 0,
-			ascending=False)
+		if GS_TYPE.lower() == 'halving':
+			# Only candidates that reached the largest budget can be selected
+			gs_results_mean['budget'] = gs_results2.groupby(param_names).size()
+			gs_results_mean = gs_results_mean.sort_values(['budget',
+				'mean_test_score'], 0, ascending=False)
+		else:
+			gs_results_mean = gs_results_mean.sort_values('mean_test_score', 0,
+				ascending=False)
 		top_params = gs_results_mean.index[0]
 
 		print("Parameter sweep time: %f seconds" % (time.time() - start_time))
@@ -189,18 +1549,22 @@ class fun(object):
 		# Save grid search results
 		outName = open(SAVE + "_GridSearch.txt", 'w')
 		outName.write('# %f sec\n' % (time.time() - start_time))
-		gs_results_mean.to_csv(outName)
+		fun.Write_CSV(gs_results_mean, outName)
 		outName.close()
 		return top_params,bal_ids_list, param_names
 	
 	def RegGridSearch(df, SAVE, ALG, gs_score, n, cv_num, n_jobs, GS_REPS,
-		GS_TYPE, gs_full):
-		""" Perform a parameter sweep using GridSearchCV from SK-learn. 
-		Need to edit the hard code to modify what parameters are searched"""
+		GS_TYPE, gs_full, gs_cache='', gs_warm=False, mmap_dir=None):
+		""" Perform a parameter sweep with the GridSearchCV folds and scoring
+		from SK-learn (see GS_Scores). Need to edit the hard code to modify
+		what parameters are searched. If gs_cache is a path, fold scores are
+		cached there and a rerun only fits what is missing. With gs_warm, RF
+		and GB grow one ensemble per fold through the n_estimators values"""
 		from sklearn.metrics import mean_squared_error, r2_score
-		from sklearn.model_selection import GridSearchCV
-		from sklearn.model_selection import RandomizedSearchCV
+		from sklearn.model_selection import ParameterGrid
+		from sklearn.model_selection import ParameterSampler
 		from sklearn.preprocessing import StandardScaler
+		from scipy import sparse
 
 		start_time = time.time()
 		n_iter = 10
@@ -209,55 +1573,81 @@ class fun(object):
 		y = df['Y']
 		x = df.drop(['Y'], axis=1)
 
-		gs_results = pd.DataFrame(columns=['mean_test_score', 'params'])
+		# Build model
+		if ALG.lower() == 'rf':
+			from sklearn.ensemble import RandomForestRegressor
+			model = RandomForestRegressor()
+		elif ALG.lower() == "svm" :
+			from sklearn.svm import LinearSVR
+			model = LinearSVR()
+		elif ALG.lower() == 'svmrbf' or ALG.lower() == 'svmpoly':
+			from sklearn.svm import SVR
+			model = SVR()
+		elif ALG.lower() == "gb":
+			from sklearn.ensemble import GradientBoostingRegressor
+			model = GradientBoostingRegressor()
+
+		if gs_warm and ALG.lower() in ['rf', 'gb']:
+			path_param = 'n_estimators'
+		else:
+			path_param = None
+
+		# Every rep uses the same data, so reps are keyed by number
+		x, y = fun.Feature_Matrix(df, 'Y'), y.values
+		if not sparse.issparse(x):
+			x = np.ascontiguousarray(x)
+		if gs_cache != '':
+			cache = fun.GS_Cache_Open(gs_cache)
+			data_hash = fun.GS_Fingerprint(df.index.values, y, x)
+			feat_hash = fun.GS_Fingerprint(df.drop(['Y'],
+				axis=1).columns.values)
+		else:
+			cache = None
+		def get_key(j):
+			return (data_hash, feat_hash, ALG.lower(), gs_score, cv_num,
+				str(j))
+		all_rows = np.arange(len(y))
+
+		if GS_TYPE.lower() == 'halving':
+			gs_results = fun.Halving_Search(model, list(ParameterGrid(
+				parameters)), x, y, lambda j: all_rows, GS_REPS, gs_score,
+				cv_num, n_jobs, cache, get_key, path_param, mmap_dir)
+		else:
+			# Random search draws new candidates for each rep
+			rep_candidates = []
+			for j in range(GS_REPS):
+				if GS_TYPE.lower() == 'rand' or GS_TYPE.lower() == 'random':
+					rep_candidates.append((j, list(ParameterSampler(parameters,
+						n_iter))))
+				else:
+					rep_candidates.append((j, list(ParameterGrid(parameters))))
+			gs_results = fun.GS_Scores(model, rep_candidates, x, y,
+				lambda j: all_rows, gs_score, cv_num, n_jobs, cache, get_key,
+				path_param, mmap_dir)
+		gs_results = gs_results[['mean_test_score', 'params']]
 
-		#if j < GS_REPS:
-		for j in range(GS_REPS):
-			print("Round %s of %s" % (j + 1, GS_REPS))
+		if cache is not None:
+			cache.close()
 
-			# Build model
-			if ALG.lower() == 'rf':
-				from sklearn.ensemble import RandomForestRegressor
-				model = RandomForestRegressor()
-			elif ALG.lower() == "svm" :
-				from sklearn.svm import LinearSVR
-				model = LinearSVR()
-			elif ALG.lower() == 'svmrbf' or ALG.lower() == 'svmpoly':
-				from sklearn.svm import SVR
-				model = SVR()
-			elif ALG.lower() == "gb":
-				from sklearn.ensemble import GradientBoostingRegressor
-				model = GradientBoostingRegressor()
-
-			# Run grid search with 10-fold cross validation and fit
-			if GS_TYPE.lower() == 'rand' or GS_TYPE.lower() == 'random':
-				grid_search = RandomizedSearchCV(model, parameters,
-					scoring=gs_score, n_iter=n_iter, cv=cv_num, n_jobs=n_jobs,
-					pre_dispatch=2 * n_jobs, return_train_score=True)
-			else:
-				grid_search = GridSearchCV(model, parameters, scoring=gs_score,
-					cv=cv_num, n_jobs=n_jobs, pre_dispatch=2 * n_jobs,
-					return_train_score=True)
-			grid_search.fit(x, y)
-
-			# Add results to dataframe
-			j_results = pd.DataFrame(grid_search.cv_results_)
-			gs_results = pd.concat([gs_results, j_results[['params',
-				'mean_test_score']]])
-		
 		# Break params into seperate columns
 		gs_results2 = pd.concat([gs_results.drop(['params'], axis=1),
 			gs_results['params'].apply(pd.Series)], axis=1)
 		
 		if gs_full.lower() == 't' or gs_full.lower() == 'true':
-			gs_results.to_csv(SAVE + "_GridSearchFULL.txt")
+			fun.Write_CSV(gs_results, SAVE + "_GridSearchFULL.txt")
 		param_names = list(gs_results2)[1:]
 		#print('Parameters tested: %s' % param_names)
 		
 		# Find the mean score for each set of parameters & select the top set
 		gs_results_mean = gs_results2.groupby(param_names).mean()
-		gs_results_mean = gs_results_mean.sort_values('mean_test_score',
-			0, ascending=False)
+		if GS_TYPE.lower() == 'halving':
+			# Only candidates that reached the largest budget can be selected
+			gs_results_mean['budget'] = gs_results2.groupby(param_names).size()
+			gs_results_mean = gs_results_mean.sort_values(['budget',
+				'mean_test_score'], 0, ascending=False)
+		else:
+			gs_results_mean = gs_results_mean.sort_values('mean_test_score',
+				0, ascending=False)
 		top_params = gs_results_mean.index[0]
 		print(gs_results_mean.head())
 		
@@ -265,11 +1655,51 @@ class fun(object):
 		print("Parameter sweep time: %f seconds" % (time.time() - start_time))
 		outName = open(SAVE + "_GridSearch.txt", 'w')
 		outName.write('# %f sec\n' % (time.time() - start_time))
-		gs_results_mean.to_csv(outName)
+		fun.Write_CSV(gs_results_mean, outName)
 		outName.close()
 		return top_params, param_names
 
-	
+	def Halving_Search(model, candidates, X, y, get_rows, n_reps, gs_score,
+		cv_num, n_jobs, cache=None, get_key=None, path_param=None,
+		mmap_dir=None, factor=3):
+		""" Successive halving over the grid search reps. Every candidate is
+		scored on the first rep, then the top 1/factor (by mean score over
+		the reps run so far) are scored on factor times as many reps, until
+		one candidate is left or all n_reps are used. Each rung runs through
+		GS_Scores. Returns one row per candidate per rep, as the full grid
+		search does """
+		# One memory-mapped copy of X serves all the rungs
+		from scipy import sparse
+		shared = n_jobs != 1 and not isinstance(X, np.memmap) and \
+			not sparse.issparse(X)
+		if shared:
+			X = fun.Shared_Matrix(X, mmap_dir)
+		totals = np.zeros(len(candidates))
+		alive = np.arange(len(candidates))
+		rungs = []
+
+		done, budget = 0, 1
+		while True:
+			budget = min(budget, n_reps)
+			print("Halving: %i candidates on %i of %i reps" % (len(alive),
+				budget, n_reps))
+			rung = fun.GS_Scores(model, [(j, [candidates[c] for c in alive])
+				for j in range(done, budget)], X, y, get_rows, gs_score, cv_num,
+				n_jobs, cache, get_key, path_param, mmap_dir)
+			totals[alive] += rung['mean_test_score'].values.reshape(-1,
+				len(alive)).sum(axis=0)
+			rungs.append(rung)
+			done = budget
+
+			if len(alive) == 1 or budget == n_reps:
+				break
+			n_keep = max(1, len(alive) // factor)
+			alive = alive[np.argsort(-totals[alive], kind='stable')[:n_keep]]
+			budget *= factor
+
+		if shared:
+			fun.Shared_Matrix_Free(X)
+		return pd.concat(rungs)
 
 	def DefineClf_RandomForest(n_estimators, max_depth, max_features, j, n_jobs):
 		from sklearn.ensemble import RandomForestClassifier
@@ -341,11 +1771,15 @@ class fun(object):
 		reg = LinearSVR(C=float(C))
 		return reg
 
-	def DefineClf_LogReg(penalty, C, intercept_scaling):
+	def DefineClf_LogReg(penalty, C, intercept_scaling, solver=None):
+		""" solver: the solver the parameters were searched with (saga with
+		-gs_warm), default: LogisticRegression's """
 		from sklearn.linear_model import LogisticRegression
 		clf = LogisticRegression(penalty=penalty,
 			C=float(C),
 			intercept_scaling=intercept_scaling)
+		if solver is not None:
+			clf.set_params(solver=solver)
 		return clf
 
 	def DefineReg_LinReg():
@@ -353,9 +1787,60 @@ class fun(object):
 		reg = linear_model.LinearRegression()
 		return reg
 
+	def CV_Fold_Models(clf, X, y, cv_num):
+		""" Fit one model per cross-validation fold (same stratified folds as
+		cross_val_predict) and get both the class predictions and the
+		probabilities for the held out instances from that single fit.
+		Returns cv_proba, cv_pred and the list of fitted fold models """
+		from sklearn.base import clone
+		from sklearn.model_selection import check_cv
+
+		cv = check_cv(int(cv_num), y, classifier=True)
+		cv_proba = np.zeros((len(y), len(np.unique(y))))
+		cv_pred = np.empty(len(y), dtype=np.asarray(y).dtype)
+		models = []
+		for train, test in cv.split(X, y):
+			model = clone(clf)
+			model.fit(X.iloc[train], y.iloc[train])
+			cv_proba[test] = model.predict_proba(X.iloc[test])
+			cv_pred[test] = model.predict(X.iloc[test])
+			models.append(model)
+
+		return cv_proba, cv_pred, models
+
+	def Fold_Models_Proba(models, X):
+		""" Average the predicted probabilities of the fold models """
+		return np.mean([m.predict_proba(X) for m in models], axis=0)
+
+	def Get_Importances(clf):
+		""" Importance scores from a fitted model: feature_importances_ for
+		RF/GB, coef_ for linear models. For a calibrated LinearSVC the coef_
+		of the calibrated base models are averaged """
+		if hasattr(clf, 'calibrated_classifiers_'):
+			base_imps = []
+			for cal in clf.calibrated_classifiers_:
+				if hasattr(cal, 'estimator'):
+					base_imps.append(fun.Get_Importances(cal.estimator))
+				else:
+					base_imps.append(fun.Get_Importances(cal.base_estimator))
+			if any(isinstance(imp, str) for imp in base_imps):
+				return 'na'
+			return np.mean(base_imps, axis=0)
+		try:
+			return clf.feature_importances_
+		except:
+			try:
+				return clf.coef_
+			except:
+				return 'na'
+
 	def BuildModel_Apply_Performance(df, clf, cv_num, df_notSel, apply_unk,
-		df_unknowns, test_df, classes, POS, NEG, j, ALG, THRSHD_test):
-		from sklearn.model_selection import cross_val_predict
+		df_unknowns, test_df, classes, POS, NEG, j, ALG, THRSHD_test,
+		cv_apply=False, THRSHD_grid=0.01):
+		""" Get cross-validation scores on the balanced dataframe (one fit per
+		fold) and apply the model to the not selected, unknown and test
+		instances. The applied model is either refit on all balanced data
+		(default) or, if cv_apply, the average of the fold models """
 
 		# Data from balanced dataframe
 		y = df['Class']
@@ -365,31 +1850,47 @@ class fun(object):
 		# scores, but not for importance scores
 		if ALG.lower() == 'svm':
 			from sklearn.calibration import CalibratedClassifierCV
-			clf2 = clf
-			clf2.fit(X,y)
+			if not cv_apply:
+				clf2 = clf
+				clf2.fit(X,y)
 			# adds the probability output to linearSVC
 			clf = CalibratedClassifierCV(clf, cv=3)
 		else:
 			clf2 = 'pass'
 
 		# Obtain the predictions using 10 fold cross validation
-		# (uses KFold cv by default):
-		cv_proba = cross_val_predict(estimator=clf, X=X, y=y, cv=int(cv_num),
-			method='predict_proba')
-		cv_pred = cross_val_predict(estimator=clf, X=X, y=y, cv=cv_num)
-
-		# Fit a model using all data and apply to 
-		# (1) instances that were not selected using cl_train
-		# (2) instances with unknown class
-		# (3) test instances
-		clf.fit(X,y)
+		# (uses StratifiedKFold cv by default), one fit per fold:
+		cv_proba, cv_pred, fold_models = fun.CV_Fold_Models(clf, X, y, cv_num)
+
+		# Apply to (1) instances that were not selected using cl_train
+		# (2) instances with unknown class (3) test instances using either
+		# the fold models (averaged) or a model fit using all data
+		if cv_apply:
+			from functools import partial
+			predict_proba = partial(fun.Fold_Models_Proba, fold_models)
+			importances = [fun.Get_Importances(m) for m in fold_models]
+			if any(isinstance(imp, str) for imp in importances):
+				importances = 'na'
+			else:
+				importances = np.mean(importances, axis=0)
+		else:
+			clf.fit(X,y)
+			predict_proba = clf.predict_proba
+			if clf2 != 'pass':
+				importances = fun.Get_Importances(clf2)
+			else:
+				importances = fun.Get_Importances(clf)
 
-		notSel_proba = clf.predict_proba(df_notSel.drop(['Class'], axis=1))
+		notSel_proba = predict_proba(df_notSel.drop(['Class'], axis=1))
 		if apply_unk == True:
-			unk_proba = clf.predict_proba(df_unknowns.drop(['Class'], axis=1))
+			unk_proba = predict_proba(df_unknowns.drop(['Class'], axis=1))
 		if not isinstance(test_df, str):
-			test_proba = clf.predict_proba(test_df.drop(['Class'], axis=1))
-			test_pred = clf.predict(test_df.drop(['Class'], axis=1))
+			test_proba = predict_proba(test_df.drop(['Class'], axis=1))
+			if cv_apply:
+				test_pred = fold_models[0].classes_[np.argmax(test_proba,
+					axis=1)]
+			else:
+				test_pred = clf.predict(test_df.drop(['Class'], axis=1))
 
 		# Evaluate performance
 		if len(classes) == 2:
@@ -402,8 +1903,8 @@ class fun(object):
 			scores = cv_proba[:, POS_IND]
 
 			# Generate run statistics from balanced dataset scores
-			result = fun.Performance(y, cv_pred, scores, clf, clf2, classes,
-				POS, POS_IND, NEG, ALG, THRSHD_test)
+			result = fun.Performance(y, cv_pred, scores, importances, classes,
+				POS, POS_IND, NEG, ALG, THRSHD_test, THRSHD_grid)
 
 			#Generate data frame with all scores
 			score_columns=["score_%s"%(j)]
@@ -425,8 +1926,8 @@ class fun(object):
 					axis=0)
 				scores_test = test_proba[:,POS_IND]
 				result_test = fun.Performance(test_df['Class'], test_pred,
-					scores_test, clf, clf2, classes, POS, POS_IND, NEG, ALG,
-					THRSHD_test)
+					scores_test, importances, classes, POS, POS_IND, NEG, ALG,
+					THRSHD_test, THRSHD_grid)
 
 		else:
 			# Generate run statistics from balanced dataset scores
@@ -461,6 +1962,389 @@ class fun(object):
 		else:
 			return result,current_scores
 
+	def Run_Balanced_Replicate(j, n, df, bal_ids, clf, cl_train, cv_num,
+		apply_unk, df_unknowns, test_df, classes, POS, NEG, ALG, THRSHD_test,
+		cv_apply=False, THRSHD_grid=0.01):
+		""" Build balanced replicate j (of n) from its row positions in df
+		(bal_ids), train and apply clf, and return (result, current_scores,
+		result_test). result_test is None when there is no test set """
+		print("  Round %s of %s" % (j + 1, n))
+
+		#Make balanced datasets
+		if isinstance(df, dict):
+			# Features shared as a memory map (see Run_Balanced_Replicates)
+			n_rows = len(df['index'])
+		else:
+			n_rows = len(df)
+		selected = np.zeros(n_rows, dtype=bool)
+		selected[bal_ids] = True
+		if isinstance(df, dict):
+			df1 = fun.Shared_Rows(df, bal_ids)
+			df_notSel = fun.Shared_Rows(df, np.flatnonzero(~selected))
+		else:
+			df1 = df.take(bal_ids)
+			df_notSel = df[~selected]
+
+		# Remove non-training classes from not-selected dataframe
+		if cl_train != 'all':
+			df_notSel = df_notSel[(df_notSel['Class'].isin(cl_train))]
+
+		# Run ML algorithm on balanced datasets.
+		if not isinstance(test_df, str):
+			result, current_scores, result_test = \
+				fun.BuildModel_Apply_Performance(df1, clf, cv_num, df_notSel,
+					apply_unk, df_unknowns, test_df, classes, POS, NEG, j, ALG,
+					THRSHD_test, cv_apply, THRSHD_grid)
+		else:
+			result, current_scores = fun.BuildModel_Apply_Performance(df1,
+				clf, cv_num, df_notSel, apply_unk, df_unknowns, test_df,
+				classes, POS, NEG, j, ALG, THRSHD_test, cv_apply, THRSHD_grid)
+			result_test = None
+
+		return result, current_scores, result_test
+
+	def Shared_Rows(shared, rows):
+		""" Rebuild the rows of a Class + features dataframe shared as
+		{'X': memory-mapped features, 'Class', 'index', 'columns'} """
+		df = pd.DataFrame(shared['X'][rows], index=shared['index'][rows],
+			columns=shared['columns'])
+		df.insert(0, 'Class', shared['Class'][rows])
+		return df
+
+	def Run_Balanced_Replicates(df, balanced_ids, clfs, rep_jobs, cl_train,
+		cv_num, apply_unk, df_unknowns, test_df, classes, POS, NEG, ALG,
+		THRSHD_test, cv_apply=False, THRSHD_grid=0.01, mmap_dir=None):
+		""" Train the balanced replicates, rep_jobs at a time, in a process
+		pool. df, df_unknowns and test_df are shared read-only by the workers
+		(joblib memory maps large arrays instead of copying them). If mmap_dir
+		is given, the feature matrix is instead written once to a memory map
+		in mmap_dir (see Shared_Matrix) and each worker slices its replicate
+		rows from it. Results are yielded in replicate order as they finish,
+		so output matches a serial run and only a few replicates' scores are
+		held in memory at a time """
+		try:
+			from joblib import Parallel, delayed
+		except ImportError:
+			from sklearn.externals.joblib import Parallel, delayed
+
+		n = len(balanced_ids)
+		if rep_jobs == 1:
+			for j in range(n):
+				yield fun.Run_Balanced_Replicate(j, n, df, balanced_ids[j],
+					clfs[j], cl_train, cv_num, apply_unk, df_unknowns, test_df,
+					classes, POS, NEG, ALG, THRSHD_test, cv_apply, THRSHD_grid)
+			return
+
+		shared = df
+		if fun.Is_Sparse(df):
+			mmap_dir = None
+		if mmap_dir:
+			features = df.drop('Class', axis=1)
+			shared = {'X': fun.Shared_Matrix(features.values, mmap_dir),
+				'Class': df['Class'].values, 'index': df.index.values,
+				'columns': features.columns}
+			del features
+
+		def tasks(reps):
+			return (delayed(fun.Run_Balanced_Replicate)(j, n, shared,
+				balanced_ids[j], clfs[j], cl_train, cv_num, apply_unk,
+				df_unknowns, test_df, classes, POS, NEG, ALG, THRSHD_test,
+				cv_apply, THRSHD_grid) for j in reps)
+
+		try:
+			try:
+				pool = Parallel(n_jobs=rep_jobs, pre_dispatch='2*n_jobs',
+					return_as='generator')
+			except TypeError:
+				# joblib < 1.3 returns lists only: run 2*rep_jobs at a time
+				pool = None
+			if pool is not None:
+				for result in pool(tasks(range(n))):
+					yield result
+			else:
+				pool = Parallel(n_jobs=rep_jobs)
+				for start in range(0, n, 2 * rep_jobs):
+					for result in pool(tasks(range(start, min(n, start + 2 *
+						rep_jobs)))):
+						yield result
+		finally:
+			if mmap_dir:
+				fun.Shared_Matrix_Free(shared['X'])
+
+	def Score_Store(n_instances, n_reps, n_classes=0):
+		""" Preallocated float32 store for the replicate scores: instances x
+		replicates (binary) or instances x replicates x classes (multiclass).
+		Instances not scored in a replicate stay NaN """
+		if n_classes == 0:
+			shape = (n_instances, n_reps)
+		else:
+			shape = (n_instances, n_reps, n_classes)
+		return np.full(shape, np.nan, dtype=np.float32)
+
+	def Score_Store_Fill(store, index, current_scores, j):
+		""" Write the scores from replicate j into the store in place, using
+		the integer position of each instance in index """
+		rows = index.get_indexer(current_scores.index)
+		if store.ndim == 2:
+			store[rows, j] = current_scores.values[:, 0]
+		else:
+			store[rows, j] = current_scores.values
+
+	def Score_Store_Summary(store):
+		""" Mean, median and stdev of the scores across replicates (per class
+		for multiclass), ignoring replicates where an instance was not
+		scored """
+		score_mean = np.nanmean(store, axis=1, dtype=np.float64)
+		score_median = np.nanmedian(store, axis=1).astype(np.float64)
+		score_sd = np.nanstd(store, axis=1, dtype=np.float64, ddof=1)
+		return score_mean, score_median, score_sd
+
+	def Score_Store_Columns(store, classes):
+		""" Names of the score columns of each replicate: [score_j], or
+		[class_score_j, ...] for multiclass """
+		if store.ndim == 2:
+			return [['score_%s' % j] for j in range(store.shape[1])]
+		return [['%s_score_%s' % (clss, j) for clss in classes]
+			for j in range(store.shape[1])]
+
+	def Score_Store_Frame(store, index, classes):
+		""" Build the replicate score columns (score_j, or class_score_j for
+		multiclass) from the store """
+		columns = sum(fun.Score_Store_Columns(store, classes), [])
+		return pd.DataFrame(store.reshape(len(index), -1), index=index,
+			columns=columns)
+
+	def Scores_Open(SAVE):
+		""" Start the binary scores file, SAVE_scores.npz: a compressed zip
+		of .npy arrays that np.load reads (see Scores_Load). Replicate scores
+		are added as they are merged (Scores_Write) and the other columns at
+		the end (Scores_Close) """
+		import zipfile
+		return zipfile.ZipFile(SAVE + '_scores.npz', 'w', zipfile.ZIP_DEFLATED,
+			allowZip64=True)
+
+	def Scores_Write(archive, name, values):
+		""" Add one array (e.g. the float32 scores of one replicate) to the
+		scores file """
+		with archive.open(name + '.npy', 'w', force_zip64=True) as f:
+			np.lib.format.write_array(f, np.asarray(values),
+				allow_pickle=False)
+
+	def Scores_Close(archive, df_proba, rep_columns, header, short_columns):
+		""" Add the index and the non-replicate columns of df_proba to the
+		scores file and close it. rep_columns are the column names of each
+		replicate (rep_j), header is the name of the ID column in the text
+		output and short_columns the columns of the -short output """
+		import json
+
+		def write_values(name, values):
+			# Strings are stored as unicode (no pickles), with a NaN mask
+			values = np.asarray(values)
+			if values.dtype == object:
+				na = pd.isnull(values)
+				if na.any():
+					fun.Scores_Write(archive, name + '_na', na)
+				values = np.asarray(np.where(na, '', values), dtype=str)
+			fun.Scores_Write(archive, name, values)
+
+		rep_names = set(sum(rep_columns, []))
+		other = [c for c in df_proba.columns if c not in rep_names]
+		write_values('index', df_proba.index.values)
+		for i, c in enumerate(other):
+			write_values('col_%i' % i, df_proba[c].values)
+		meta = {'version': 1, 'header': header,
+			'index_name': df_proba.index.name,
+			'columns': [str(c) for c in df_proba.columns],
+			'other_columns': [str(c) for c in other],
+			'rep_columns': rep_columns,
+			'short_columns': [str(c) for c in short_columns]}
+		fun.Scores_Write(archive, 'meta', np.array(json.dumps(meta)))
+		archive.close()
+
+	def Scores_Load(path, short=False):
+		""" Rebuild df_proba (same columns and dtypes as when it was saved)
+		from a binary scores file. Returns (df_proba, meta) """
+		import json
+		with np.load(path) as npz:
+			meta = json.loads(str(npz['meta']))
+
+			def read_values(name):
+				values = npz[name]
+				if values.dtype.kind == 'U':
+					values = values.astype(object)
+					if name + '_na' in npz.files:
+						values[npz[name + '_na']] = np.nan
+				return values
+
+			columns = meta['short_columns'] if short else meta['columns']
+			data = {}
+			for i, c in enumerate(meta['other_columns']):
+				if c in columns:
+					data[c] = read_values('col_%i' % i)
+			for j, names in enumerate(meta['rep_columns']):
+				if any(c in columns for c in names):
+					values = npz['rep_%i' % j].reshape(-1, len(names))
+					for k, c in enumerate(names):
+						data[c] = values[:, k]
+			index = pd.Index(read_values('index'), name=meta['index_name'])
+		return pd.DataFrame(data, index=index, columns=columns), meta
+
+	def Scores_TSV(df_proba, scores_file, header):
+		""" Write the text scores file (_scores.txt): header, a tab and the
+		stripped tab-delimited table, streamed block by block. Whitespace at
+		the end of a block is held back until more text follows, so the
+		output is the same as stripping the whole table """
+		out_scores = open(scores_file, "w")
+		out_scores.write(header + "\t")
+		pending, started = '', False
+		for block in fun.CSV_Blocks(df_proba, sep="\t"):
+			if not started:
+				block = block.lstrip()
+				started = block != ''
+			text = block.rstrip()
+			if text != '':
+				out_scores.write(pending + text)
+				pending = block[len(text):]
+			else:
+				pending += block
+		out_scores.write("\n")
+		out_scores.close()
+
+	def Ledger_Open(path):
+		""" Open (or create) the SQLite results ledger (default RESULTS.db),
+		the complete record of the runs. Runs finishing at once in one
+		directory each add their record in one locked transaction. It uses
+		SQLite's default rollback journal rather than WAL, whose shared
+		memory index does not work on NFS/shared cluster file systems. runs
+		holds one row per run (kind c/r, the legacy RESULTS line, parameters
+		and arguments), metrics one row per numeric RESULTS field """
+		import sqlite3
+		ledger = sqlite3.connect(path, timeout=600)
+		ledger.execute('PRAGMA journal_mode=DELETE')
+		ledger.execute('CREATE TABLE IF NOT EXISTS headers (kind TEXT '
+			'PRIMARY KEY, header TEXT)')
+		ledger.execute('CREATE TABLE IF NOT EXISTS runs (run INTEGER PRIMARY '
+			'KEY AUTOINCREMENT, kind TEXT, datetime TEXT, run_time REAL, id '
+			'TEXT, tag TEXT, alg TEXT, features TEXT, params TEXT, args TEXT, '
+			'line TEXT)')
+		ledger.execute('CREATE TABLE IF NOT EXISTS metrics (run INTEGER, name '
+			'TEXT, value REAL, PRIMARY KEY (run, name))')
+		for col in ['tag', 'alg', 'features']:
+			ledger.execute('CREATE INDEX IF NOT EXISTS runs_%s ON runs (kind, '
+				'%s)' % (col, col))
+		ledger.execute('CREATE INDEX IF NOT EXISTS metrics_name ON metrics '
+			'(name, run)')
+		ledger.commit()
+		return ledger
+
+	def Ledger_Add(path, kind, header, line, features='all', params='',
+		args=None):
+		""" Record one run in the ledger. header and line are the legacy
+		tab-delimited RESULTS header and line (without newlines); the
+		DateTime, RunTime, ID, Tag and Alg fields are also kept as indexed
+		columns and every numeric field as a metric. Returns the run number """
+		import json
+		record = dict(zip(header.split('\t'), line.split('\t')))
+		labels = ['DateTime', 'ID', 'Tag', 'Y', 'Alg', 'Classes']
+		metrics = []
+		for name, value in record.items():
+			if name not in labels:
+				try:
+					metrics.append((name, float(value)))
+				except ValueError:
+					pass
+		ledger = fun.Ledger_Open(path)
+		try:
+			with ledger:
+				ledger.execute('INSERT OR REPLACE INTO headers VALUES (?, ?)',
+					(kind, header))
+				run = ledger.execute('INSERT INTO runs (kind, datetime, '
+					'run_time, id, tag, alg, features, params, args, line) '
+					'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', (kind,
+					record.get('DateTime'), float(record.get('RunTime', 'nan')),
+					record.get('ID'), record.get('Tag'), record.get('Alg'),
+					str(features), str(params), json.dumps(args, default=str),
+					line)).lastrowid
+				ledger.executemany('INSERT INTO metrics VALUES (?, ?, ?)',
+					[(run, name, value) for name, value in metrics])
+		finally:
+			ledger.close()
+		return run
+
+	def Results_Append(out, kind, header, line):
+		""" Append one run to the legacy RESULTS.txt (kind c) or
+		RESULTS_reg.txt (kind r) table as the scripts always have, starting
+		the file with header if it is new. The line is added in one O_APPEND
+		write, so lines of runs finishing at once do not interleave """
+		text = '\n' + line if kind == 'c' else line + '\n'
+		flags = os.O_WRONLY | os.O_APPEND
+		try:
+			fd = os.open(out, flags | os.O_CREAT | os.O_EXCL, 0o666)
+			text = header + ('\n' if kind == 'r' else '') + text
+		except FileExistsError:
+			fd = os.open(out, flags)
+		try:
+			os.write(fd, text.encode())
+		finally:
+			os.close(fd)
+
+	def Ledger_Where(kind, tag=None, alg=None, features=None):
+		""" SQL condition and values selecting the runs of one kind, with
+		optional lists of tags/algorithms/feature sets """
+		where, values = ['runs.kind = ?'], [kind]
+		for col, keep in [('tag', tag), ('alg', alg), ('features', features)]:
+			if keep:
+				where.append('runs.%s IN (%s)' % (col, ','.join('?' * len(keep))))
+				values.extend(keep)
+		return ' AND '.join(where), values
+
+	def Ledger_Export(path, kind, out, **filters):
+		""" Write the selected runs in the legacy RESULTS.txt (kind c) or
+		RESULTS_reg.txt (kind r) layout. The file is written to a temporary
+		name and renamed, so readers never see a partial table """
+		ledger = fun.Ledger_Open(path)
+		try:
+			header = ledger.execute('SELECT header FROM headers WHERE kind = ?',
+				(kind,)).fetchone()
+			where, values = fun.Ledger_Where(kind, **filters)
+			lines = ledger.execute('SELECT line FROM runs WHERE %s ORDER BY '
+				'run' % where, values)
+			tmp = '%s.%i.tmp' % (out, os.getpid())
+			with open(tmp, 'w') as f:
+				if header is not None:
+					f.write(header[0] + ('\n' if kind == 'r' else ''))
+				n = 0
+				for (line,) in lines:
+					f.write('\n' + line if kind == 'c' else line + '\n')
+					n += 1
+			os.replace(tmp, out)
+		finally:
+			ledger.close()
+		return n
+
+	def Ledger_Summary(path, kind, metrics, by=('tag', 'alg', 'features'),
+		**filters):
+		""" Count, mean, sd (population), min and max of each metric over the
+		selected runs, grouped by the runs columns in by """
+		ledger = fun.Ledger_Open(path)
+		try:
+			where, values = fun.Ledger_Where(kind, **filters)
+			by = ['runs.%s' % col for col in by]
+			group = ', '.join(by + ['metrics.name'])
+			query = ('SELECT %s, COUNT(metrics.value) AS n, AVG(metrics.value) '
+				'AS mean, AVG(metrics.value * metrics.value) AS mean_sq, '
+				'MIN(metrics.value) AS min, MAX(metrics.value) AS max FROM runs '
+				'JOIN metrics ON metrics.run = runs.run WHERE %s AND '
+				'metrics.name IN (%s) GROUP BY %s ORDER BY %s' % (group, where,
+				','.join('?' * len(metrics)), group, group))
+			summary = pd.read_sql_query(query, ledger,
+				params=values + list(metrics))
+		finally:
+			ledger.close()
+		summary.insert(summary.columns.get_loc('mean') + 1, 'sd', np.sqrt(
+			(summary['mean_sq'] - summary['mean'] ** 2).clip(lower=0)))
+		return summary.drop('mean_sq', axis=1)
+
 	def Run_Regression_Model(df, reg, cv_num, ALG, df_unknowns, test_df,
 		cv_sets, j):
 		from sklearn.model_selection import cross_val_predict
@@ -530,13 +2414,67 @@ class fun(object):
 		else:
 			return result, cv_pred_df, importances
 
-	def Performance(y, cv_pred, scores, clf, clf2, classes, POS, POS_IND,
-		NEG, ALG, THRSHD_test):
+	def Threshold_Grid(THRSHD_grid):
+		""" Candidate prediction thresholds: a grid with step THRSHD_grid
+		between 0 and 1 (default 0.01), or None for 'exact' (every score
+		breakpoint) """
+		if str(THRSHD_grid).lower() == 'exact':
+			return None
+		step = float(THRSHD_grid)
+		return np.arange(step, 1, step)
+
+	def Threshold_Sweep(y, scores, thresholds=None, strict=False):
+		""" Confusion matrix counts and metrics at every candidate threshold
+		from one sort of the scores (O(n log n) for all thresholds). y is
+		True/1 for POS instances. Instances are called POS if score >=
+		threshold (score > threshold if strict). thresholds=None uses the
+		exact score breakpoints. Returns a dict of arrays (one value per
+		threshold) """
+		y = np.asarray(y).astype(bool)
+		scores = np.asarray(scores, dtype=float)
+		order = np.argsort(scores, kind='mergesort')
+		scores_sorted = scores[order]
+		if thresholds is None:
+			thresholds = np.unique(scores)
+		thresholds = np.asarray(thresholds, dtype=float)
+
+		# Count the instances (and POS instances) called NEG at each threshold
+		if strict:
+			n_below = np.searchsorted(scores_sorted, thresholds, side='right')
+		else:
+			n_below = np.searchsorted(scores_sorted, thresholds, side='left')
+		pos_below = np.concatenate([[0], np.cumsum(y[order])])[n_below]
+
+		n_all = float(len(y))
+		n_pos = float(y.sum())
+		FN = pos_below.astype(float)
+		TN = n_below - FN
+		TP = n_pos - FN
+		FP = (n_all - n_pos) - TN
+
+		with np.errstate(divide='ignore', invalid='ignore'):
+			TPR = TP / (TP + FN)  # synonyms: recall, sensitivity
+			FPR = FP / (FP + TN)  # synonyms: fall-out
+			FNR = FN / (FN + TP)  # synonyms: miss rate
+			Precision = TP / (TP + FP)  # synonyms: + predictive value
+			Accuracy = (TP + TN) / n_all
+			F1 = (2 * TP) / ((2 * TP) + FP + FN)
+			MCC = (TP * TN - FP * FN) / np.sqrt((TP + FP) * (TP + FN) *
+				(TN + FP) * (TN + FN))
+
+		return {'threshold': thresholds, 'TP': TP, 'TN': TN, 'FP': FP,
+			'FN': FN, 'TPR': TPR, 'FPR': FPR, 'FNR': FNR,
+			'Precision': Precision, 'Accuracy': Accuracy, 'F1': F1,
+			'MCC': MCC}
+
+	def Performance(y, cv_pred, scores, importances, classes, POS, POS_IND,
+		NEG, ALG, THRSHD_test, THRSHD_grid=0.01):
 		""" For binary predictions: This function calculates the best threshold
 		for defining POS/NEG from the prediction probabilities by maximizing
-		the f1_score. Then calcuates the area under the ROC and PRc 
+		the f1_score (or accuracy, auprc, mcc; see -threshold_test). Then
+		calcuates the area under the ROC and PRc 
 		"""
-		from sklearn.metrics import f1_score, roc_auc_score, accuracy_score
+		from sklearn.metrics import roc_auc_score
 		from sklearn.metrics import average_precision_score, confusion_matrix
 
 		# Gather balanced model scoring metrics
@@ -544,47 +2482,45 @@ class fun(object):
 
 		# Determine the best threshold cutoff for the balanced run
 		y1 = y.replace(to_replace=[POS, NEG], value=[1,0])
-		max_f1 = -1
-		max_f1_thresh = ''
-		for thr in np.arange(0.01, 1, 0.01):
-			thr_pred = scores.copy()
-			thr_pred[thr_pred >= thr] = 1
-			thr_pred[thr_pred < thr] = 0
-			# Eliminates cases where all predictions are negative and
-			# the f1 and auROC are undefined
-			if sum(thr_pred) > 1:
-				if (THRSHD_test.lower() == 'f1' or
-					THRSHD_test.lower() == 'fmeasure'):
-					f1 = f1_score(y1, thr_pred, pos_label=1)
-				elif (THRSHD_test.lower() == 'acc' or
-					THRSHD_test.lower() == 'a' or
-					THRSHD_test.lower() == 'accuracy'):
-					f1 = accuracy_score(y1, thr_pred)
-				elif THRSHD_test.lower() == 'auprc':
-					f1 = average_precision_score(y1, thr_pred)
-				else:
-					print('%s is not a scoring option for model thresholding' %
-						THRSHD_test)
-					exit()
-				if f1 > max_f1:
-					max_f1 = f1
-					max_f1_thresh = thr
+		sweep = fun.Threshold_Sweep(np.asarray(y) == POS, scores,
+			fun.Threshold_Grid(THRSHD_grid))
+		if (THRSHD_test.lower() == 'f1' or
+			THRSHD_test.lower() == 'fmeasure'):
+			thr_scores = sweep['F1']
+		elif (THRSHD_test.lower() == 'acc' or
+			THRSHD_test.lower() == 'a' or
+			THRSHD_test.lower() == 'accuracy'):
+			thr_scores = sweep['Accuracy']
+		elif THRSHD_test.lower() == 'auprc':
+			# average precision of the 1/0 calls at the threshold
+			pos_frac = (sweep['TP'] + sweep['FN']) / len(scores)
+			thr_scores = (sweep['Precision'] * sweep['TPR'] +
+				(1 - sweep['TPR']) * pos_frac)
+		elif THRSHD_test.lower() == 'mcc':
+			thr_scores = np.nan_to_num(sweep['MCC'])
+		else:
+			print('%s is not a scoring option for model thresholding' %
+				THRSHD_test)
+			exit()
+
+		# Eliminates cases where all predictions are negative and
+		# the f1 and auROC are undefined
+		thr_scores = np.where(sweep['TP'] + sweep['FP'] > 1, thr_scores,
+			np.nan)
+		if np.all(np.isnan(thr_scores)):
+			max_f1 = -1
+			max_f1_thresh = ''
+		else:
+			best = np.nanargmax(thr_scores)
+			max_f1 = thr_scores[best]
+			max_f1_thresh = sweep['threshold'][best]
 
 		# Calculate AUC_ROC and AUC_PRC
 		AucRoc = roc_auc_score(y1, scores)
 		AucPRc = average_precision_score(y1, scores)
 
-		# Try to extract importance scores 
-		if clf2 != 'pass':
-			clf = clf2
-		try:
-			importances = clf.feature_importances_
-		except:
-			try:
-				importances = clf.coef_
-			except:
-				importances = "na"
-				print("Cannot get importance scores")
+		if isinstance(importances, str):
+			print("Cannot get importance scores")
 
 		return {'cm': cm, 'threshold': max_f1_thresh, 'AucPRc': AucPRc, 
 			'AucRoc': AucRoc, 'MaxF1': max_f1, 'importances': importances}
@@ -603,46 +2539,37 @@ class fun(object):
 
 	def Model_Performance_Thresh(df_proba, final_threshold, balanced_ids,
 		POS, NEG, test_instances):
-		from sklearn.metrics import f1_score, confusion_matrix
 
 		TP, TN, FP, FN, TPR, FPR, FNR, Precision, Accuracy, F1 = \
 			[], [], [], [], [], [], [], [], [], []
 
-		df_proba_thresh = df_proba.copy()
-		proba_columns = [c for c in df_proba_thresh.columns if c.startswith('score_')]
-
-		for proba_column in proba_columns:
-			df_proba_thresh[proba_column] = np.where(
-				df_proba_thresh[proba_column] > final_threshold, POS, NEG)
-		balanced_count = 0
+		proba_columns = [c for c in df_proba.columns if c.startswith('score_')]
 
 		if test_instances != 'None':
-			df_proba_thresh_test = df_proba_thresh.loc[test_instances, :]
-			df_proba_thresh = df_proba_thresh.drop(test_instances)
-
+			df_proba_test = df_proba.loc[test_instances, :]
+			df_proba = df_proba.drop(test_instances)
 
 		# Get predictions scores from the balanced runs with the final threshold
+		balanced_count = 0
 		for i in proba_columns:
 
-			# Get y and yhat for instances that were in the balanced dataset
-			y = df_proba_thresh.ix[balanced_ids[balanced_count], 'Class']
-			yhat = df_proba_thresh.ix[balanced_ids[balanced_count], i]
+			# Get y and scores for instances that were in the balanced dataset
+			df_bal = df_proba.loc[balanced_ids[balanced_count], ['Class', i]]
 			balanced_count += 1
 
-			matrix = confusion_matrix(y, yhat, labels=[POS, NEG])
-			TP1, FP1 = matrix[0, 0], matrix[1, 0]
-			TN1, FN1 = matrix[1, 1], matrix[0, 1]
-
-			TP.append(TP1)
-			FP.append(FP1)
-			TN.append(TN1)
-			FN.append(FN1)
-			TPR.append(TP1 / (TP1 + FN1))  # synonyms: recall, sensitivity
-			FPR.append(FP1 / (FP1 + TN1))  # synonyms: fall-out
-			FNR.append(FN1 / (FN1 + TP1))  # synonyms: miss rate
-			Precision.append(TP1 / (TP1 + FP1))  # synonyms: + predictive value
-			Accuracy.append((TP1 + TN1) / (TP1 + TN1 + FP1 + FN1))
-			F1.append((2 * TP1) / ((2 * TP1) + FP1 + FN1))
+			matrix = fun.Threshold_Sweep(df_bal['Class'] == POS, df_bal[i],
+				[final_threshold], strict=True)
+
+			TP.append(matrix['TP'][0])
+			FP.append(matrix['FP'][0])
+			TN.append(matrix['TN'][0])
+			FN.append(matrix['FN'][0])
+			TPR.append(matrix['TPR'][0])
+			FPR.append(matrix['FPR'][0])
+			FNR.append(matrix['FNR'][0])
+			Precision.append(matrix['Precision'][0])
+			Accuracy.append(matrix['Accuracy'][0])
+			F1.append(matrix['F1'][0])
 
 		denominator = np.sqrt(len(TP))
 		TP = [np.mean(TP), np.std(TP), np.std(TP) / denominator]
@@ -659,15 +2586,12 @@ class fun(object):
 		F1 = [np.mean(F1), np.std(F1), np.std(F1) / denominator]
 
 		if test_instances != 'None':
-			y_test = df_proba_thresh_test['Class']
-			yhat_test = df_proba_thresh_test.filter(regex='Predicted_')
-			matrix_test = confusion_matrix(y_test, yhat_test, labels=[POS, NEG])
-			TP_test, FP_test = matrix[0, 0], matrix[1, 0],
-			TN_test, FN_test = matrix[1, 1], matrix[0, 1]
-			Precision_test = TP_test / (TP_test + FP_test)
-			Accuracy_test = (TP_test + TN_test) / (TP_test + TN_test +
-				FP_test + FN_test)
-			F1_test = (2 * TP_test) / ((2 * TP_test) + FP_test + FN_test)
+			# Test set calls use the mean score (see Predicted_ column)
+			matrix_test = fun.Threshold_Sweep(df_proba_test['Class'] == POS,
+				df_proba_test['Mean'], [final_threshold])
+			Precision_test = matrix_test['Precision'][0]
+			Accuracy_test = matrix_test['Accuracy'][0]
+			F1_test = matrix_test['F1'][0]
 			return (TP, TN, FP, FN, TPR, FPR, FNR, Precision, Accuracy, F1,
 				Precision_test, Accuracy_test, F1_test)
 		else:
@@ -675,7 +2599,6 @@ class fun(object):
 
 	def Plots(df_proba, balanced_ids, ROC, PRc, POS, NEG, n, SAVE):
 		import matplotlib.pyplot as plt
-		from sklearn.metrics import roc_curve, auc, confusion_matrix
 		plt.switch_backend('agg')
 
 		FPRs = {}
@@ -684,27 +2607,16 @@ class fun(object):
 
 		# For each balanced dataset
 		for i in range(0, n): 
-			FPR = []
-			TPR = []
-			precis = []
 			name = 'score_' + str(i)
-			y = df_proba.ix[balanced_ids[i], 'Class']
+			df_bal = df_proba.loc[balanced_ids[i], ['Class', name]]
 
 			# Get decision matrix & scores at each threshold between 0 & 1
-			for j in np.arange(0, 1, 0.01):
-				yhat = df_proba.ix[balanced_ids[i], name].copy()
-				yhat[df_proba[name] >= j] = POS
-				yhat[df_proba[name] < j] = NEG
-				matrix = confusion_matrix(y, yhat, labels=[POS, NEG])
-				TP, FP = matrix[0, 0], matrix[1, 0]
-				TN, FN = matrix[1, 1], matrix[0, 1]
-				FPR.append(FP / (FP + TN))
-				TPR.append(TP / (TP + FN))
-				precis.append(TP / (TP + FP))
-
-			FPRs[name] = FPR
-			TPRs[name] = TPR
-			precisions[name] = precis
+			matrix = fun.Threshold_Sweep(df_bal['Class'] == POS, df_bal[name],
+				np.arange(0, 1, 0.01))
+
+			FPRs[name] = matrix['FPR']
+			TPRs[name] = matrix['TPR']
+			precisions[name] = matrix['Precision']
 
 		# Convert metric dictionaries into dataframes
 		FPRs_df = pd.DataFrame.from_dict(FPRs, orient='columns')
@@ -3,6 +3,7 @@ import pandas as pd
 import numpy as np
 from scipy import stats
 from sklearn.preprocessing import Imputer
+import ML_functions as ML
 
 
 ###### Parse input parameters #######
@@ -15,7 +16,8 @@ parser = argparse.ArgumentParser(
 				' [4] keep/drop columns.',
 	epilog='https://github.com/ShiuLab/ML_Pipeline/')
 
-# Info about input data
+# Info about input data (the NA tokens ?, NA, na, n/a, . and empty fields
+# are read as missing values)
 parser.add_argument(
 	'-df', 
 	help='Feature & class dataframe. Must be specified',
@@ -41,6 +43,12 @@ parser.add_argument( #### Shiu: this is ambiguous, should be -drop_proportion
 	help='If > drop_percent of data is missing, feature will be dropped '+\
 		'instead of imputed, default=0.5', 
 	default=0.5)
+parser.add_argument(
+	'-imputer',
+	help='Imputer saved by an earlier run ([df]_imputer.json): drop and fill '+\
+		'the same columns with the same values instead of computing them '+\
+		'from -df (e.g. for held-out or -apply data), default=na',
+	default='na')
 
 # One-Hot-Encoding Parameters
 parser.add_argument(
@@ -53,8 +61,39 @@ parser.add_argument(
 	help='list of columns to be one-hot-encoded (will default to default to '+\
 		'any column of type object - i.e. strings)',
 	default='default')
+parser.add_argument(
+	'-onehot_vocab',
+	help='One-hot vocabularies saved by an earlier run ([df]_onehot.json): '+\
+		'encode the same columns with the same values, so new data gets the '+\
+		'same columns (values not in it are all 0s), default=na',
+	default='na')
 
 # Other parameters
+parser.add_argument(
+	'-dtype',
+	help='float64, float32 (features kept as float32), or uint8 (float32, '+\
+		'with 0/1 features stored as uint8) to cut memory; float32 values are '+\
+		'written with float32 precision, default=float64',
+	default='float64')
+parser.add_argument(
+	'-sparse',
+	help='t/f. Build the one-hot-encoded columns as sparse (0/1) columns, '+\
+		'so they are not densified in memory before writing, default=f',
+	default='f')
+parser.add_argument(
+	'-n_jobs',
+	help='Number of processes to parse -df with (not with -chunk), default=1',
+	type=int,
+	default=1)
+parser.add_argument(
+	'-chunk',
+	help='Process -df in chunks of this many rows, in two passes (one to '+\
+		'collect the NA counts, means, medians, modes and categories of each '+\
+		'column, one to impute, encode and write), so memory is bounded by '+\
+		'the chunk size. Medians are exact unless a column has more than '+\
+		'10000 distinct values. 0 = read the whole dataframe, default=0',
+	type=int,
+	default=0)
 parser.add_argument(
 	'-remove_dups', 
 	help='t/f. Removes rows with duplicate row names (1st column value),' +\
@@ -76,11 +115,226 @@ if len(sys.argv) == 1:
 	sys.exit(0)
 args = parser.parse_args()
 
+# Shiu: Fix two issues,
+#  1) drop_percent is misleading and people can be giving percent number
+#  2) If user does provide a drop_percent, it is not properly converted to
+#     a floating point number and a TypeError will be thrown.
+args.drop_percent = float(args.drop_percent)
+if args.drop_percent > 1 or args.drop_percent < 0:
+	print('\nERR: drop_percent is between 0 and 1, but %f is specified\n' %\
+		args.drop_percent)
+	sys.exit(0)
+
+NA_TOKENS = ['?', 'NA', 'na', 'n/a', '', '.']
+
+imputer = None
+if args.imputer.lower() != 'na':
+	imputer = ML.fun.Imputer_Load(args.imputer)
+	print('Dropping/imputing the columns as in: %s' % args.imputer)
+vocab = None
+if args.onehot.lower() == 't' and args.onehot_vocab.lower() != 'na':
+	vocab = ML.fun.Onehot_Load(args.onehot_vocab)
+	print('One-hot encoding the columns as in: %s' % args.onehot_vocab)
+
+
+def save_imputer(drop, fill):
+	""" Save the columns dropped and the fill values computed from -df, to
+	impute other data the same way later (-imputer) """
+	imputer_name = args.df.replace('.txt','') + '_imputer.json'
+	ML.fun.Imputer_Save(imputer_name, {'na_method': args.na_method,
+		'drop_percent': args.drop_percent, 'drop': drop, 'fill': fill})
+	print('Imputer saved as: %s' % imputer_name)
+
+
+def save_vocab(vocab):
+	""" Save the one-hot vocabularies, to encode other data with the same
+	columns later (-onehot_vocab) """
+	vocab_name = args.df.replace('.txt','') + '_onehot.json'
+	ML.fun.Onehot_Save(vocab_name, vocab)
+	print('One-hot vocabularies saved as: %s' % vocab_name)
+
+
+def save_transform(plan, columns):
+	""" Save all the steps (drops, fills, one-hot encoding and the output
+	feature columns), to transform new data the same way in chunks with
+	ML_transform.py, or to give to ML_classification.py/ML_regression.py
+	(-transform) """
+	transform_name = args.df.replace('.txt','') + '_transform.json'
+	ML.fun.Transform_Save(transform_name, dict(plan, keep=list(columns),
+		drop_cols=[], scale=None))
+	print('Transform saved as: %s' % transform_name)
+
+
+def preprocess_stream(args):
+	""" The steps below for dataframes larger than memory (-chunk): a first
+	pass collects the summaries of each column (ML.fun.Preprocess_Scan), a
+	second applies the same drops, fills and one-hot categories to each
+	chunk (ML.fun.Preprocess_Apply) and appends it to the output """
+	onehot = args.onehot.lower() == 't'
+	onehot_list = None
+	if vocab is not None:
+		onehot_list = list(vocab)
+	elif onehot and args.onehot_list != 'default':
+		with open(args.onehot_list) as f:
+			onehot_list = f.read().splitlines()
+
+	print('Snapshot of input data...')
+	print(pd.read_csv(args.df, sep=args.sep, index_col=0, encoding='latin1',
+		nrows=5, na_values=NA_TOKENS).iloc[:5, :5])
+	print('\nScanning %s in chunks of %i rows' % (args.df, args.chunk))
+	stats = ML.fun.Preprocess_Scan(args.df, args.sep, 'latin1', args.y_name,
+		NA_TOKENS, args.chunk, args.dtype,
+		args.na_method == 'median' and imputer is None,
+		onehot_list if onehot_list is not None and vocab is None else ())
+	if args.y_name not in stats['columns']:
+		print("\nERR: y_name is specified as %s: does not exist\n" % \
+			args.y_name)
+		sys.exit(0)
+	features = [c for c in stats['columns'] if c != args.y_name]
+	n, kind = stats['n'], stats['kind']
+
+	print('\n\n### Dropping/imputing NAs... ###')
+	cols_with_na = [c for c in features if stats['na'][c] > 0]
+	print('\nNumber of columns with NAs: %i' % len(cols_with_na))
+
+	drop, dropped = [], []
+	if imputer is not None:
+		drop = [c for c in imputer['drop'] if c in features]
+		dropped = drop
+	elif args.na_method == 'drop':
+		drop = list(cols_with_na)
+	else:
+		dropped = [c for c in cols_with_na
+			if stats['na'][c] / n > args.drop_percent]
+		drop = list(dropped)
+	if len(dropped) > 0:
+		print('\nFeatures dropped because missing > %.2f%% of data: %s' % \
+			(args.drop_percent * 100, dropped))
+	cols_to_impute = [x for x in cols_with_na if x not in drop]
+	print('Number of columns to impute: %i' % len(cols_to_impute))
+
+	kept = [c for c in features if c not in drop]
+	fill = {}
+	if imputer is not None:
+		fill = {c: imputer['fill'][c] for c in kept if c in imputer['fill']}
+		missing_fill = [c for c in cols_to_impute if c not in fill]
+		if len(missing_fill) > 0:
+			print('\nWARNING: no fill value in %s for: %s' % (args.imputer,
+				missing_fill))
+	else:
+		if args.na_method not in ['drop', 'mean', 'median'] and any(
+			kind[c] != 'O' for c in cols_to_impute):
+			print('Need to specify method for imputation')
+			quit()
+		# Fill values of every column, so other data can be imputed the same
+		# way (-imputer)
+		for col in kept if args.na_method != 'drop' else []:
+			if kind[col] == 'O':
+				counts = stats['counts'][col]
+				if len(counts) > 0:
+					top = max(counts.values())
+					fill[col] = min(v for v, c in counts.items() if c == top)
+			elif args.na_method == 'mean':
+				count = stats['count'][col]
+				fill[col] = stats['sum'][col] / count if count > 0 else np.nan
+			elif args.na_method == 'median':
+				fill[col] = ML.fun.Sketch_Median(stats['sketch'].get(col))
+		save_imputer(drop, fill)
+
+	onehot_cats = {}
+	if onehot:
+		print('\n\n### One Hot Encoding... ###')
+		if onehot_list is None:
+			cols_cat = [c for c in kept if kind[c] == 'O']
+		else:
+			cols_cat = onehot_list
+		print('\nFeatures to one-hot-encode: %s' % cols_cat)
+		for col in cols_cat:
+			if vocab is not None:
+				onehot_cats[col] = vocab[col]
+				if kind[col] == 'O':
+					new = set(stats['counts'][col]) - set(vocab[col])
+					if len(new) > 0:
+						print('WARNING: values of %s not in %s (encoded as all '
+							'0s): %s' % (col, args.onehot_vocab, sorted(new)))
+			elif kind[col] == 'O':
+				categories = set(stats['counts'][col])
+				if col in fill:
+					categories.add(fill[col])
+				onehot_cats[col] = sorted(categories)
+			else:
+				categories = stats['values'][col]
+				if col in fill and not pd.isnull(fill[col]):
+					categories = np.union1d(categories, np.asarray([fill[col]],
+						dtype=categories.dtype))
+				onehot_cats[col] = categories
+		print('Dataframe shape (rows, cols) before and after one-hot-encoding:'
+			'\nBefore: %s\nAfter: %s' % ((n, len(kept)), (n, len(kept) -
+			len(cols_cat) + sum(len(v) for v in onehot_cats.values()))))
+		if vocab is None:
+			save_vocab(onehot_cats)
+
+	# -dtype uint8: the 0/1 columns of the whole dataframe (after imputing)
+	binary = [c for c in kept if c not in onehot_cats and kind[c] != 'O' and
+		stats['binary'].get(c, False) and (c not in fill or fill[c] in (0, 1))]
+
+	keep = None
+	if args.keep.lower() != 'na':
+		print('Using subset of features from: %s' % args.keep)
+		with open(args.keep) as f:
+			keep = f.read().strip().splitlines()
+	drop_cols = []
+	if args.drop.lower() != 'na':
+		print('Dropping features from: %s' % args.drop)
+		with open(args.drop) as f:
+			drop_cols = f.read().strip().splitlines()
+
+	plan = {'na_tokens': NA_TOKENS, 'y_name': args.y_name, 'dtype': args.dtype,
+		'drop': drop, 'fill': fill, 'onehot': onehot_cats, 'binary': binary,
+		'sparse': args.sparse.lower() in ['t', 'true'], 'keep': keep,
+		'drop_cols': drop_cols, 'kinds': kind}
+
+	# Read every column with the dtype it has in the whole dataframe
+	dtypes = {c: {'O': str, 'b': bool, 'i': 'int64', 'f': 'float64'}[k]
+		for c, k in kind.items()}
+	save_name = args.df.replace('.txt','') + '_mod.txt'
+	seen, dups_count, first = set(), 0, True
+	with open(save_name, 'w') as out:
+		for df in pd.read_csv(args.df, sep=args.sep, index_col=0,
+			encoding='latin1', chunksize=args.chunk, dtype=dtypes,
+			na_values=NA_TOKENS):
+			df_classes, df = ML.fun.Preprocess_Apply(df, plan)
+			if args.remove_dups.lower() in ['t', 'true']:
+				new = ~df.index.duplicated(keep='first') & ~df.index.isin(seen)
+				dups_count += int((~new).sum())
+				seen.update(df.index[new])
+				df, df_classes = df[new], df_classes[new]
+			if first:
+				save_transform(plan, df.columns)
+			df = pd.concat([df_classes, df], axis=1)
+			if first:
+				print('\nSnapshot of imputed data...')
+				print(df.iloc[:5, :5])
+			df.to_csv(out, sep=args.sep, header=first)
+			first = False
+	if args.remove_dups.lower() in ['t', 'true']:
+		print('\nNumber of duplicate row names deleted: %i' % dups_count)
+
+	print('\nOutput file saved as: %s' % save_name)
+	print('\nDone!')
+
+
+if args.chunk > 0:
+	preprocess_stream(args)
+	sys.exit(0)
+
 ###### Read in data #######
 
 
-df = pd.read_csv(args.df, sep=args.sep, index_col=0, encoding='latin1')
-df = df.replace(['?', 'NA', 'na', 'n/a', '', '.'], np.nan)
+df = ML.fun.Read_DF(args.df, args.sep, encoding='latin1', n_jobs=args.n_jobs,
+	na_values=NA_TOKENS)
+kinds = {c: d.kind for c, d in zip(df.columns, df.dtypes)}
+df = ML.fun.Cast_Features(df, args.dtype, args.y_name)
 
 print('Snapshot of input data...')
 print(df.iloc[:5, :5])
@@ -97,62 +351,57 @@ df = df.drop(args.y_name, 1)
 ###### Remove NAs with too much data missing or if na_method = 0 #######
 
 print('\n\n### Dropping/imputing NAs... ###')
-cols_with_na = df.columns[df.isna().any()].tolist()
+na_counts = df.isna().sum()
+cols_with_na = na_counts.index[na_counts > 0].tolist()
 print('\nNumber of columns with NAs: %i' % len(cols_with_na))
 
-# Shiu: Fix two issues,
-#  1) drop_percent is misleading and people can be giving percent number
-#  2) If user does provide a drop_percent, it is not properly converted to
-#     a floating point number and a TypeError will be thrown.
-args.drop_percent = float(args.drop_percent)
-if args.drop_percent > 1 or args.drop_percent < 0:
-	print('\nERR: drop_percent is between 0 and 1, but %f is specified\n' %\
-		args.drop_percent)
-	sys.exit(0)
-
 dropped = []
-if len(cols_with_na) > 0:
+if imputer is not None:
+	dropped = [c for c in imputer['drop'] if c in df.columns]
+elif len(cols_with_na) > 0:
 	if args.na_method == 'drop':
-		df = df.drop(cols_with_na, 1)
+		df = df.drop(cols_with_na, axis=1)
 	else:
-		for col in cols_with_na:
-			missing = df.loc[:, col].isnull().sum()
-			miss_pct = missing / len(df)
-			if miss_pct > args.drop_percent:
-				dropped.append(col)
+		miss_pct = na_counts[cols_with_na] / len(df)
+		dropped = miss_pct.index[miss_pct > args.drop_percent].tolist()
 
 if len(dropped) > 0:
 	print('\nFeatures dropped because missing > %.2f%% of data: %s' % \
 		(args.drop_percent * 100, dropped))
-	df.drop(dropped, 1, inplace=True)
+	df.drop(dropped, axis=1, inplace=True)
 
-cols_to_impute = [x for x in cols_with_na if x not in dropped]
+cols_to_impute = [x for x in cols_with_na if x in df.columns]
 print('Number of columns to impute: %i' % len(cols_to_impute))
 
 ###### Impute remaining NAs ####### 
 
-if len(cols_to_impute) > 0 and args.na_method != 'drop':
-	for col in cols_to_impute:
-		col_type = df[col].dtypes
-
-		if col_type == 'object':
-			df[col].fillna(df[col].mode()[0], inplace=True)
-
-		elif args.na_method == 'mean':
-			df[col].fillna(df[col].mean(), inplace=True)
-
-		elif args.na_method == 'median':
-			df[col].fillna(df[col].median(), inplace=True)
-
-		else:
-			print('Need to specify method for imputation')
-			quit()
+if imputer is not None:
+	fill = {c: v for c, v in imputer['fill'].items() if c in df.columns}
+	missing_fill = [c for c in cols_to_impute if c not in fill]
+	if len(missing_fill) > 0:
+		print('\nWARNING: no fill value in %s for: %s' % (args.imputer,
+			missing_fill))
+	df = ML.fun.Impute_Apply(df, fill)
+elif args.na_method == 'drop':
+	fill = {}
+	save_imputer(cols_with_na, fill)
+else:
+	if args.na_method not in ['mean', 'median'] and any(
+		df[c].dtype.kind != 'O' for c in cols_to_impute):
+		print('Need to specify method for imputation')
+		quit()
+	# Fill values of every column, so other data can be imputed the same way
+	fill = ML.fun.Impute_Fit(df, args.na_method)
+	df = ML.fun.Impute_Apply(df, fill)
+	save_imputer(dropped, fill)
 
 ###### One-Hot-Encode any categorical features ####### 
 
 if args.onehot.lower() == 't':
 	print('\n\n### One Hot Encoding... ###')
-	if args.onehot_list == 'default':
+	if vocab is not None:
+		cols_cat = list(vocab)
+	elif args.onehot_list == 'default':
 		cols_cat = list(df.select_dtypes(include=['object']).columns)
 	else:
 		with open(args.onehot_list) as f:
@@ -161,14 +410,22 @@ if args.onehot.lower() == 't':
 	print('\nFeatures to one-hot-encode: %s' % cols_cat)
 	start_shape = df.shape
 
-	for col in cols_cat:
-		df = pd.concat([df, pd.get_dummies(df[col], prefix=col)], axis=1)
-		df.drop([col], axis=1, inplace=True)
+	if vocab is None:
+		vocab = ML.fun.Onehot_Fit(df, cols_cat)
+		save_vocab(vocab)
+	df, unseen = ML.fun.Onehot_Apply(df, vocab,
+		args.sparse.lower() in ['t', 'true'])
+	if unseen > 0:
+		print('WARNING: %i values not in %s (encoded as all 0s)' % (unseen,
+			args.onehot_vocab))
 
 	end_shape = df.shape
 	print('Dataframe shape (rows, cols) before and after one-hot-encoding:\n'+\
 		'Before: %s\nAfter: %s' % (start_shape, end_shape))
 
+# Imputed and one-hot-encoded columns may now be 0/1 (-dtype uint8)
+df = ML.fun.Cast_Features(df, args.dtype, args.y_name)
+
 ###### Remove duplicate rows #######
 
 if args.remove_dups.lower() in ['t', 'true']:
@@ -192,6 +449,13 @@ if args.drop.lower() != 'na':
 		f_drop = f.read().strip().splitlines()
 	df = df.drop(f_drop, axis=1)
 
+plan = {'na_tokens': NA_TOKENS, 'y_name': args.y_name, 'dtype': args.dtype,
+	'drop': cols_with_na if imputer is None and args.na_method == 'drop' else \
+		dropped, 'fill': fill, 'onehot': vocab or {},
+	'binary': [c for c, d in zip(df.columns, df.dtypes) if d == np.uint8],
+	'sparse': args.sparse.lower() in ['t', 'true'], 'kinds': kinds}
+save_transform(plan, [c for c in df.columns if c != args.y_name])
+
 ###### Add class column back in and save ######
 
 df = pd.concat([df_classes, df], axis=1)
@@ -0,0 +1,164 @@
+import sys, os, argparse
+import pandas as pd
+import numpy as np
+import ML_functions as ML
+
+
+###### Parse input parameters #######
+
+parser = argparse.ArgumentParser(
+	description='Remove constant, near-constant and duplicate feature '+\
+		'columns (e.g. from k-mer or one-hot matrices), and optionally highly '+\
+		'correlated ones (e.g. SNPs in LD), before feature selection and '+\
+		'modeling. The removed columns are listed in '+\
+		'[df]_redundant.txt, which can be used to add the duplicates back to '+\
+		'the importance scores of a model (-imp).',
+	epilog='https://github.com/ShiuLab/ML_Pipeline/')
+
+parser.add_argument(
+	'-df',
+	help='Feature & class dataframe (e.g. output of ML_preprocess.py). Must '+\
+		'be specified',
+	required=True)
+parser.add_argument(
+	'-y_name',
+	help='Name of lable column in dataframe, default=Class',
+	default='Class')
+parser.add_argument(
+	'-sep',
+	help='Deliminator, default="\t"',
+	default='\t')
+parser.add_argument(
+	'-n_jobs',
+	help='Number of processes to parse -df with, default=1',
+	type=int,
+	default=1)
+parser.add_argument(
+	'-near_constant',
+	help='Also remove columns where one value is in more than this '+\
+		'proportion of the rows (e.g. 0.95). default=1 (only constant columns)',
+	type=float,
+	default=1.0)
+parser.add_argument(
+	'-dups',
+	help='t/f. Remove columns identical to an earlier column, default=t',
+	default='t')
+parser.add_argument(
+	'-corr',
+	help='Also remove features with |r| > corr with a feature kept before '+\
+		'them (features are taken by -corr_keep), e.g. 0.9. default=0 (off)',
+	type=float,
+	default=0)
+parser.add_argument(
+	'-corr_keep',
+	help='assoc/na. Of correlated features, keep the ones with the higher '+\
+		'association with y_name (assoc) or the lower NA rate (na) first, '+\
+		'default=assoc',
+	default='assoc')
+parser.add_argument(
+	'-type',
+	help='c/r. Association with y_name for -corr_keep: ANOVA F of the classes '+\
+		'(c) or absolute Pearson correlation (r), default=c',
+	default='c')
+parser.add_argument(
+	'-cl_train',
+	help='Comma-separated classes to compute the association with (-type c), '+\
+		'default=all',
+	default='all')
+parser.add_argument(
+	'-corr_block',
+	help='Number of features per block of correlations (memory is about '+\
+		'rows x corr_block x 12 bytes), default=2000',
+	type=int,
+	default=2000)
+parser.add_argument(
+	'-mmap_dir',
+	help='Directory for the memory-mapped standardized matrix used by -corr '+\
+		'(rows x features x 8 bytes), default: system temp dir',
+	default=None)
+parser.add_argument(
+	'-chunk',
+	help='Number of columns to summarize at a time, default=1000',
+	type=int,
+	default=1000)
+parser.add_argument(
+	'-imp',
+	help='Instead of removing columns: add the duplicates listed in -map back '+\
+		'to this importance file ([save]_imp), with the scores of the column '+\
+		'kept in their place. Saved as [imp]_expanded',
+	default='')
+parser.add_argument(
+	'-map',
+	help='Removed columns file to use with -imp, default=[df]_redundant.txt',
+	default='')
+
+if len(sys.argv) == 1:
+	parser.print_help()
+	sys.exit(0)
+args = parser.parse_args()
+
+map_name = args.df.replace('.txt','') + '_redundant.txt'
+if args.map != '':
+	map_name = args.map
+
+###### Expand importance scores #######
+
+if args.imp != '':
+	removed = ML.fun.Redundant_Load(map_name)
+	imp = pd.read_csv(args.imp, sep='\t', index_col=0)
+	n = len(imp)
+	imp = ML.fun.Expand_Importance(imp, removed)
+	imp = imp.sort_values(imp.columns[0], ascending=False)
+	ML.fun.Write_CSV(imp, args.imp + '_expanded', sep='\t', index=True)
+	print('%i duplicate features added to %s, saved as: %s' % (len(imp) - n,
+		args.imp, args.imp + '_expanded'))
+	print('\nDone!')
+	sys.exit(0)
+
+###### Find and remove redundant columns #######
+
+df = ML.fun.Read_DF(args.df, args.sep, n_jobs=args.n_jobs)
+if args.y_name not in df.columns:
+	print("\nERR: y_name is specified as %s: does not exist\n" % args.y_name)
+	sys.exit(0)
+
+removed = ML.fun.Redundant_Fit(df, args.y_name, args.near_constant,
+	args.dups.lower() in ['t', 'true'], args.chunk)
+
+# Correlated features, taken by association with y (or NA rate) first
+if args.corr > 0:
+	features = [c for c, d in zip(df.columns, df.dtypes)
+		if c != args.y_name and d.kind in 'biuf' and c not in removed]
+	y = df[args.y_name]
+	if args.type.lower() in ['r', 'regression']:
+		y, kind = pd.to_numeric(y, errors='coerce'), 'r'
+	else:
+		if args.cl_train != 'all':
+			y = y.where(y.astype(str).isin(args.cl_train.split(',')))
+		kind = 'c'
+	score = ML.fun.Univariate_Score(df, y, kind, args.y_name, args.chunk,
+		features).values
+	na_rate = df[features].isna().mean().values
+	position = np.arange(len(features))
+	if args.corr_keep == 'na':
+		order = np.lexsort((position, -score, na_rate))
+	else:
+		order = np.lexsort((position, na_rate, -score))
+	removed.update(ML.fun.Corr_Prune(df, args.corr, order, args.y_name,
+		args.corr_block, args.mmap_dir, features))
+
+reasons = [reason for reason, kept in removed.values()]
+print('Columns removed: %i constant, %i near-constant, %i duplicate, %i '
+	'correlated' % (reasons.count('constant'), reasons.count('near_constant'),
+	reasons.count('duplicate'), reasons.count('correlated')))
+print('Dataframe shape (rows, cols) before and after: %s, %s' % (
+	str(df.shape), str((df.shape[0], df.shape[1] - len(removed)))))
+
+ML.fun.Redundant_Save(map_name, removed)
+df = df.drop(list(removed), axis=1)
+save_name = args.df.replace('.txt','') + '_nr.txt'
+ML.fun.Write_CSV(df, save_name, sep=args.sep, header=True)
+
+print('\nRemoved columns saved as: %s' % map_name)
+print('Output file saved as: %s' % save_name)
+print('\nDone!')
@@ -40,13 +40,21 @@ def main():
 	inp_group.add_argument('-test', help='File with testing lines', default='')
 	inp_group.add_argument('-feat', help='File with list of features (from x) '
 		'to include', default='all')
+	inp_group.add_argument('-feat_index', help='t/f With -feat, build (on '
+		'first use) and use a column-offset index of -df ([df].colidx.npz), '
+		'so only the listed columns are read from each line', default='f')
 
 	# Model behavior 
 	pipln_group = parser.add_argument_group(title='CONTROL PIPELINE BEHAVIOR')
 	pipln_group.add_argument('-apply', help='Non-training Y labels that the '
 		'models should be applied to (e.g. unknown)', default='')
 	pipln_group.add_argument('-n_jobs', '-p', help='Number of processors for '
-		'parallel computing (max for HPCC = 14)', type=int, default=1)
+		'parallel computing, also used to parse -df (max for HPCC = 14)',
+		type=int, default=1)
+	pipln_group.add_argument('-mmap_dir', help='Directory for the read-only '
+		'memory-mapped feature matrix shared by the grid search workers '
+		'(-n_jobs > 1), e.g. node-local /tmp, or /dev/shm for shared memory. '
+		'Default: system temp dir', default=None)
 	pipln_group.add_argument('-n', '-b', help='Number of replicates (unique '
 		'balanced datasets).', type=int, default=100)
 	pipln_group.add_argument('-threshold_test', help='Metric used to define '
@@ -57,6 +65,17 @@ def main():
 	pipln_group.add_argument('-x_norm', help='t/f to normalize features '
 		'(default to T for SVM based algs unless "force_false")', default='f')
 	pipln_group.add_argument('-y_norm', help='t/f to normalize Y)', default='f')
+	pipln_group.add_argument('-transform', help='Transform saved by '
+		'ML_preprocess.py for -df ([df]_transform.json). Its steps are '
+		'included in the [save]_transform.json of this run, so new instances '
+		'can be transformed for the model with ML_transform.py', default='')
+	pipln_group.add_argument('-dtype', help='float64, float32 (features kept '
+		'as float32), or uint8 (float32, with 0/1 features stored as uint8) '
+		'to cut memory, default=float64', default='float64')
+	pipln_group.add_argument('-sparse', help='t/f Keep the features sparse '
+		'(scipy CSR for the models) for mostly-zero data such as k-mer or '
+		'one-hot matrices. Normalization then scales by the max absolute '
+		'value instead of min/max, default=f', default='f')
 	pipln_group.add_argument('-drop_na', help='t/f to drop rows with NAs',
 		default='f')
 	pipln_group.add_argument('-cv_num', '-cv', help='Cross validation fold #',
@@ -69,14 +88,22 @@ def main():
 	gs_group.add_argument('-gs', help='t/f if grid search over parameter space '
 		'is desired.', type=str, default='t')
 	gs_group.add_argument('-gs_reps', '-gs_n', help='Number of Grid Search '
-		'Reps (will append results if SAVE_GridSearch.csv exists)',
+		'Reps (reps already in the -gs_cache are not refit)',
 		type=int, default=10)
 	gs_group.add_argument('-gs_score', help='Metric used to select best '
 		'parameters', type=str, default='neg_mean_squared_error')
-	gs_group.add_argument('-gs_type', help='Full grid search or randomized '
-		'search (full/random)', type=str, default='full')
+	gs_group.add_argument('-gs_type', help='Full grid search, randomized '
+		'search, or successive halving of the full grid over the gs_reps '
+		'(full/random/halving)', type=str, default='full')
 	gs_group.add_argument('-gs_full', help='t/f Output full results from the '
 		'grid search', type=str, default='f')
+	gs_group.add_argument('-gs_cache', help='t/f or path to a SQLite file '
+		'caching grid search fold scores, so a rerun only fits missing reps/'
+		'parameters (t = SAVE_GridSearch.db)', type=str, default='t')
+	gs_group.add_argument('-gs_warm', help='t/f For RF/GB, grow one '
+		'warm-started ensemble per fold and score it at each n_estimators '
+		'value instead of fitting every n_estimators from scratch', type=str,
+		default='f')
 
 	# Output arguments
 	out_group = parser.add_argument_group(title='OUTPUT OPTIONS')
@@ -84,6 +111,13 @@ def main():
 		'will overwrite!', default='')
 	out_group.add_argument('-tag', help='Identifier string to add to RESULTS '
 		'output line', default='')
+	out_group.add_argument('-results', help='SQLite results ledger that '
+		'every run adds its RESULTS line, parameters and metrics to (see '
+		'ML_results.py to query/export it)', default='RESULTS.db')
+	out_group.add_argument('-results_txt', help='t/f Also append the run to '
+		'RESULTS_reg.txt, as before the ledger (the ledger keeps every run; '
+		'ML_results.py -export rebuilds the table from it), default=t',
+		default='t')
 	out_group.add_argument('-out_loc', help='Path to where output files are '
 		'saved. Default to cwd.', default='')
 	out_group.add_argument('-plots', help='t/f Output ROC and PR curve plots '
@@ -134,12 +168,20 @@ def main():
 
 	####### Load Dataframe & Pre-process #######
 
-	df = pd.read_csv(args.df, sep=args.sep, index_col=0)
+	# With -feat, only the listed features (and y) are loaded
+	features, columns = None, None
+	if args.feat != 'all':
+		print('Using subset of features from: %s' % args.feat)
+		with open(args.feat) as f:
+			features = f.read().strip().splitlines()
+		columns = features if args.df2 != '' else [args.y_name] + features
+	df = ML.fun.Read_DF(args.df, args.sep, columns=columns,
+		col_index=args.feat_index.lower() in ['t', 'true'], n_jobs=args.n_jobs)
 
 	# If features  and class info are in separate files, merge them: 
 	if args.df2 != '':
 		start_dim = df.shape
-		df_class = pd.read_csv(args.df2, sep=args.sep, index_col=0)
+		df_class = ML.fun.Read_DF(args.df2, args.sep)
 		df = pd.concat([df_class[args.y_name], df], axis=1, join='inner')
 		print('Merging the X and Y dfs. Dim change: %s to %s (instance, feat).'
 			% (str(start_dim), str(df.shape)))
@@ -148,33 +190,36 @@ def main():
 	if args.y_name != 'Y':
 		df = df.rename(columns={args.y_name: 'Y'})
 
+	# Reduced-precision (-dtype) and sparse (-sparse) features
+	df = ML.fun.Cast_Features(df, args.dtype, 'Y')
+	if args.sparse.lower() in ['t', 'true']:
+		df = ML.fun.To_Sparse(df, args.dtype, 'Y')
 
-	# Filter out features not in feat file given - default: keep all
-	if args.feat != 'all':
-		print('Using subset of features from: %s' % args.feat)
-		with open(args.feat) as f:
-			features = f.read().strip().splitlines()
-			features = ['Y'] + features
-		df = df.loc[:,features]
 
-	# Check for Nas
-	if df.isnull().values.any() == True:
+	# Put the Y and features in the order of the feat file
+	if features is not None:
+		df = df.loc[:, ['Y'] + features]
+
+	# Check for Nas (blockwise, so sparse features are not densified)
+	na_rows, na_cols = ML.fun.NA_Mask(df)
+	if na_rows.any():
 		if args.drop_na.lower() in ['t', 'true']:
 			start_dim = df.shape
-			df = df.dropna(axis=0)
+			df = df[~na_rows]
 			print('Dropping rows with NAs... dim change: %s to %s.'
 				% (str(start_dim), str(df.shape)))
 		else:
-			print(df.columns[df.isnull().any()].tolist())
+			print(na_cols)
 			print('There are Na values in your dataframe.\n '
 				'Impute them or add -drop_na True to remove rows with nas')
 			quit()
 
-	# Normalize feature data (x_norm)
+	# Normalize feature data (x_norm), fit on the training instances only
+	# (not -test or -apply)
+	scale = None
 	if (args.alg.lower() in ["svm", "svmpoly", "svmrbf"] or 
 		args.norm.lower() in ['t', 'true']):
 		if args.norm.lower != 'force_false':
-			from sklearn import preprocessing
 			try:
 				y = df['Y']
 			except:
@@ -182,10 +227,19 @@ def main():
 				" 'Y', (2) your data is tab delimited or -sep is specified")
 				quit()
 			X = df.drop(['Y'], axis=1)
-			min_max_scaler = preprocessing.MinMaxScaler()
-			X_scaled = min_max_scaler.fit_transform(X)
-			df = pd.DataFrame(X_scaled, columns=X.columns, index=X.index)
+			train = np.ones(len(df), dtype=bool)
+			if args.apply != '':
+				train &= ~y.astype(str).str.match(args.apply).values
+			if args.test != '':
+				with open(args.test) as test_file:
+					test_instances = test_file.read().splitlines()
+				train &= ~df.index.astype(str).isin(test_instances)
+
+			# Min/max scaling (max abs value if sparse, so it is not densified)
+			scale = ML.fun.Scale_Fit(X[train])
+			df = ML.fun.Scale_Apply(X, scale)
 			df.insert(loc=0, column='Y', value=y)
+			df = ML.fun.Cast_Features(df, args.dtype, 'Y')
 
 	# Set up dataframe of unknown instances that the final models will be 
 	# applied to and drop unknowns from df for model building
@@ -236,6 +290,26 @@ def main():
 				args.save = (args.out_loc + '/' + args.df + "_" + args.alg +
 					"_" + args.tag)
 
+	# Transform for new instances (ML_transform.py): the -transform steps,
+	# the features used and their scaling
+	if args.transform != '':
+		transform = ML.fun.Transform_Load(args.transform)
+		transform['dtype'] = args.dtype
+	else:
+		transform = ML.fun.Transform_New(args.y_name, args.dtype, {c: d.kind
+			for c, d in zip(df.columns, df.dtypes) if c != 'Y'})
+	transform['keep'] = [c for c in df.columns if c != 'Y']
+	transform['binary'] = [c for c, d in zip(df.columns, df.dtypes)
+		if d == np.uint8]
+	transform['scale'] = scale
+	ML.fun.Transform_Save(args.save + '_transform.json', transform)
+
+	# Grid search cache file ('' = no cache)
+	if args.gs_cache.lower() in ['t', 'true']:
+		args.gs_cache = args.save + '_GridSearch.db'
+	elif args.gs_cache.lower() in ['f', 'false']:
+		args.gs_cache = ''
+
 	print("Snapshot of data being used:")
 	print(df.ix[:5, :5])
 
@@ -254,7 +328,8 @@ def main():
 			print("\n\n===>  Grid search started  <===")
 			params2use, param_names = ML.fun.RegGridSearch(df, args.save,
 				args.alg, args.gs_score, args.n, args.cv_num, args.n_jobs,
-				args.gs_reps, args.gs_type, args.gs_full)
+				args.gs_reps, args.gs_type, args.gs_full, args.gs_cache,
+				args.gs_warm.lower() in ['t', 'true'], args.mmap_dir)
 
 			# Print results from grid search
 			if args.alg.lower() == 'rf':
@@ -392,10 +467,10 @@ def main():
 
 	scores_file = args.save + "_scores.txt"
 	if args.short in ['t', 'true']:
-			predictions.to_csv(scores_file, sep='\t',
+			ML.fun.Write_CSV(predictions, scores_file, sep='\t',
 				columns=['Y', 'Mean', 'stdev'])
 	else:
-		predictions.to_csv(scores_file, sep='\t')
+		ML.fun.Write_CSV(predictions, scores_file, sep='\t')
 
 	# Plot results
 	if args.plots.lower() in ['true', 't']:
@@ -407,26 +482,22 @@ def main():
 		imp['mean_imp'] = imp.mean(axis=1)
 		imp = imp.sort_values('mean_imp', 0, ascending=False)
 		imp_out = args.save + "_imp"
-		imp['mean_imp'].to_csv(imp_out, sep="\t", index=True)
+		ML.fun.Write_CSV(imp['mean_imp'], imp_out, sep="\t", index=True)
 	except:
 		pass
 
 	run_time = time.time() - start_total_time
 
-	# Save to summary RESULTS file with all models run from the same directory
-	if not os.path.isfile('RESULTS_reg.txt'):
-		out2 = open('RESULTS_reg.txt', 'a')
-		out2.write('DateTime\tRunTime\tID\tTag\tY\tAlg\tNumInstances\t'
-			'FeatureNum\tCVfold\tCV_rep\tMSE_val\tMSE_val_sd\tMSE_val_se\t'
-			'EVS_val\tEVS_val_sd\tEVS_val_se\tr2_val\tr2_val_sd\tr2_val_se\t'
-			'PCC_val\tPCC_val_sd\tPCC_val_se\tMSE_test\tMSE_test_sd\t'
-			'MSE_test_se\tEVS_test\tEVS_test_sd\tEVS_test_se\tr2_test\t'
-			'r2_test_sd\tr2_test_se\tPCC_test\tPCC_test_sd\tPCC_test_se\n')
-		out2.close()
-
-	out2 = open('RESULTS_reg.txt', 'a')
-	out2.write('%s\t%s\t%s\t%s\t%s\t%s\t%i\t%i\t%i\t%i\t%s\t%s\t%s\t%s\t%s\t%s'
-		'\t%s\t%s\n' % (
+	# Save to the summary RESULTS ledger with all models run from the same
+	# directory (and RESULTS_reg.txt appended to, with -results_txt t)
+	results_header = ('DateTime\tRunTime\tID\tTag\tY\tAlg\tNumInstances\t'
+		'FeatureNum\tCVfold\tCV_rep\tMSE_val\tMSE_val_sd\tMSE_val_se\t'
+		'EVS_val\tEVS_val_sd\tEVS_val_se\tr2_val\tr2_val_sd\tr2_val_se\t'
+		'PCC_val\tPCC_val_sd\tPCC_val_se\tMSE_test\tMSE_test_sd\t'
+		'MSE_test_se\tEVS_test\tEVS_test_sd\tEVS_test_se\tr2_test\t'
+		'r2_test_sd\tr2_test_se\tPCC_test\tPCC_test_sd\tPCC_test_se')
+	results_line = ('%s\t%s\t%s\t%s\t%s\t%s\t%i\t%i\t%i\t%i\t%s\t%s\t%s\t%s'
+		'\t%s\t%s\t%s\t%s' % (
 		timestamp, run_time, args.save, args.tag, args.y_name, args.alg,
 		len(df.index), n_features, args.cv_num, args.n,
 		'\t'.join(str(x) for x in MSE_stats),
@@ -437,6 +508,11 @@ def main():
 		'\t'.join(str(x) for x in EVS_test_stats),
 		'\t'.join(str(x) for x in r2_test_stats),
 		'\t'.join(str(x) for x in PCC_test_stats)))
+	ML.fun.Ledger_Add(args.results, 'r', results_header, results_line,
+		args.feat, params2use, vars(args))
+	if args.results_txt.lower() in ['t', 'true']:
+		ML.fun.Results_Append('RESULTS_reg.txt', 'r', results_header,
+			results_line)
 
 
 	# Save detailed results file 
@@ -0,0 +1,88 @@
+import sys, os, argparse
+import pandas as pd
+import ML_functions as ML
+
+
+###### Parse input parameters #######
+
+parser = argparse.ArgumentParser(
+	description='Query the results ledger written by ML_classification.py '+\
+		'and ML_regression.py (RESULTS.db): summarize metrics by tag/'+\
+		'algorithm/feature set, or export the runs as the legacy '+\
+		'RESULTS.txt/RESULTS_reg.txt table.',
+	epilog='https://github.com/ShiuLab/ML_Pipeline/')
+
+parser.add_argument(
+	'-db',
+	help='Results ledger, default=RESULTS.db',
+	default='RESULTS.db')
+parser.add_argument(
+	'-type',
+	help='c/r (classification vs. regression runs), default=c',
+	default='c')
+parser.add_argument(
+	'-tag',
+	help='Comma-separated tags to keep, default=all',
+	default='all')
+parser.add_argument(
+	'-alg',
+	help='Comma-separated algorithms to keep, default=all',
+	default='all')
+parser.add_argument(
+	'-feat',
+	help='Comma-separated feature sets (-feat of the runs) to keep, '+\
+		'default=all runs',
+	default='')
+parser.add_argument(
+	'-metrics',
+	help='Comma-separated RESULTS columns to summarize, default=AUCROC_val,'+\
+		'F1_val (classification) or r2_val,PCC_val (regression)',
+	default='default')
+parser.add_argument(
+	'-by',
+	help='Comma-separated run fields to group by (tag, alg, features, id), '+\
+		'default=tag,alg,features',
+	default='tag,alg,features')
+parser.add_argument(
+	'-export',
+	help='Write the selected runs in the legacy RESULTS layout to this file '+\
+		'instead of summarizing (e.g. RESULTS.txt)',
+	default='')
+
+if len(sys.argv) == 1:
+	parser.print_help()
+	sys.exit(0)
+args = parser.parse_args()
+
+if not os.path.isfile(args.db):
+	print('ERR: results ledger %s does not exist' % args.db)
+	sys.exit(1)
+
+kind = 'r' if args.type.lower() in ['r', 'regression'] else 'c'
+filters = {}
+for col, keep in [('tag', args.tag), ('alg', args.alg)]:
+	if keep != 'all':
+		filters[col] = keep.split(',')
+if args.feat != '':
+	filters['features'] = args.feat.split(',')
+
+###### Export or summarize the selected runs #######
+
+if args.export != '':
+	n = ML.fun.Ledger_Export(args.db, kind, args.export, **filters)
+	print('Exported %i runs to %s' % (n, args.export))
+else:
+	if args.metrics == 'default':
+		metrics = ['r2_val', 'PCC_val'] if kind == 'r' else ['AUCROC_val',
+			'F1_val']
+	else:
+		metrics = args.metrics.split(',')
+	by = args.by.split(',')
+	if any(col not in ['tag', 'alg', 'features', 'id'] for col in by):
+		print('ERR: -by can only use tag, alg, features and id')
+		sys.exit(1)
+	summary = ML.fun.Ledger_Summary(args.db, kind, metrics, by, **filters)
+	with pd.option_context('display.max_rows', None, 'display.width', 200):
+		print(summary.to_string(index=False))
+
+print('\nDone!')
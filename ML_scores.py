@@ -0,0 +1,50 @@
+import sys, os, argparse
+import ML_functions as ML
+
+
+###### Parse input parameters #######
+
+parser = argparse.ArgumentParser(
+	description='Export the binary prediction scores saved by '+\
+		'ML_classification.py ([save]_scores.npz) to the text scores file '+\
+		'([save]_scores.txt).',
+	epilog='https://github.com/ShiuLab/ML_Pipeline/')
+
+parser.add_argument(
+	'-scores',
+	help='Binary scores file(s) to export. Must be specified',
+	nargs='+',
+	required=True)
+parser.add_argument(
+	'-short',
+	help='t/f. Export only the summary columns (as ML_classification.py '+\
+		'-short t), default=f',
+	default='f')
+parser.add_argument(
+	'-out',
+	help='Output file (only with one -scores file), default=[save]_scores.txt',
+	default='')
+
+if len(sys.argv) == 1:
+	parser.print_help()
+	sys.exit(0)
+args = parser.parse_args()
+
+if args.out != '' and len(args.scores) > 1:
+	print('ERR: -out can only be used with one -scores file')
+	sys.exit(1)
+
+###### Export each scores file #######
+
+for scores in args.scores:
+	df_proba, meta = ML.fun.Scores_Load(scores,
+		args.short.lower() in ['t', 'true'])
+	if args.out != '':
+		out = args.out
+	else:
+		out = os.path.splitext(scores)[0] + '.txt'
+	ML.fun.Scores_TSV(df_proba, out, meta['header'])
+	print('%s: exported %i x %i to %s' % (scores, df_proba.shape[0],
+		df_proba.shape[1], out))
+
+print('\nDone!')
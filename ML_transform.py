@@ -0,0 +1,72 @@
+import sys, os, argparse
+import pandas as pd
+import ML_functions as ML
+
+
+###### Parse input parameters #######
+
+parser = argparse.ArgumentParser(
+	description='Transform new instances with a fitted transform: the NA '+\
+		'drops/fills and one-hot encoding of ML_preprocess.py ([df]_transform'+\
+		'.json), plus the feature columns and scaling of a model run '+\
+		'([save]_transform.json from ML_classification.py/ML_regression.py). '+\
+		'The file is processed a chunk of rows at a time, so the time and '+\
+		'memory needed only depend on the new data.',
+	epilog='https://github.com/ShiuLab/ML_Pipeline/')
+
+parser.add_argument(
+	'-df',
+	help='New instances, in the format of the data the transform was fitted '+\
+		'on (the class column is optional). Must be specified',
+	required=True)
+parser.add_argument(
+	'-transform',
+	help='Fitted transform ([df]_transform.json or [save]_transform.json). '+\
+		'Must be specified',
+	required=True)
+parser.add_argument(
+	'-sep',
+	help='Deliminator, default="\t"',
+	default='\t')
+parser.add_argument(
+	'-chunk',
+	help='Number of rows to transform at a time, default=10000',
+	type=int,
+	default=10000)
+parser.add_argument(
+	'-save',
+	help='Output file, default=[df]_transformed.txt',
+	default='')
+
+if len(sys.argv) == 1:
+	parser.print_help()
+	sys.exit(0)
+args = parser.parse_args()
+
+if args.save == '':
+	args.save = args.df.replace('.txt','') + '_transformed.txt'
+
+transform = ML.fun.Transform_Load(args.transform)
+
+# Read every column with the dtype it had in the data the transform was fit
+# on, whatever the values in each chunk
+dtypes = {c: {'O': str, 'f': 'float64'}[k] for c, k in
+	transform.get('kinds', {}).items() if k in 'Of'}
+
+###### Transform the new instances chunk by chunk #######
+
+n, first = 0, True
+with open(args.save, 'w') as out:
+	for df in pd.read_csv(args.df, sep=args.sep, index_col=0,
+		encoding='latin1', chunksize=args.chunk, dtype=dtypes,
+		na_values=transform['na_tokens']):
+		df_classes, df = ML.fun.Transform_Apply(df, transform)
+		if df_classes is not None:
+			df = pd.concat([df_classes, df], axis=1)
+		df.to_csv(out, sep=args.sep, header=first)
+		n += len(df)
+		first = False
+
+print('%i instances transformed with %s, saved as: %s' % (n, args.transform,
+	args.save))
+print('\nDone!')
@@ -1,4 +1,4 @@
-import sys, os, argparse
+import sys, os, argparse, json
 import pandas as pd
 import numpy as np
 import matplotlib
@@ -14,7 +14,7 @@ warnings.filterwarnings("ignore")
 ###### Parse input parameters #######
 
 parser = argparse.ArgumentParser(
-	description='Code to make ROC and PR plots from multiple ML runs (need _scores.txt files). \
+	description='Code to make ROC and PR plots from multiple ML runs (need _scores.npz or _scores.txt files). \
 	Plots mean score over the balanced runs with stdev error bars.',
 	epilog='https://github.com/ShiuLab/ML_Pipeline/')
 
@@ -29,12 +29,28 @@ if len(sys.argv)==1:
 	sys.exit(0)
 args = parser.parse_args()
 
+def read_scores(path):
+  """ Class and replicate score columns of a run, from the binary _scores.npz
+  saved by ML_classification.py if there is one, else from _scores.txt """
+  npz = path.replace('_scores.txt', '_scores.npz')
+  if not os.path.isfile(npz):
+    return pd.read_csv(path, sep='\t', index_col = 0)
+  with np.load(npz) as scores:
+    meta = json.loads(str(scores['meta']))
+    data = OrderedDict()
+    data['Class'] = scores['col_%i' % meta['other_columns'].index('Class')]
+    for j, names in enumerate(meta['rep_columns']):
+      data[names[0]] = scores['rep_%i' % j]
+    index = pd.Index(scores['index'].astype(str))
+  return pd.DataFrame(data, index=index)
+
 POS, NEG = args.cl_train[0], args.cl_train[1]
 items = OrderedDict()
 
 # Organize all _scores and _BalancedIDs files into dictionary
 for i in range(len(args.names)):
-  items[args.names[i]] = [args.scores[i], args.scores[i].replace('_scores.txt', '_BalancedIDs')]
+  bal_file = args.scores[i].replace('_scores.txt', '_BalancedIDs').replace('_scores.npz', '_BalancedIDs')
+  items[args.names[i]] = [args.scores[i], bal_file]
 
 
 n_lines = len(items)
@@ -46,12 +62,16 @@ Prec_all = {}
 
 for i in items:
   # Read in scores and which genes were part of the balanced run for each run number
-  df_proba = pd.read_csv(items[i][0], sep='\t', index_col = 0)
+  df_proba = read_scores(items[i][0])
   n = len([c for c in df_proba.columns if c.lower().startswith('score_')])
   balanced_ids = []
-  with open(items[i][1], 'r') as ids:
-    balanced_ids = ids.readlines()
-  balanced_ids = [x.strip().split('\t') for x in balanced_ids]
+  if os.path.isfile(items[i][1] + '.npz'):
+    with np.load(items[i][1] + '.npz') as bal:
+      balanced_ids = bal['ids'][bal['pos']].tolist()
+  else:
+    with open(items[i][1], 'r') as ids:
+      balanced_ids = ids.readlines()
+    balanced_ids = [x.strip().split('\t') for x in balanced_ids]
 
   FPRs = {}
   TPRs = {}
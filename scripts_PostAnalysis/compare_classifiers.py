@@ -1,7 +1,7 @@
 """
 PURPOSE:
-Given a set of _scores.txt results files, output a list of which instances were classified 
-correctly and which incorrectly and summarize with a table of overlaps
+Given a set of _scores.txt (or binary _scores.npz) results files, output a list of which
+instances were classified correctly and which incorrectly and summarize with a table of overlaps
 
 Must set path to Miniconda in HPC:  export PATH=/mnt/home/azodichr/miniconda3/bin:$PATH
 
@@ -31,7 +31,7 @@ python ~/GitHub/ML-Pipeline/compare_classifiers.py -scores NNU_Ras_FET01_df_p0.0
 import pandas as pd
 import numpy as np
 from collections import defaultdict
-import sys, os
+import sys, os, json
 import matplotlib.pyplot as plt
 plt.switch_backend('agg')
 import venn
@@ -60,38 +60,53 @@ ids = IDS.strip().split(',')
 tp = defaultdict(list)
 fn = defaultdict(list)
 
+def read_calls(scores_file):
+  """ (instance, true class, model call) as strings, from the binary _scores.npz
+  saved by ML_classification.py if there is one, else from _scores.txt """
+  npz = scores_file.replace('_scores.txt', '_scores.npz')
+  if os.path.isfile(npz):
+    with np.load(npz) as scores:
+      meta = json.loads(str(scores['meta']))
+      loc_pred = [i for i, s in enumerate(meta['other_columns']) if 'Predicted_' in s]
+      print('Model call is column: %s' % meta['other_columns'][loc_pred[0]])
+      true = scores['col_%i' % meta['other_columns'].index('Class')].astype(str)
+      pred = scores['col_%i' % loc_pred[0]].astype(str)
+      return list(zip(scores['index'].astype(str), true, pred))
+
+  calls = []
+  with open(scores_file) as f:
+    for c2, l in enumerate(f):
+      line = l.strip().split('\t')
+
+      # Find the column with the model calls using the header line
+      if c2 == 0:
+        loc_pred = [i for i, s in enumerate(line) if 'Predicted_' in s]
+        print('Model call is in column #: %s' % str(loc_pred))
+      else:
+        calls.append((line[0], line[1], line[loc_pred[0]]))
+  return calls
+
 count = 0
 tp_total = 0
 for scores_file in scores_files:
-  c2 = 0
-  with open(scores_file) as f:
-      name = ids[count]
-      print('Counting TP and FN for %s' % name)
-      for l in f:
-          line = l.strip().split('\t')
-          
-          # Find the column with the model calls using the header line
-          if c2 == 0:
-            loc_pred = [i for i, s in enumerate(line) if 'Predicted_' in s]
-            print('Model call is in column #: %s' % str(loc_pred))
-
-          else:
-            gene, true, pred = line[0], line[1], line[loc_pred[0]]
-            # Print an example line
-            if c2 == 2:
-              print(gene, true, pred)
-
-            if true == pos: # If gene is a pos gene
-              # Count the total number of TPs in the dataframe (only need to do once!)
-              if count == 0:
-                tp_total += 1     # Add to the count of total number of true positives in the dataframe
-              
-              if pred == pos: # If that pos gene was predicted as pos
-                tp[name].append(gene)
-              else:
-                fn[name].append(gene)
-          c2 += 1
-      count += 1
+  name = ids[count]
+  print('Counting TP and FN for %s' % name)
+  calls = read_calls(scores_file)
+  # Print an example line
+  if len(calls) > 1:
+    print(*calls[1])
+
+  for gene, true, pred in calls:
+    if true == pos: # If gene is a pos gene
+      # Count the total number of TPs in the dataframe (only need to do once!)
+      if count == 0:
+        tp_total += 1     # Add to the count of total number of true positives in the dataframe
+
+      if pred == pos: # If that pos gene was predicted as pos
+        tp[name].append(gene)
+      else:
+        fn[name].append(gene)
+  count += 1
 
 
 out1 = open(save+'_pred_compared.txt', 'w')
@@ -1,5 +1,6 @@
 import sys, os, argparse
 import pandas as pd
+import ML_functions as ML
 
 
 ########################
@@ -25,6 +26,7 @@ inp_group = parser.add_argument_group(title='OPTIONAL INPUT')
 inp_group.add_argument('-y_name', help='Name of column to predict', default='Class')
 inp_group.add_argument('-df2', help='Class data (if not in -df). Need to provide -a.y_name', default='')
 inp_group.add_argument('-sep', help='Deliminator', default='\t')
+inp_group.add_argument('-n_jobs', help='Number of processes to parse -df with', type=int, default=1)
 inp_group.add_argument('-use', help='List of classes to include in test set', default='all')
 inp_group.add_argument('-skip', help='List of classes to not include in test set (i.e. unknown)', default='')
 inp_group.add_argument('-drop_na', help='T/F to drop rows with NAs', default='f')
@@ -41,12 +43,12 @@ if a.save == 'default':
 ### Read in dataframe ###
 #########################
 
-df = pd.read_csv(a.df, sep=a.sep, index_col = 0)
+df = ML.fun.Read_DF(a.df, a.sep, n_jobs=a.n_jobs)
 
 # If features  and class info are in separate files, merge them: 
 if a.df2 != '':
 	start_dim = a.df.shape
-	df_class = pd.read_csv(a.df2, sep=a.sep, index_col = 0)
+	df_class = ML.fun.Read_DF(a.df2, a.sep)
 	df = pd.concat([df_class[a.y_name], df], axis=1, join='inner')
 	print('Merging the feature & class dataframes changed the dimensions from %s to %s (instance, features).' 
 		% (str(start_dim), str(df.shape)))
@@ -0,0 +1,106 @@
+""" GS_Scores and its SQLite cache against sklearn's GridSearchCV """
+import warnings
+
+import numpy as np
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import GradientBoostingClassifier, RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from sklearn.model_selection import GridSearchCV, ParameterGrid
+
+from ML_functions import fun
+
+
+@pytest.fixture
+def data():
+	X, y = make_classification(n_samples=120, n_features=8, random_state=0)
+	# Two reps of 80 rows each, as GridSearch draws its balanced datasets
+	rows = {0: np.arange(0, 80), 1: np.arange(40, 120)}
+	return X, y, rows
+
+
+def sklearn_scores(model, grid, X, y, rows, gs_score, cv_num):
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore')
+		gs = GridSearchCV(model, grid, scoring=gs_score, cv=cv_num,
+			error_score=np.nan).fit(X[rows], y[rows])
+	return gs.cv_results_['mean_test_score']
+
+
+def run(model, grid, X, y, rows, cache=None, get_key=None, path_param=None):
+	candidates = list(ParameterGrid(grid))
+	with warnings.catch_warnings():
+		warnings.simplefilter('ignore')
+		return fun.GS_Scores(model, [(j, candidates) for j in rows], X, y,
+			rows.get, 'roc_auc', 3, 1, cache, get_key, path_param)
+
+
+def test_scores_match_gridsearchcv(data):
+	X, y, rows = data
+	model = LogisticRegression(solver='liblinear')
+	grid = {'C': [0.01, 1, 10], 'penalty': ['l1', 'l2']}
+	gs_results = run(model, grid, X, y, rows)
+	for j in rows:
+		expected = sklearn_scores(model, grid, X, y, rows[j], 'roc_auc', 3)
+		np.testing.assert_allclose(
+			gs_results[gs_results['rep'] == j]['mean_test_score'], expected)
+
+
+def test_failed_fits_score_nan(data):
+	X, y, rows = data
+	# lbfgs does not support l1: those fits fail, as in GridSearchCV
+	model = LogisticRegression(solver='lbfgs')
+	grid = {'C': [1], 'penalty': ['l1', 'l2']}
+	gs_results = run(model, grid, X, y, rows)
+	expected = sklearn_scores(model, grid, X, y, rows[0], 'roc_auc', 3)
+	np.testing.assert_allclose(
+		gs_results[gs_results['rep'] == 0]['mean_test_score'], expected)
+	assert np.isnan(expected[0])
+
+
+def test_warm_start_path_matches_cold_fits(data):
+	X, y, rows = data
+	model = RandomForestClassifier(random_state=0)
+	grid = {'n_estimators': [5, 10, 20], 'max_depth': [2, 4]}
+	gs_results = run(model, grid, X, y, rows, path_param='n_estimators')
+	for j in rows:
+		expected = sklearn_scores(model, grid, X, y, rows[j], 'roc_auc', 3)
+		np.testing.assert_allclose(
+			gs_results[gs_results['rep'] == j]['mean_test_score'], expected)
+
+
+def test_warm_start_gb_path_matches_cold_fits(data):
+	X, y, rows = data
+	# The GB grid's max_features values (random feature subsets per split)
+	# and default subsample, with the model seeded
+	model = GradientBoostingClassifier(random_state=0)
+	grid = {'n_estimators': [5, 10, 20], 'learning_rate': [0.1, 1],
+		'max_features': [0.5, 'sqrt', None]}
+	gs_results = run(model, grid, X, y, rows, path_param='n_estimators')
+	for j in rows:
+		expected = sklearn_scores(model, grid, X, y, rows[j], 'roc_auc', 3)
+		np.testing.assert_allclose(
+			gs_results[gs_results['rep'] == j]['mean_test_score'], expected)
+
+
+def test_cache_reuses_fold_scores(data, tmp_path, monkeypatch):
+	X, y, rows = data
+	model = LogisticRegression(solver='lbfgs')
+	grid = {'C': [0.1, 1], 'penalty': ['l1', 'l2']}
+	cache = fun.GS_Cache_Open(str(tmp_path / 'gs.db'))
+
+	def get_key(j):
+		return ('data', 'features', 'logreg', 'roc_auc', 3, 'seed=0,rep=%i' % j)
+
+	first = run(model, grid, X, y, rows, cache, get_key)
+	n_rows = cache.execute('SELECT COUNT(*) FROM gs_scores').fetchone()[0]
+	assert n_rows == len(rows) * 4 * 3
+
+	# Every fold score (including the NaN of the failed fits) is cached
+	def no_fit(*args, **kwargs):
+		raise AssertionError('cached fold was fit again')
+	monkeypatch.setattr(fun, 'GS_Fold_Score', no_fit)
+	second = run(model, grid, X, y, rows, cache, get_key)
+	np.testing.assert_array_equal(first['mean_test_score'],
+		second['mean_test_score'])
+	assert list(first['rep']) == list(second['rep'])
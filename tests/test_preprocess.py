@@ -0,0 +1,105 @@
+""" The chunked ML_preprocess.py passes (Preprocess_Scan, Preprocess_Apply)
+against the same steps done with pandas on the whole dataframe """
+import numpy as np
+import pandas as pd
+import pytest
+
+from ML_functions import fun
+
+NA_TOKENS = ['?', 'NA', 'na', 'n/a', '', '.']
+
+
+@pytest.fixture
+def path(tmp_path):
+	rng = np.random.RandomState(0)
+	n = 60
+	lines = ['ID\tClass\tx\tk\tb\tcolor\tm']
+	for i in range(n):
+		x = '%.3f' % rng.randn() if rng.rand() > 0.2 else rng.choice(NA_TOKENS)
+		b = str(rng.randint(2)) if i % 7 else 'NA'
+		color = rng.choice(['red', 'blue', 'green']) if i % 5 else '?'
+		# m is numeric in the first chunks and text as a whole
+		m = str(rng.randint(3)) if i < 45 else rng.choice(['1', 'z'])
+		lines.append('%s\t%s\t%s\t%i\t%s\t%s\t%s' % ('%03d' % i,
+			rng.choice(['pos', 'neg']), x, rng.randint(100), b, color, m))
+	p = tmp_path / 'df.txt'
+	p.write_text('\n'.join(lines) + '\n')
+	return str(p)
+
+
+def make_plan(stats, onehot):
+	""" The plan ML_preprocess.py makes from the scan for -na_method median
+	and one-hot encoding of the string columns """
+	kind = stats['kind']
+	features = [c for c in stats['columns'] if c != 'Class']
+	fill = {}
+	for c in features:
+		if kind[c] == 'O':
+			counts = stats['counts'][c]
+			top = max(counts.values())
+			fill[c] = min(v for v, k in counts.items() if k == top)
+		else:
+			fill[c] = fun.Sketch_Median(stats['sketch'].get(c))
+	cats = {}
+	if onehot:
+		cats = {c: sorted(set(stats['counts'][c]) | {fill[c]})
+			for c in features if kind[c] == 'O'}
+	return {'na_tokens': NA_TOKENS, 'y_name': 'Class', 'dtype': 'float64',
+		'drop': [], 'fill': fill, 'onehot': cats, 'binary': [],
+		'sparse': False, 'keep': None, 'drop_cols': [], 'kinds': kind}
+
+
+def read_chunks(path, plan, chunk):
+	dtypes = {c: {'O': str, 'b': bool, 'i': 'int64', 'f': 'float64'}[k]
+		for c, k in plan['kinds'].items()}
+	parts, classes = [], []
+	for df in pd.read_csv(path, sep='\t', index_col=0, chunksize=chunk,
+		dtype=dtypes, na_values=NA_TOKENS):
+		df_classes, df = fun.Preprocess_Apply(df, plan)
+		parts.append(df)
+		classes.append(df_classes)
+	return pd.concat(classes), pd.concat(parts)
+
+
+def pandas_reference(path, onehot):
+	df = pd.read_csv(path, sep='\t', index_col=0, na_values=NA_TOKENS)
+	y = df.pop('Class')
+	text = [c for c in df.columns if df[c].dtype.kind == 'O']
+	numeric = [c for c in df.columns if c not in text]
+	df[numeric] = df[numeric].fillna(df[numeric].median())
+	df[text] = df[text].fillna(df[text].mode().iloc[0])
+	if onehot:
+		df = pd.get_dummies(df, columns=text)
+	return y, df
+
+
+def test_scan_matches_pandas(path):
+	stats = fun.Preprocess_Scan(path, na_tokens=NA_TOKENS, chunk=20)
+	df = pd.read_csv(path, sep='\t', index_col=0, na_values=NA_TOKENS)
+	assert stats['n'] == len(df)
+	assert stats['kind'] == {c: 'i' if d.kind == 'u' else d.kind
+		for c, d in zip(df.columns, df.dtypes)}
+	assert stats['kind']['m'] == 'O'
+	assert all(stats['na'][c] == v for c, v in df.isna().sum().items())
+	for c in ['x', 'k', 'b']:
+		assert stats['sum'][c] == pytest.approx(df[c].sum())
+		assert fun.Sketch_Median(stats['sketch'][c]) == df[c].median()
+	for c in ['color', 'm']:
+		assert dict(stats['counts'][c]) == df[c].value_counts().to_dict()
+
+
+@pytest.mark.parametrize('onehot', [False, True])
+@pytest.mark.parametrize('chunk', [7, 20, 1000])
+def test_chunks_match_pandas(path, onehot, chunk):
+	stats = fun.Preprocess_Scan(path, na_tokens=NA_TOKENS, chunk=chunk)
+	y, df = read_chunks(path, make_plan(stats, onehot), chunk)
+	y_ref, df_ref = pandas_reference(path, onehot)
+	pd.testing.assert_series_equal(y, y_ref)
+	assert list(df.columns) == list(df_ref.columns)
+	assert list(df.index) == list(df_ref.index)
+	for c in df.columns:
+		if df[c].dtype.kind == 'O':
+			assert list(df[c]) == list(df_ref[c])
+		else:
+			np.testing.assert_allclose(df[c].astype(float),
+				df_ref[c].astype(float))
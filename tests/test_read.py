@@ -0,0 +1,49 @@
+""" Read_Parallel against pd.read_csv of the whole file """
+import numpy as np
+import pandas as pd
+import pytest
+
+from ML_functions import fun
+
+
+def write(tmp_path, header, rows):
+	p = tmp_path / 'df.txt'
+	p.write_text('\n'.join(['\t'.join(header)] + ['\t'.join(r) for r in rows])
+		+ '\n')
+	return str(p)
+
+
+def check(path, na_values=None):
+	expected = pd.read_csv(path, sep='\t', index_col=0, na_values=na_values)
+	# Small blocks, so the file is split into many byte ranges
+	for block in [64, 500, 1 << 26]:
+		df = fun.Read_Parallel(path, n_jobs=2, na_values=na_values,
+			block=block)
+		pd.testing.assert_frame_equal(df, expected)
+	return df
+
+
+def test_numeric(tmp_path):
+	rng = np.random.RandomState(0)
+	rows = [['g%i' % i, str(rng.randint(2)), '%.4f' % rng.randn(),
+		str(rng.randint(100))] for i in range(200)]
+	check(write(tmp_path, ['ID', 'Class', 'a', 'b'], rows))
+
+
+def test_leading_zero_ids_mixed_with_text(tmp_path):
+	# The first ranges only hold numeric IDs, the last ones text IDs
+	rows = [['%03d' % i, str(i % 2), str(i)] for i in range(150)] + \
+		[['x%i' % i, str(i % 2), str(i)] for i in range(50)]
+	df = check(write(tmp_path, ['ID', 'Class', 'a'], rows))
+	assert df.index[7] == '007'
+
+
+def test_mixed_columns_and_na_tokens(tmp_path):
+	# b is int then float, c is numeric then text, d has NA tokens
+	rows = [[str(i), str(i % 3), str(i) if i < 100 else '%i.5' % i,
+		str(i) if i < 150 else 'v%i' % i, '?' if i % 9 == 0 else str(i)]
+		for i in range(200)]
+	path = write(tmp_path, ['ID', 'Class', 'b', 'c', 'd'], rows)
+	df = check(path, ['?'])
+	assert df['b'].dtype.kind == 'f'
+	assert df['d'].isna().sum() == 23
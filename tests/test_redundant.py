@@ -0,0 +1,117 @@
+""" Redundant_Fit against pandas on the same columns """
+import numpy as np
+import pandas as pd
+import pytest
+
+from ML_functions import fun
+
+
+@pytest.fixture
+def path(tmp_path):
+	rng = np.random.RandomState(0)
+	n = 50
+	df = pd.DataFrame({'Class': rng.randint(2, size=n).astype(float)},
+		index=['g%i' % i for i in range(n)])
+	df['a'] = rng.randn(n)
+	df['const'] = 1.0
+	df['near'] = np.where(np.arange(n) < 48, 0.0, 1.0)
+	df['dup_a'] = df['a']
+	df['b'] = np.where(rng.rand(n) < 0.2, np.nan, rng.randn(n))
+	df['dup_b'] = df['b']
+	# zero has -0.0 where dup_zero has 0.0
+	df['zero'] = np.where(np.arange(n) % 3 == 0, -0.0, rng.randn(n))
+	df['dup_zero'] = df['zero'] + 0.0
+	df['all_na'] = np.nan
+	p = tmp_path / 'df.txt'
+	df.to_csv(p, sep='\t')
+	return str(p)
+
+
+def pandas_reference(df, near_constant):
+	X = df.drop('Class', axis=1)
+	removed = {}
+	for c in X.columns:
+		counts = X[c].value_counts()
+		if len(counts) <= 1:
+			removed[c] = ('constant', '')
+		elif counts.iloc[0] > near_constant * X[c].notna().sum():
+			removed[c] = ('near_constant', '')
+	rest = X[[c for c in X.columns if c not in removed]] + 0.0
+	for j, c in enumerate(rest.columns):
+		for k in rest.columns[:j]:
+			if k not in removed and rest[c].equals(rest[k]):
+				removed[c] = ('duplicate', k)
+				break
+	return removed
+
+
+def frames(path):
+	""" The same data parsed by pandas, loaded from the binary cache and as
+	one float64 block (the last two can have read-only values) """
+	yield pd.read_csv(path, sep='\t', index_col=0)
+	fun.Cache_Build(path)
+	yield fun.Read_DF(path)
+	df = pd.read_csv(path, sep='\t', index_col=0)
+	yield pd.DataFrame(np.asfortranarray(df.values), index=df.index,
+		columns=df.columns)
+
+
+@pytest.mark.parametrize('near_constant', [1.0, 0.9])
+@pytest.mark.parametrize('chunk', [2, 1000])
+def test_redundant_matches_pandas(path, near_constant, chunk):
+	for df in frames(path):
+		removed = fun.Redundant_Fit(df, 'Class', near_constant, True, chunk)
+		assert removed == pandas_reference(df, near_constant)
+		assert removed['dup_zero'] == ('duplicate', 'zero')
+
+
+@pytest.fixture
+def corr_path(tmp_path):
+	rng = np.random.RandomState(1)
+	n, p = 80, 12
+	X = rng.randn(n, p)
+	X[:, 3] = X[:, 0] + 0.1 * rng.randn(n)
+	X[:, 7] = -X[:, 3] + 0.05 * rng.randn(n)
+	X[:, 9] = X[:, 5] + 0.3 * rng.randn(n)
+	X[rng.rand(n, p) < 0.05] = np.nan
+	df = pd.DataFrame(X, columns=['f%i' % i for i in range(p)],
+		index=['g%i' % i for i in range(n)])
+	df.insert(0, 'Class', (X[:, 0] + rng.randn(n) > 0).astype(float))
+	path = tmp_path / 'corr.txt'
+	df.to_csv(path, sep='\t')
+	return str(path)
+
+
+def test_univariate_score_matches_sklearn(corr_path):
+	from sklearn.feature_selection import f_classif
+	for df in frames(corr_path):
+		X = df.drop('Class', axis=1)
+		X = X.fillna(X.mean())
+		score = fun.Univariate_Score(df, df['Class'], 'c', chunk=5)
+		np.testing.assert_allclose(score.values, f_classif(X, df['Class'])[0])
+		score = fun.Univariate_Score(df, df['Class'], 'r', chunk=5)
+		np.testing.assert_allclose(score.values,
+			X.corrwith(df['Class']).abs().values)
+
+
+@pytest.mark.parametrize('threshold', [0.5, 0.9])
+@pytest.mark.parametrize('block', [3, 2000])
+def test_corr_prune_matches_greedy_pandas(corr_path, tmp_path, threshold,
+	block):
+	for df in frames(corr_path):
+		X = df.drop('Class', axis=1)
+		R = X.fillna(X.mean()).corr().abs().values
+		order = np.argsort(-fun.Univariate_Score(df, df['Class']).values,
+			kind='stable')
+		expected, kept = {}, []
+		for k in order:
+			hit = [j for j in kept if R[k, j] > threshold]
+			if hit:
+				expected[X.columns[k]] = ('correlated',
+					X.columns[max(hit, key=lambda j: R[k, j])])
+			else:
+				kept.append(k)
+		removed = fun.Corr_Prune(df, threshold, order, 'Class', block,
+			str(tmp_path))
+		assert {c: r for c, (r, k) in removed.items()} == {c: r for c, (r, k)
+			in expected.items()}
@@ -0,0 +1,28 @@
+""" The results ledger against the legacy RESULTS.txt/RESULTS_reg.txt """
+import sqlite3
+
+import pytest
+
+from ML_functions import fun
+
+HEADER = 'DateTime\tRunTime\tID\tTag\tAlg\tAUCROC_val'
+
+
+@pytest.mark.parametrize('kind', ['c', 'r'])
+def test_appended_table_matches_export(tmp_path, kind):
+	db, txt = str(tmp_path / 'RESULTS.db'), str(tmp_path / 'RESULTS.txt')
+	for i, alg in enumerate(['RF', 'SVM', 'RF']):
+		line = '2026-01-0%i\t%i.5\trun%i\ttag\t%s\t0.%i' % (i + 1, i, i, alg,
+			i + 5)
+		fun.Ledger_Add(db, kind, HEADER, line)
+		fun.Results_Append(txt, kind, HEADER, line)
+	fun.Ledger_Export(db, kind, str(tmp_path / 'export.txt'))
+	with open(txt) as f, open(str(tmp_path / 'export.txt')) as g:
+		assert f.read() == g.read()
+
+
+def test_ledger_uses_rollback_journal(tmp_path):
+	db = str(tmp_path / 'RESULTS.db')
+	fun.Ledger_Add(db, 'c', HEADER, '2026-01-01\t1\trun\ttag\tRF\t0.5')
+	mode = sqlite3.connect(db).execute('PRAGMA journal_mode').fetchone()[0]
+	assert mode == 'delete'
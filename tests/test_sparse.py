@@ -0,0 +1,40 @@
+""" The -sparse features against the same dense dataframe """
+import numpy as np
+import pandas as pd
+import pytest
+
+from ML_functions import fun
+
+
+@pytest.fixture
+def df():
+	rng = np.random.RandomState(0)
+	X = rng.rand(40, 9)
+	X[X < 0.8] = 0
+	X[rng.rand(40, 9) < 0.03] = np.nan
+	df = pd.DataFrame(X, columns=['f%i' % i for i in range(9)],
+		index=['g%i' % i for i in range(40)])
+	df.insert(0, 'Class', rng.choice(['pos', 'neg'], 40))
+	df.loc[df.index[3], 'Class'] = np.nan
+	return df
+
+
+@pytest.mark.parametrize('dtype', ['float64', 'float32'])
+def test_to_sparse_keeps_values(df, dtype):
+	sp = fun.To_Sparse(df, dtype, chunk=4)
+	assert list(sp.columns) == list(df.columns)
+	assert fun.Is_Sparse(sp)
+	dense = fun.Dense_Features(sp, 'test')
+	pd.testing.assert_frame_equal(dense, df.astype({c: dtype
+		for c in df.columns[1:]}))
+
+
+@pytest.mark.parametrize('chunk', [2, 1000])
+def test_na_mask_matches_pandas(df, chunk):
+	for frame in [df, fun.To_Sparse(df, chunk=4)]:
+		rows, cols = fun.NA_Mask(frame, chunk)
+		dense = df.isna()
+		np.testing.assert_array_equal(rows, dense.any(axis=1).values)
+		assert cols == list(df.columns[dense.any(axis=0)])
+		pd.testing.assert_frame_equal(fun.Dense_Features(frame[~rows], 'test'),
+			df.dropna(axis=0))
@@ -0,0 +1,39 @@
+""" Threshold_Sweep against the per-threshold loop it replaced """
+import numpy as np
+import pytest
+from sklearn.metrics import confusion_matrix, f1_score, matthews_corrcoef
+
+from ML_functions import fun
+
+
+def loop_counts(y, scores, threshold, strict):
+	pred = scores > threshold if strict else scores >= threshold
+	TN, FP, FN, TP = confusion_matrix(y, pred, labels=[False, True]).ravel()
+	return TP, TN, FP, FN, pred
+
+
+@pytest.mark.parametrize('strict', [False, True])
+@pytest.mark.parametrize('grid', ['0.01', 'exact'])
+def test_sweep_matches_loop(strict, grid):
+	rng = np.random.RandomState(0)
+	y = rng.rand(200) < 0.4
+	# Rounded scores, so many instances share a score (ties at thresholds)
+	scores = np.round(np.clip(0.3 * y + rng.rand(200) * 0.7, 0, 1), 2)
+
+	sweep = fun.Threshold_Sweep(y, scores, fun.Threshold_Grid(grid), strict)
+	for i, threshold in enumerate(sweep['threshold']):
+		TP, TN, FP, FN, pred = loop_counts(y, scores, threshold, strict)
+		assert (sweep['TP'][i], sweep['TN'][i], sweep['FP'][i],
+			sweep['FN'][i]) == (TP, TN, FP, FN)
+		assert sweep['F1'][i] == pytest.approx(f1_score(y, pred))
+		if TP + FP > 0 and TN + FN > 0:
+			assert sweep['MCC'][i] == pytest.approx(matthews_corrcoef(y, pred))
+
+
+def test_exact_thresholds_are_score_breakpoints():
+	y = np.array([1, 0, 1, 1, 0, 0])
+	scores = np.array([0.9, 0.1, 0.5, 0.5, 0.7, 0.1])
+	sweep = fun.Threshold_Sweep(y, scores)
+	assert list(sweep['threshold']) == [0.1, 0.5, 0.7, 0.9]
+	assert list(sweep['TP']) == [3, 3, 1, 1]
+	assert list(sweep['FP']) == [3, 1, 1, 0]